@@ -0,0 +1,246 @@
+"""Measure how fast ml_brasil fetches, parses and extracts products.
+
+Every benchmark runs on synthetic pages built by the Simulator, so the
+numbers don't depend on MercadoLivre, and are saved as a JSON file, so
+that the runs before and after a change can be compared:
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --output after.json --compare before.json
+
+The benchmarks are:
+
+- parse: building the html tree of the products in the search pages.
+- extract: reading every field of each product from its tag.
+- products: get_all_products, without checking the reputation.
+- records: the same, keeping compact ProductRecord objects.
+- query: a whole ML_query, reputation included, on a local Simulator.
+- filter: selecting the products by price and flags from the records,
+  and sorting them by price, in Python.
+- resultset: the same, on a ResultSet, if numpy is installed.
+- import: importing ml_brasil in a new interpreter.
+- startup: importing ml_brasil and everything the first search needs,
+  its modules, dependencies and the categories, in a new interpreter.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ml_brasil  # noqa: E402
+from ml_brasil import parse  # noqa: E402
+from ml_brasil.simulator import Simulator  # noqa: E402
+
+
+def timed(function, repeat):
+    """Call function repeat times, and return the seconds of each call."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return times
+
+
+def search_pages(products):
+    """Build the search pages of a search with that many products."""
+    simulator = Simulator(results=products, max_depth=products)
+    try:
+        return [simulator.search_page("lista.mercadolivre.com.br",
+                                      f"/benchmark_Desde_{index}")
+                for index in range(1, products + 1, parse.RESULTS_PER_PAGE)]
+    finally:
+        simulator.stop()
+
+
+def bench_parse(pages, repeat):
+    """Time building the trees of the product tags of the pages."""
+    def run():
+        for page in pages:
+            parse._parse_only(page, parse.RESULT_CLASS, "li")
+    return timed(run, repeat)
+
+
+def bench_extract(pages, repeat):
+    """Time reading the fields of every product tag of the pages."""
+    tags = [tag for page in pages
+            for tag in parse._parse_only(page, parse.RESULT_CLASS, "li")
+            .find_all("li", recursive=False)]
+
+    def run():
+        for tag in tags:
+            parse._extract_fields(tag)
+    return timed(run, repeat)
+
+
+def bench_products(pages, repeat, records=False):
+    """Time get_all_products on the pages, without the reputation."""
+    return timed(lambda: parse.get_all_products(
+        pages, check_rep=False, records=records), repeat)
+
+
+def select(records):
+    """Select and sort the records as the filter benchmark does."""
+    return sorted((record for record in records
+                   if record.price_cents is not None
+                   and 10_000 <= record.price_cents < 500_100
+                   and record.free_shipping and not record.in_sale),
+                  key=lambda record: (-record.no_interest,
+                                      record.price_cents))
+
+
+def bench_filter(records, repeat):
+    """Time selecting and sorting the records in Python."""
+    return timed(lambda: select(records), repeat)
+
+
+def bench_resultset(records, repeat):
+    """Time selecting and sorting the records on a ResultSet."""
+    from ml_brasil.resultset import ResultSet
+    results = ResultSet.from_products(records)
+    return timed(lambda: results[results.mask(
+        price_min=100, price_max=5000, free_shipping=True, in_sale=False)]
+        .sort("-no_interest", "price"), repeat)
+
+
+def bench_query(products, repeat, workers, latency):
+    """Time a whole ML_query on a Simulator with that many products."""
+    with Simulator(results=products, latency=latency) as simulator:
+        def run():
+            with simulator.transport(pool_size=workers) as transport:
+                ml_brasil.ML_query("benchmark", aggressiveness=10,
+                                   workers=workers, transport=transport)
+        return timed(run, repeat)
+
+
+def in_new_interpreter(code, repeat):
+    """Run code in repeat new interpreters, and return what each printed."""
+    return [float(subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                                 capture_output=True, text=True,
+                                 check=True).stdout)
+            for _ in range(repeat)]
+
+
+def bench_import(repeat):
+    """Time importing ml_brasil, each time in a new interpreter."""
+    return in_new_interpreter(
+        "from time import perf_counter; start = perf_counter(); "
+        "import ml_brasil; print(perf_counter() - start)", repeat)
+
+
+def bench_startup(repeat):
+    """Time getting ready for the first search, in a new interpreter."""
+    return in_new_interpreter(
+        "from time import perf_counter; start = perf_counter(); "
+        "import ml_brasil; ml_brasil.ML_query; "
+        "ml_brasil.parse.get_cat('0.0'); ml_brasil.parse._parser(); "
+        "print(perf_counter() - start)", repeat)
+
+
+def summary(times, items=None):
+    """Summarize the times of a benchmark for the JSON file."""
+    result = {"best": min(times), "mean": sum(times) / len(times),
+              "times": times}
+    if items:
+        result["items"] = items
+        result["per_item_us"] = min(times) / items * 1e6
+    return result
+
+
+def commit():
+    """Return the git commit of the tree being measured, if any."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print how each benchmark changed from a baseline run."""
+    print(f"\n{'benchmark':<10} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        ratio = result["best"] / before["best"]
+        print(f"{name:<10} {before['best']:>10.4f} {result['best']:>10.4f} "
+              f"{ratio:>6.2f}x")
+
+
+def main():
+    """Run the benchmarks chosen in the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000,
+                        help="products in the synthetic search pages")
+    parser.add_argument("--query-products", type=int, default=500,
+                        help="products of the search made by ML_query")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="workers of the search made by ML_query")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="seconds the Simulator takes to respond")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="benchmarks to run")
+    parser.add_argument("--output", help="where to save the JSON results")
+    parser.add_argument("--compare", help="a previous JSON to compare to")
+    args = parser.parse_args()
+
+    pages = search_pages(args.products)
+    records = []
+    if args.only is None or {"filter", "resultset"} & set(args.only):
+        records = parse.get_all_products(pages, check_rep=False,
+                                         records=True)
+    benchmarks = {
+        "parse": lambda: summary(bench_parse(pages, args.repeat),
+                                 len(pages)),
+        "extract": lambda: summary(bench_extract(pages, args.repeat),
+                                   args.products),
+        "products": lambda: summary(bench_products(pages, args.repeat),
+                                    args.products),
+        "records": lambda: summary(bench_products(pages, args.repeat, True),
+                                   args.products),
+        "filter": lambda: summary(bench_filter(records, args.repeat),
+                                  args.products),
+        "query": lambda: summary(bench_query(
+            args.query_products, args.repeat, args.workers, args.latency),
+            args.query_products),
+        "import": lambda: summary(bench_import(max(args.repeat, 5))),
+        "startup": lambda: summary(bench_startup(max(args.repeat, 5))),
+    }
+    if find_spec("numpy") is not None:
+        benchmarks["resultset"] = lambda: summary(
+            bench_resultset(records, args.repeat), args.products)
+    results = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parser": parse._parser(),
+        "arguments": vars(args),
+        "benchmarks": {},
+    }
+    for name, bench in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        results["benchmarks"][name] = result = bench()
+        print(f"{name:<10} best {result['best']:.4f}s  "
+              f"mean {result['mean']:.4f}s")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
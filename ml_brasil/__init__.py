@@ -4,7 +4,33 @@ This package is able to perform searches in MercadoLivre Brasil and re-
 turn lists with items which represent product listings with detailed,
 compact and relevant information that cannot be automatically collected
 through regular searches on MercadoLivre Brasil's website.
+
+The modules of the package, and the dependencies they need, such as
+requests, BeautifulSoup, aiohttp and numpy, are imported only when first used,
+so that importing the package is fast.
 """
-from ml_brasil import search
-from ml_brasil import parse
-ML_query = search.ML_query
+from importlib import import_module
+
+_MODULES = ("search", "parse", "ratelimit", "asyncsearch", "cache",
+            "transport", "simulator", "stats", "metrics", "categories",
+            "delta", "resultset")
+
+_FUNCTIONS = {"ML_query": "search", "ML_query_iter": "search",
+              "ML_query_many": "search", "ML_query_delta": "delta",
+              "async_ML_query": "asyncsearch"}
+
+
+def __getattr__(name):
+    """Import the module, or the module of the function, name."""
+    if name in _MODULES:
+        return import_module(f".{name}", __name__)
+    if name in _FUNCTIONS:
+        function = getattr(import_module(f".{_FUNCTIONS[name]}", __name__),
+                           name)
+        globals()[name] = function
+        return function
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted({*globals(), *_MODULES, *_FUNCTIONS})
@@ -0,0 +1,300 @@
+"""Asynchronous searches on MercadoLivre.
+
+This module mirrors the search interface of the package for programs
+that run an asyncio event loop. Through async_ML_query, many searches
+can share one event loop, with the search pages and the product pages
+being requested concurrently, all of them paced by the LIMITER of the
+parse module.
+
+The requests are made with aiohttp, which needs to be installed for
+this module to be used.
+"""
+from asyncio import ensure_future, gather, to_thread
+from codecs import getincrementaldecoder
+from time import monotonic
+from urllib.parse import urlsplit
+from . import metrics
+from . import parse
+from .ratelimit import THROTTLED
+from .search import _price_key
+from .transport import CONNECT_TIMEOUT, READ_TIMEOUT
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def _new_session():
+    """Open a new aiohttp session, if aiohttp is installed."""
+    if aiohttp is None:
+        raise ImportError("The asynchronous searches require the aiohttp "
+                          "package. Install it with 'pip install aiohttp'.")
+    return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(
+        sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT))
+
+
+async def async_ML_query(search_term, order=1,
+                         min_rep=3, category='0.0',
+                         price_min=0, price_max=parse.INT32_MAX,
+                         condition=0, aggressiveness=3, process=True,
+                         cache=None, session=None):
+    """Call for the search and return ordered results, asynchronously.
+
+    The coroutine version of ML_query. The reputation of the products
+    of each page starts to be checked as soon as the page arrives, while
+    the next pages of the search are still being requested.
+
+    Parameters
+    ----------
+    search_term
+        The search term. Trailing and leading spaces are stripped.
+    order
+        The order by which the results must be sorted. Lower price (1),
+        higher price (2), or 'relevance' (0) - MercadoLivre's default.
+    min_rep
+        The reputation level threshold that a seller has to reach for
+        them to be considered reputable.
+    category
+        The category number for the desired category for the products.
+    price_min
+        The minimum price of a listing for it to be included in the
+        results. Always a non-negative integer, lower than price_max.
+    price_max
+        The maximum price of a listing for it to be included in the
+        results. Always a non-negative integer, higher than price_min.
+    condition
+        Whether the product listings should to be new (1), used (2)
+        or either (0).
+    aggressiveness
+        The level of aggressiveness (speed) that the function will do
+        html requests. The higher its value, the shorter the delay be-
+        tween requests. It sets where the pace of the requests to each
+        host starts, and how high it may adapt to, in parse.LIMITER.
+    process
+        Whether all products returned will be processed completely be-
+        fore returning the list of products. If False, the reputation
+        is checked synchronously the first time it is accessed.
+    cache
+        A ReputationCache in which the reputation of the sellers is
+        looked up before their product pages are requested, and stored
+        after. If None, nothing is cached.
+    session
+        The aiohttp.ClientSession used for the requests. If None, a new
+        session is opened for the search and closed at the end of it.
+
+    Returns
+    -------
+    parse.ProductList
+        A list of which each element is a Product object, ordered as per
+        the 'order' argument. A listing found more than once is kept
+        only the first time.
+
+    """
+    search_term = search_term.strip()
+    if len(search_term) < 2:
+        return parse.ProductList()
+
+    own_session = session is None
+    if own_session:
+        session = _new_session()
+    products, checks, seen = parse.ProductList(), [], set()
+    try:
+        async for page in _iter_search_pages(session, search_term, category,
+                                             price_min, price_max, condition,
+                                             aggressiveness):
+            # parsed in a thread, not to hold up the loop meanwhile
+            page_products = await to_thread(
+                parse.get_all_products, [page], min_rep=min_rep,
+                process=process, aggressiveness=aggressiveness,
+                check_rep=False, cache=cache)
+            page_products = [product for product in page_products
+                             if parse._unseen(product.item_id, seen)]
+            if process:
+                # the checks start now, while the next page is requested
+                checks.extend(ensure_future(async_is_reputable(product,
+                                                               session))
+                              for product in page_products)
+            products.extend(page_products)
+        await gather(*checks)
+    except BaseException:
+        for check in checks:
+            check.cancel()
+        await gather(*checks, return_exceptions=True)
+        raise
+    finally:
+        if own_session:
+            await session.close()
+
+    if order:
+        products.sort(key=_price_key(order))
+    return products
+
+
+async def async_get_search_pages(term, cat='0.0',
+                                 price_min=0, price_max=parse.INT32_MAX,
+                                 condition=0, aggressiveness=3, session=None):
+    """Search in MercadoLivre with the specified arguments, asynchronously.
+
+    The coroutine version of get_search_pages. Please refer to the do-
+    cumentation of that function for the meaning of the arguments.
+
+    Parameters
+    ----------
+    session
+        The aiohttp.ClientSession used for the requests. If None, a new
+        session is opened for the search and closed at the end of it.
+
+    Returns
+    -------
+    list[str]
+        A list of which each element is a raw html strings of the search
+        result pages.
+
+    """
+    own_session = session is None
+    if own_session:
+        session = _new_session()
+    try:
+        return [page async for page in _iter_search_pages(
+            session, term, cat, price_min, price_max, condition,
+            aggressiveness)]
+    finally:
+        if own_session:
+            await session.close()
+
+
+async def async_is_reputable(product, session):
+    """Verify wether the seller of the product is reputable, asynchronously.
+
+    The coroutine version of Product._is_reputable, which also uses the
+    cache of the Product class. The result is stored in the product, so
+    that it doesn't need to be checked again.
+
+    Parameters
+    ----------
+    product
+        The Product whose seller's reputation is checked.
+    session
+        The aiohttp.ClientSession used for the request.
+
+    Returns
+    -------
+    bool
+        True if the listing has the minimum reputation required or is
+        one of the exceptional cases, False otherwise.
+
+    """
+    reputable = True
+    if product.min_rep > 0:
+        reputable = False
+        if product.link:
+            cache, key = product.cache, product._cache_key()
+            rank = cache.get(key) if cache is not None else None
+            if rank is None:
+                async with await _request(session, product.link,
+                                          product.aggressiveness) as response:
+                    rank = await _stream_seller_rank(response,
+                                                     product.min_rep)
+                    received = response.status == 200
+                if cache is not None and received:
+                    cache.set(key, rank)
+            reputable = rank >= product.min_rep
+        if metrics.ENABLED:
+            metrics.REPUTATION_CHECKS.inc("passed" if reputable else "failed")
+    elif metrics.ENABLED:
+        metrics.REPUTATION_CHECKS.inc("skipped")
+    product.reputable = reputable
+    return reputable
+
+
+async def _request(session, url, aggressiveness):
+    """Request url when the LIMITER allows, retrying if it is overloaded.
+
+    The coroutine version of parse._request, returning the aiohttp
+    response to the last attempt.
+    """
+    host = urlsplit(url).netloc
+    for attempt in range(parse.MAX_RETRIES + 1):
+        await parse.LIMITER.wait_async(host, aggressiveness)
+        start = monotonic()
+        response = await session.get(url)
+        latency = monotonic() - start
+        parse.LIMITER.feedback(host, response.status, latency,
+                               parse._retry_after(response.headers))
+        if metrics.ENABLED:
+            metrics.REQUESTS.inc(host, response.status)
+            metrics.LATENCY.observe(latency, host)
+        if response.status not in THROTTLED or attempt == parse.MAX_RETRIES:
+            return response
+        response.release()
+
+
+async def _stream_seller_rank(response, min_rep):
+    """Read the rank of the seller while the product page is received.
+
+    The coroutine version of parse._stream_seller_rank. The response is
+    closed as soon as the rank is known to reach min_rep.
+    """
+    scanner = parse._RankScanner(min_rep)
+    decoder = getincrementaldecoder(response.charset or "utf-8")(
+        errors="replace")
+    async for chunk in response.content.iter_chunked(
+            parse.STREAM_CHUNK_SIZE):
+        rank = scanner.feed(decoder.decode(chunk))
+        if rank is not None:
+            response.close()
+            return rank
+    scanner.feed(decoder.decode(b"", final=True))
+    return scanner.result()
+
+
+async def _iter_search_pages(session, term, cat, price_min, price_max,
+                             condition, aggressiveness):
+    """Yield each result page of the search as soon as it arrives.
+
+    As in parse.iter_search_pages, the pages whose position is known
+    from the number of results in the first page are all requested at
+    the same time, and only the ones beyond that are probed one by one.
+    """
+    subdomain, suffix = parse.get_cat(cat)
+
+    async def fetch(index):
+        async with await _request(session, parse._search_url(
+                subdomain, suffix, term, index,
+                price_min, price_max, condition), aggressiveness) as page:
+            if page.status == 404:
+                return None
+            if metrics.ENABLED:
+                metrics.PAGES.inc()
+            return await page.text()
+
+    if metrics.ENABLED:
+        metrics.SEARCHES.inc()
+    step = parse.RESULTS_PER_PAGE * (parse.SKIP_PAGES + 1)  # DEBUG
+    page = await fetch(1)
+    if page is None:
+        return
+    yield page
+    index = 1 + step
+    count = parse._result_count(page)
+    if count is not None:
+        indexes = range(index, min(count, parse.MAX_RESULTS) + 1, step)
+        pages = [ensure_future(fetch(index)) for index in indexes]
+        try:
+            for page in pages:
+                page = await page
+                if page is not None:
+                    yield page
+        finally:
+            for pending in pages:
+                pending.cancel()
+        if count <= parse.MAX_RESULTS or page is None:
+            return
+        index += len(indexes) * step
+    while True:
+        page = await fetch(index)
+        if page is None:
+            break
+        yield page
+        index += step
@@ -0,0 +1,435 @@
+"""Remember, between searches, what was learned from MercadoLivre.
+
+This module contains the ReputationCache, a persistent store for the
+reputation of the sellers, which is the information that costs the most
+to obtain in a search: one request for the product page of each listing.
+It also contains the ResponseCache, a store for the pages themselves,
+used by a Transport to avoid downloading again the pages of a search
+that is repeated shortly after. Both caches are kept in a local SQLite
+file, so they survive between runs and may be shared by every search
+made in the same machine.
+"""
+import os
+import sqlite3
+import zlib
+from re import compile
+from threading import Lock
+from time import time
+from urllib.parse import urlsplit
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from .transport import PRODUCT_HOSTS
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".ml_brasil",
+                            "cache.sqlite3")
+"""str: Where the cache file is kept if no other path is given"""
+
+SEARCH_PIECES = compile(r"_(?:Desde|PriceRange|ITEM\*CONDITION|OrderId|"
+                        r"NoIndex)_[^_/]+")
+"""re.Pattern: The filters of a search url, whose order doesn't matter"""
+
+
+def _connect(path):
+    """Open the SQLite file in path, creating its directory if needed."""
+    if path != ":memory:":
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False,
+                                 isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class ReputationCache:
+    """A persistent cache of the reputation rank of sellers.
+
+    Each entry maps a key, the min_rep of a search and the link for a
+    listing, to the reputation rank read from its product page, which
+    depends on the listing as well as on its seller. As the page stops
+    being read once the seller reaches min_rep, a rank is only known to
+    be exact for that min_rep. Only ranks read from pages that were re-
+    ceived are stored. Entries expire after 'ttl' seconds and, when
+    there are more than 'max_entries', the least recently used are
+    evicted. The cache can be shared by many threads.
+
+    """
+
+    _EVICT_EVERY = 256
+    """How many writes may happen between checks for the size limit."""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=7 * 24 * 60 * 60,
+                 max_entries=100_000):
+        """Open, or create, the cache stored in path.
+
+        Parameters
+        ----------
+        path
+            The path of the SQLite file. ":memory:" keeps the cache in
+            memory only, for the lifetime of the object.
+        ttl
+            For how many seconds an entry is considered valid.
+        max_entries
+            The maximum number of entries kept in the cache.
+
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._writes = 0
+        self._db = _connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS reputation ("
+                         "key TEXT PRIMARY KEY, rank INTEGER NOT NULL, "
+                         "stored REAL NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS reputation_used "
+                         "ON reputation (used)")
+
+    def get(self, key):
+        """Return the rank cached for key.
+
+        Parameters
+        ----------
+        key
+            The seller, or listing, whose rank is requested.
+
+        Returns
+        -------
+        int or None
+            The cached rank if there is a valid entry for key, None
+            otherwise.
+
+        """
+        now = time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT rank, stored FROM reputation WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl < now:
+                self._db.execute("DELETE FROM reputation WHERE key = ?",
+                                 (key,))
+                return None
+            self._db.execute("UPDATE reputation SET used = ? WHERE key = ?",
+                             (now, key))
+        return row[0]
+
+    def set(self, key, rank):
+        """Store the rank for key, replacing any previous entry.
+
+        Parameters
+        ----------
+        key
+            The seller, or listing, whose rank is stored.
+        rank
+            The reputation rank read from the product page.
+
+        """
+        now = time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO reputation "
+                             "VALUES (?, ?, ?, ?)", (key, rank, now, now))
+            self._writes += 1
+            if self._writes % self._EVICT_EVERY == 0:
+                self._evict()
+
+    def invalidate(self, key=None):
+        """Remove the entry for key, or every entry if key is None.
+
+        Parameters
+        ----------
+        key
+            The seller, or listing, whose entry is removed.
+
+        """
+        with self._lock:
+            if key is None:
+                self._db.execute("DELETE FROM reputation")
+            else:
+                self._db.execute("DELETE FROM reputation WHERE key = ?",
+                                 (key,))
+
+    def purge(self):
+        """Remove every expired entry and enforce the size limit."""
+        with self._lock:
+            self._db.execute("DELETE FROM reputation WHERE stored < ?",
+                             (time() - self.ttl,))
+            self._evict()
+
+    def close(self):
+        """Close the SQLite file. The cache can't be used afterwards."""
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        """Return the number of entries, expired or not, in the cache."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM reputation").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _evict(self):
+        """Remove the least recently used entries above max_entries."""
+        self._db.execute("DELETE FROM reputation WHERE key IN ("
+                         "SELECT key FROM reputation ORDER BY used DESC "
+                         "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+
+class ResponseCache:
+    """A persistent, compressed, cache of the pages of MercadoLivre.
+
+    Each entry maps a normalized url to the status, headers and zlib
+    compressed body of its response. Search pages and product pages are
+    considered fresh for different periods: 'search_ttl' and 'product_
+    ttl' seconds. Once an entry is stale it is kept, so that it may be
+    revalidated with the server through its ETag or Last-Modified, if
+    the response had any. When the compressed bodies add up to more than
+    'max_bytes', the least recently used entries are evicted. The cache
+    can be shared by many threads.
+
+    """
+
+    def __init__(self, path=DEFAULT_PATH, search_ttl=10 * 60,
+                 product_ttl=24 * 60 * 60, max_bytes=256 * 2**20):
+        """Open, or create, the cache stored in path.
+
+        Parameters
+        ----------
+        path
+            The path of the SQLite file. ":memory:" keeps the cache in
+            memory only, for the lifetime of the object.
+        search_ttl
+            For how many seconds a search page is considered fresh.
+        product_ttl
+            For how many seconds a product page is considered fresh.
+        max_bytes
+            The maximum size, in bytes, of the compressed bodies kept in
+            the cache.
+
+        """
+        self.search_ttl = search_ttl
+        self.product_ttl = product_ttl
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._db = _connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, status INTEGER NOT NULL, "
+                         "content_type TEXT, etag TEXT, last_modified TEXT, "
+                         "body BLOB NOT NULL, size INTEGER NOT NULL, "
+                         "expires REAL NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used "
+                         "ON responses (used)")
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(url):
+        """Return the normalized url under which a response is cached.
+
+        The query and the fragment are dropped, as MercadoLivre only uses
+        them for tracking, and so is the case of the host. The filters of
+        a search url are sorted, so that the same page has the same key
+        whatever the order in which its filters were written.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+
+        Returns
+        -------
+        str
+            The key of the url.
+
+        """
+        parts = urlsplit(url)
+        path = parts.path.rstrip("/")
+        pieces = SEARCH_PIECES.findall(path)
+        if pieces:
+            path = SEARCH_PIECES.sub("", path) + "".join(sorted(pieces))
+        return f"{parts.scheme}://{parts.netloc.lower()}{path}"
+
+    def ttl(self, url):
+        """Return for how many seconds the response for url is fresh.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+
+        Returns
+        -------
+        float
+            'product_ttl' for the product pages, 'search_ttl' otherwise.
+
+        """
+        if urlsplit(url).netloc.lower() in PRODUCT_HOSTS:
+            return self.product_ttl
+        return self.search_ttl
+
+    def lookup(self, url):
+        """Return the cached response for url, or how to revalidate it.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+
+        Returns
+        -------
+        tuple[requests.Response or None, dict]
+            The cached response, if there is a fresh one, and the condi-
+            tional headers with which a stale entry can be revalidated,
+            empty if there is no such entry.
+
+        """
+        key, now = self.key(url), time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, content_type, etag, last_modified, body, "
+                "expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, {}
+            status, content_type, etag, last_modified, body, expires = row
+            if expires <= now:
+                headers = {}
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+                return None, headers
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?",
+                             (now, key))
+        return _response(url, status, content_type, body), {}
+
+    def set(self, url, response):
+        """Store the response for url, replacing any previous entry.
+
+        The body of the response is read, if it wasn't already.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+        response
+            The requests.Response of the server.
+
+        """
+        body = zlib.compress(response.content)
+        headers, now = response.headers, time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?",
+                (self.key(url),)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key(url), response.status_code,
+                 headers.get("Content-Type"), headers.get("ETag"),
+                 headers.get("Last-Modified"), body, len(body),
+                 now + self.ttl(url), now))
+            self._size += len(body) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def revalidate(self, url):
+        """Mark the entry for url as fresh again, and return its response.
+
+        Called when the server answers a conditional request with 304.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+
+        Returns
+        -------
+        requests.Response or None
+            The cached response, or None if the entry was evicted in the
+            meantime.
+
+        """
+        key, now = self.key(url), time()
+        with self._lock:
+            self._db.execute("UPDATE responses SET expires = ?, used = ? "
+                             "WHERE key = ?", (now + self.ttl(url), now, key))
+            row = self._db.execute(
+                "SELECT status, content_type, body FROM responses "
+                "WHERE key = ?", (key,)).fetchone()
+        return None if row is None else _response(url, *row)
+
+    def invalidate(self, url=None):
+        """Remove the entry for url, or every entry if url is None.
+
+        Parameters
+        ----------
+        url
+            The url whose entry is removed.
+
+        """
+        with self._lock:
+            if url is None:
+                self._db.execute("DELETE FROM responses")
+            else:
+                self._db.execute("DELETE FROM responses WHERE key = ?",
+                                 (self.key(url),))
+            self._size = self._total_size()
+
+    def purge(self):
+        """Remove stale entries without validators and enforce the size."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE expires < ? AND "
+                             "etag IS NULL AND last_modified IS NULL",
+                             (time(),))
+            self._evict()
+
+    def close(self):
+        """Close the SQLite file. The cache can't be used afterwards."""
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        """Return the number of entries, fresh or not, in the cache."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _total_size(self):
+        """Return the size of every compressed body in the cache."""
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        """Remove the least recently used entries above max_bytes."""
+        self._db.execute("DELETE FROM responses WHERE key IN ("
+                         "SELECT key FROM (SELECT key, SUM(size) OVER "
+                         "(ORDER BY used DESC, key) AS total FROM responses) "
+                         "WHERE total > ?)", (self.max_bytes,))
+        self._size = self._total_size()
+
+
+def _response(url, status, content_type, body):
+    """Build the requests.Response for an entry of the ResponseCache."""
+    response = Response()
+    response.url = url
+    response.status_code = status
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict()
+    if content_type:
+        response.headers["Content-Type"] = content_type
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = zlib.decompress(body)
+    response._content_consumed = True
+    return response
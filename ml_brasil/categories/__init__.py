@@ -1,8 +1,202 @@
 """Information about the categories in MercadoLivre Brasil.
 
-This subpackage only exists to enable the categories.pickle pickled list
-of categories to be loaded by other files in the package.
+This subpackage keeps the categories.json list of categories, which is
+loaded by the parse module the first time a category is needed, and the
+CategoryRegistry, the index through which the categories are looked up.
 
 The file extract_categories.py should be ran only if the categories file
 is corrupted or the data in it is no longer up to date.
 """
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import islice
+from unicodedata import combining, normalize
+
+Category = namedtuple("Category", ("id", "name", "subdomain", "suffix",
+                                   "parent", "parent_name"))
+Category.__doc__ = """A category of MercadoLivre Brasil.
+
+Its 'id' is the "X.Y" string by which it is chosen in a search, X being
+the number of the parent category, 'parent', and Y its number among the
+children of the parent. 'subdomain' and 'suffix' are the pieces of the
+urls of searches in the category.
+"""
+
+
+def fold(text):
+    """Return text in lower case and without accents, for comparisons.
+
+    Parameters
+    ----------
+    text
+        Any text, such as the name of a category.
+
+    Returns
+    -------
+    str
+        The text, folded.
+
+    """
+    return "".join(char for char in normalize("NFKD", text.casefold())
+                   if not combining(char))
+
+
+class CategoryRegistry:
+    """The categories of MercadoLivre Brasil, indexed for lookups.
+
+    Built once from the list of categories in categories.json, whose
+    elements are [[number, name], [children]] for each parent category,
+    every child being a dict with its number, name, subdomain and suffix.
+    A category is then found in constant time by its "X.Y" id or by its
+    subdomain and suffix, and by the beginning of the words of its name,
+    or of the name of its parent, regardless of case and accents.
+
+    """
+
+    def __init__(self, cats):
+        """Index the categories in cats.
+
+        Parameters
+        ----------
+        cats
+            The list of categories, as stored in categories.json.
+
+        """
+        self._parents = {}
+        self._children = {}
+        self._by_id = {}
+        self._by_url = {}
+        words = set()
+        for (parent, parent_name), children in cats:
+            self._parents[parent] = parent_name
+            self._children[parent] = []
+            for child in children:
+                category = Category(f"{parent}.{child['number']}",
+                                    child["name"], child["subdomain"],
+                                    child["suffix"], parent, parent_name)
+                self._children[parent].append(category)
+                self._by_id[category.id] = category
+                self._by_url[category.subdomain, category.suffix] = category
+                words.update((word, category.id) for word in fold(
+                    f"{category.name} {parent_name}").split())
+        self._words = sorted(words)
+
+    def __getitem__(self, catid):
+        """Return the category with the "X.Y" id catid.
+
+        Raises KeyError if there is no such category, and ValueError if
+        catid isn't made of two integers.
+        """
+        parent, child = map(int, catid.split("."))
+        return self._by_id[f"{parent}.{child}"]
+
+    def get(self, catid, default=None):
+        """Return the category with the "X.Y" id catid, or default.
+
+        Parameters
+        ----------
+        catid
+            A string in the format "X.Y" where X and Y are integers.
+        default
+            What is returned if there is no such category.
+
+        Returns
+        -------
+        Category
+            The category, or default.
+
+        """
+        try:
+            return self[catid]
+        except (KeyError, ValueError):
+            return default
+
+    def find(self, subdomain, suffix):
+        """Return the category whose searches use subdomain and suffix.
+
+        Parameters
+        ----------
+        subdomain
+            The subdomain of mercadolivre.com.br of the category.
+        suffix
+            The suffix of the urls of the category.
+
+        Returns
+        -------
+        Category or None
+            The category, or None if no category uses them.
+
+        """
+        return self._by_url.get((subdomain, suffix))
+
+    def search(self, prefix):
+        """Return the categories with words beginning as those in prefix.
+
+        Every word of prefix must begin a word of the name of the
+        category, or of its parent. Case and accents are ignored.
+
+        Parameters
+        ----------
+        prefix
+            The beginning of one or more words, such as "eletro port".
+
+        Returns
+        -------
+        list[Category]
+            The categories found, in the order of their ids.
+
+        """
+        words = fold(prefix).split()
+        if not words:
+            return []
+        found = None
+        for word in words:
+            ids = set()
+            position = bisect_left(self._words, (word,))
+            for indexed, catid in islice(self._words, position, None):
+                if not indexed.startswith(word):
+                    break
+                ids.add(catid)
+            found = ids if found is None else found & ids
+        return sorted((self._by_id[catid] for catid in found),
+                      key=lambda category: tuple(map(int, category.id
+                                                     .split("."))))
+
+    def parents(self):
+        """Return the number and name of every parent category, in order.
+
+        Returns
+        -------
+        list[tuple[int, str]]
+            The parent categories.
+
+        """
+        return list(self._parents.items())
+
+    def children(self, parent):
+        """Return the categories under the parent category, in order.
+
+        Parameters
+        ----------
+        parent
+            The number of the parent category.
+
+        Returns
+        -------
+        list[Category]
+            The children of the parent, or an empty list if there is no
+            such parent.
+
+        """
+        return list(self._children.get(parent, ()))
+
+    def __contains__(self, catid):
+        return self.get(catid) is not None
+
+    def __iter__(self):
+        """Iterate over every category, in order."""
+        for children in self._children.values():
+            yield from children
+
+    def __len__(self):
+        return len(self._by_id)
@@ -1,9 +1,9 @@
-"""Extracts the categories names and codes to categories.pickle."""
+"""Extracts the categories names and codes to categories.json."""
 
 from requests import get
 from bs4 import BeautifulSoup
+import json
 import re
-import pickle
 
 match_subdomain = re.compile(r"(https://|^)(\w*)\.")
 match_suffix = re.compile(r".com.br/(.*)$")
@@ -40,5 +40,6 @@ for n1, cat_container in enumerate(master_categories, 1):
                     class_="categories__list").find_all(
                     class_="categories__subtitle"), 1)]])
 
-with open("categories.pickle", "wb") as savefile:
-    pickle.dump(categories, savefile)
+with open("categories.json", "w", encoding="utf-8") as savefile:
+    json.dump(categories, savefile, ensure_ascii=False, indent=1)
+    savefile.write("\n")
@@ -0,0 +1,218 @@
+"""Repeat a search, doing again only the work for what has changed.
+
+This module lets a search that is run again and again, such as the one
+of a price monitor, be compared to its previous run. The results of a
+run are kept in a Snapshot, saved as a JSON file, and ML_query_delta
+requests the search pages again, compares the listings in them to the
+ones of the snapshot by their item id, and checks the reputation only of
+the listings that are new or whose fields have changed:
+
+>>> delta = ML_query_delta("celular", load("celular.json"))
+>>> delta.added, delta.removed, delta.repriced
+>>> save(delta.current, "celular.json")
+"""
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from . import parse
+from .parse import ProductList, ProductRecord
+from .search import _connected
+from .stats import timer
+
+FIELDS = ("link", "title", "price_cents", "no_interest", "free_shipping",
+          "in_sale", "picture")
+"""tuple[str]: The fields of a listing compared between the runs
+
+A listing whose fields are all the same as in the previous run keeps the
+reputation it had then, without its product page being requested.
+"""
+
+PARAMETERS = ("min_rep", "category", "price_min", "price_max", "condition")
+"""tuple[str]: The arguments of a search that change its results"""
+
+Snapshot = namedtuple("Snapshot", ("search_term", "parameters", "date",
+                                   "products"))
+Snapshot.__doc__ = """The results of a run of a search.
+
+'parameters' is a dict with the arguments in PARAMETERS, 'date' the
+ISO 8601 time of the run, in UTC, and 'products' a ProductList of the
+ProductRecord of each listing, in MercadoLivre's order.
+"""
+
+Delta = namedtuple("Delta", ("added", "removed", "repriced", "changed",
+                             "current"))
+Delta.__doc__ = """What changed in a search since its previous run.
+
+'added' and 'removed' are ProductLists of the listings that are new and
+of the ones that are gone, 'repriced' a list of the (previous, current)
+records of the listings whose price changed, 'changed' a ProductList of
+the listings with any field changed, the repriced included, and
+'current' the Snapshot of this run, with every listing found.
+"""
+
+
+def _as_dict(record):
+    """Return the arguments that build record again, for JSON."""
+    return {"item_id": record.item_id, **{field: getattr(record, field)
+                                          for field in FIELDS},
+            "reputable": record.reputable}
+
+
+def save(snapshot, path):
+    """Save snapshot in path, as a JSON file.
+
+    Parameters
+    ----------
+    snapshot
+        The Snapshot of a run, such as the 'current' one of a Delta.
+    path
+        Where the file is saved. Its directory is created if needed.
+
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"search_term": snapshot.search_term,
+                   "parameters": snapshot.parameters,
+                   "date": snapshot.date,
+                   "products": [_as_dict(record)
+                                for record in snapshot.products]},
+                  file, ensure_ascii=False, indent=1)
+
+
+def load(path):
+    """Load the Snapshot saved in path.
+
+    Parameters
+    ----------
+    path
+        The JSON file written by save.
+
+    Returns
+    -------
+    Snapshot
+        The snapshot, with its products as ProductRecord objects.
+
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return Snapshot(data["search_term"], data["parameters"], data["date"],
+                    ProductList(ProductRecord(**fields)
+                                for fields in data["products"]))
+
+
+def _fields(record):
+    """Return the values of the FIELDS of record."""
+    return tuple(getattr(record, field) for field in FIELDS)
+
+
+def ML_query_delta(search_term, previous=None, min_rep=3, category='0.0',
+                   price_min=0, price_max=parse.INT32_MAX, condition=0,
+                   aggressiveness=3, workers=1, cache=None, transport=None,
+                   stats=None, shard=False):
+    """Repeat a search, checking again only what changed since previous.
+
+    Every search page is requested again, and the listings in them are
+    matched to the ones of previous by their item id. The reputation is
+    checked only for the listings that are new, or whose FIELDS changed,
+    and the others keep the reputation they had in previous. Listings
+    without an item id can't be matched, and are always new, never re-
+    moved.
+
+    Parameters
+    ----------
+    search_term
+        The search term. Trailing and leading spaces are stripped.
+    previous
+        The Snapshot of the previous run of the same search, such as the
+        one returned by load. If None, every listing is new.
+    workers
+        How many search pages, or reputation checks, may be requested at
+        the same time.
+    cache
+        A ReputationCache in which the reputation of the sellers of the
+        new and changed listings is looked up before being requested.
+    transport
+        The Transport whose connections are used by the search. If None,
+        a new Transport, with the default settings, is created for it,
+        and closed at the end.
+    stats
+        A QueryStats in which the search is recorded. If None, nothing
+        is recorded.
+    shard
+        Whether a search with more results than parse.MAX_RESULTS is
+        split in searches of parts of its price range.
+
+    Please refer to the documentation of ML_query for the meaning of
+    the other arguments.
+
+    Returns
+    -------
+    Delta
+        The added, removed, repriced and changed listings, and the new
+        Snapshot with every listing found, in MercadoLivre's order.
+
+    Raises
+    ------
+    ValueError
+        If previous is the run of a different search, or with different
+        parameters.
+
+    """
+    search_term = search_term.strip()
+    parameters = dict(zip(PARAMETERS, (min_rep, category, price_min,
+                                       price_max, condition)))
+    if previous is not None and (previous.search_term != search_term or
+                                 previous.parameters != parameters):
+        raise ValueError("The previous run is of a different search: "
+                         f"{previous.search_term!r} {previous.parameters}")
+    date = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    before = previous.products if previous is not None else ProductList()
+
+    with timer(stats, "query"), _connected(
+            transport, workers, category, min_rep > 0,
+            aggressiveness) as transport:
+        pages = parse.get_search_pages(search_term, category, price_min,
+                                       price_max, condition, aggressiveness,
+                                       transport, workers, stats, shard)
+        products = parse.get_all_products(
+            pages, min_rep, aggressiveness=aggressiveness, check_rep=False,
+            cache=cache, transport=transport, stats=stats, dedupe=True)
+
+        status, to_check = [], []
+        for product in products:
+            old = before.get(product.item_id) if product.item_id else None
+            if old is None:
+                status.append("added")
+            elif _fields(old) != _fields(ProductRecord.from_product(product)):
+                status.append("changed")
+            elif old.reputable is not None:
+                status.append(None)
+                product.reputable = old.reputable
+                continue
+            else:
+                status.append(None)
+            to_check.append(product)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            # accessing the attribute for the first time sets it
+            list(pool.map(lambda product: product.reputable, to_check))
+
+    current = ProductList(ProductRecord.from_product(product)
+                          for product in products)
+    for product in products:
+        product._html_tag.decompose()
+    found = {record.item_id for record in current if record.item_id}
+    changed = ProductList(record for record, kind in zip(current, status)
+                          if kind == "changed")
+    return Delta(ProductList(record for record, kind in zip(current, status)
+                             if kind == "added"),
+                 ProductList(record for record in before
+                             if record.item_id
+                             and record.item_id not in found),
+                 [(before.get(record.item_id), record) for record in changed
+                  if before.get(record.item_id).price_cents
+                  != record.price_cents],
+                 changed,
+                 Snapshot(search_term, parameters, date, current))
@@ -0,0 +1,275 @@
+"""Export metrics of the searches in the Prometheus text format.
+
+This module counts, for a long running process that performs many
+searches, the searches made, the search pages fetched, the products
+extracted and the reputation checks done, and records the latency of the
+requests to each host and the current state of the rate limiter. The
+metrics are exposed in the Prometheus text format by render, or over
+HTTP by serve:
+
+>>> metrics.serve(9464)  # then scrape http://127.0.0.1:9464/metrics
+
+Nothing is recorded until enable, or serve, is called. Until then, each
+place where a metric would be recorded costs a single check of ENABLED.
+"""
+from bisect import bisect_left
+from threading import Lock, Thread
+
+ENABLED = False
+"""bool: Whether the metrics are being recorded"""
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""tuple[float]: The upper bounds, in seconds, of the latency histogram"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""str: The content type of the Prometheus text format"""
+
+
+class Counter:
+    """A Prometheus counter, with an optional set of labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        """Initialize the counter at zero for every set of labels.
+
+        Parameters
+        ----------
+        name
+            The name of the metric.
+        documentation
+            The help text of the metric.
+        labels
+            The names of the labels of the metric.
+
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *values, amount=1):
+        """Add amount to the counter for the labels with values."""
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def reset(self):
+        """Set the counter back to zero for every set of labels."""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Return the name, labels and value of each sample."""
+        with self._lock:
+            return [(self.name, dict(zip(self.labels, values)), value)
+                    for values, value in sorted(self._values.items())]
+
+
+class Histogram(Counter):
+    """A Prometheus histogram, with an optional set of labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=LATENCY_BUCKETS):
+        """Initialize the histogram empty for every set of labels.
+
+        Parameters
+        ----------
+        name
+            The name of the metric.
+        documentation
+            The help text of the metric.
+        labels
+            The names of the labels of the metric.
+        buckets
+            The upper bounds of the buckets, in increasing order.
+
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *values):
+        """Record an observation of value for the labels with values."""
+        with self._lock:
+            counts = self._values.get(values)
+            if counts is None:
+                # one count for each bucket and +Inf, then the sum
+                counts = self._values[values] = [0] * (len(self.buckets)
+                                                       + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """Return the name, labels and value of each sample."""
+        samples = []
+        with self._lock:
+            for values, counts in sorted(self._values.items()):
+                labels = dict(zip(self.labels, values))
+                total = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    total += count
+                    samples.append((f"{self.name}_bucket",
+                                    {**labels, "le": str(bound)}, total))
+                samples.append((f"{self.name}_sum", labels, counts[-1]))
+                samples.append((f"{self.name}_count", labels, total))
+        return samples
+
+
+class Gauge(Counter):
+    """A Prometheus gauge, whose samples are read when it is rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels, read):
+        """Initialize the gauge with the function that reads it.
+
+        Parameters
+        ----------
+        name
+            The name of the metric.
+        documentation
+            The help text of the metric.
+        labels
+            The names of the labels of the metric.
+        read
+            A function returning a dict that maps the tuple of the values
+            of the labels to the current value of the gauge.
+
+        """
+        super().__init__(name, documentation, labels)
+        self.read = read
+
+    def samples(self):
+        """Return the name, labels and value of each sample."""
+        return [(self.name, dict(zip(self.labels, values)), value)
+                for values, value in sorted(self.read().items())]
+
+
+def _limiter_state(index):
+    """Return a function reading a field of the state of the LIMITER."""
+    def read():
+        from .parse import LIMITER
+        return {(host,): state[index]
+                for host, state in LIMITER.state().items()}
+    return read
+
+
+SEARCHES = Counter("ml_brasil_searches_total", "Searches started.")
+PAGES = Counter("ml_brasil_pages_fetched_total",
+                "Search result pages fetched.")
+PRODUCTS = Counter("ml_brasil_products_extracted_total",
+                   "Products extracted from the search pages.")
+REPUTATION_CHECKS = Counter("ml_brasil_reputation_checks_total",
+                            "Reputation checks of sellers, by result.",
+                            ("result",))
+REQUESTS = Counter("ml_brasil_requests_total",
+                   "Requests made, by host and status code.",
+                   ("host", "status"))
+LATENCY = Histogram("ml_brasil_request_duration_seconds",
+                    "Time for the hosts to respond to the requests.",
+                    ("host",))
+RATE = Gauge("ml_brasil_rate_limit_requests_per_second",
+             "Current rate allowed by the rate limiter for each host.",
+             ("host",), _limiter_state(0))
+CEILING = Gauge("ml_brasil_rate_limit_ceiling_requests_per_second",
+                "Highest rate the rate limiter may reach for each host.",
+                ("host",), _limiter_state(1))
+
+METRICS = (SEARCHES, PAGES, PRODUCTS, REPUTATION_CHECKS, REQUESTS, LATENCY,
+           RATE, CEILING)
+"""tuple: Every metric exported, in the order they are rendered"""
+
+
+def enable():
+    """Start recording the metrics."""
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """Stop recording the metrics. The ones recorded are kept."""
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """Set every metric recorded back to zero."""
+    for metric in METRICS:
+        metric.reset()
+
+
+def _escape(value):
+    """Escape the value of a label for the Prometheus text format."""
+    return (str(value).replace("\\", r"\\").replace("\n", r"\n")
+            .replace('"', r'\"'))
+
+
+def render():
+    """Return every metric in the Prometheus text format.
+
+    Returns
+    -------
+    str
+        The metrics, with their help and type lines.
+
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                name += "{" + ",".join(f'{label}="{_escape(text)}"'
+                                       for label, text in labels.items()) + "}"
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _handler():
+    """Return the request handler class that answers the scrapes."""
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=9464, address="127.0.0.1"):
+    """Enable the metrics and expose them over HTTP, in a thread.
+
+    Parameters
+    ----------
+    port
+        The port to listen on. If 0, a free one is chosen.
+    address
+        The address to listen on. The default only accepts connections
+        from the same machine.
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The server, already running. Call its shutdown method to stop it.
+
+    """
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((address, port), _handler())
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    enable()
+    return server
@@ -3,14 +3,24 @@
 This module contains functions that process raw extracted searches'
 contents and the Product class.
 """
-import importlib.resources as resources
-from bs4 import BeautifulSoup
-from requests import get
-from time import sleep
-from pickle import load
-from urllib.parse import quote
-from re import compile, search
+from json import load
+from urllib.parse import quote, urlsplit
+from time import monotonic
+from re import compile, finditer, search
+from codecs import getincrementaldecoder
+from collections import deque
+from heapq import heapify, heappop
+from itertools import chain, islice
+from sys import intern
+from math import isnan
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
 from . import categories
+from .categories import CategoryRegistry
+from . import metrics
+from . import transport as transports
+from .ratelimit import THROTTLED, RateLimiter
+from .stats import timer
 
 SKIP_PAGES = 0  # 0 unless debugging
 """int: Sets how many pages will be skipped in a search
@@ -36,18 +46,166 @@ Used as a maximum value constant respecting the engeneering constraints
 of the MercadoLivre website.
 """
 
-try:
-    with resources.open_binary(categories, "categories.pickle") as cat:
-        CATS = load(cat)
-        """list: The categories database
+PARSER = None
+"""str: The parser used by BeautifulSoup to build the html trees
+
+Any parser supported by BeautifulSoup and installed, such as "lxml" or
+"html.parser". If None, "lxml", which is much faster, is used when it
+is installed, and Python's own "html.parser" otherwise.
+"""
+
+LINK_CATCHER = compile(r"(https?://.+(?:MLB\d+\?|-_JM))")
+"""Pattern: Matches the relevant part of the link for a listing"""
+
+RESULT_CLASS = "results-item highlighted article stack product"
+"""str: The class of the html tag of each product in a search page"""
+
+THERMOMETER_CLASS = "card-section seller-thermometer"
+"""str: The class of the seller's reputation card in a product page"""
+
+STREAM_CHUNK_SIZE = 16 * 1024
+"""int: How many bytes of a product page are scanned at a time"""
+
+RESULTS_PER_PAGE = 50
+"""int: How many products there are in each search result page"""
+
+MAX_RESULTS = 2000
+"""int: How deep MercadoLivre lets a single search be paginated
+
+The pages of a search are requested all at once only up to this many
+results. If the search reports more than that, the following pages are
+requested one by one, until there are no more of them.
+"""
+
+RESULT_COUNT = compile(r'quantity-results[^>]*>\s*([\d.]+)')
+"""Pattern: Matches the total number of results in a search page"""
+
+CONDITIONS = ("", "_ITEM*CONDITION_2230284", "_ITEM*CONDITION_2230581")
+"""tuple[str]: The url filters for either, new and used products
+
+Indexed by the 'condition' argument of the search functions.
+"""
+
+ORDERS = ("", "_OrderId_PRICE", "_OrderId_PRICE*DESC")
+"""tuple[str]: The url filters for relevance, lower and higher price order
+
+Indexed by the 'order' argument of the search functions.
+"""
+
+NO_THERMOMETER = -1
+"""int: The reputation rank of a seller whose rank couldn't be read"""
+
+LIMITER = RateLimiter()
+"""RateLimiter: Paces every html request made by the package
+
+Shared by all threads, so that the pace of requests to each host set by
+the 'aggressiveness' of a search holds even when the reputation of many
+products is being checked at the same time.
+"""
+
+MAX_RETRIES = 3
+"""int: How many times a request is retried if the host is overloaded"""
+
+_categories = None
+_categories_lock = Lock()
+
+
+def _load_categories():
+    """Load the categories database and its index, on the first call.
+
+    The database is read only when a category is first needed, so that
+    importing the package, and searches in every category, don't pay
+    for it.
+
+    Returns
+    -------
+    tuple[list, CategoryRegistry]
+        CATS and REGISTRY, the same objects in every call.
+
+    """
+    global _categories
+    with _categories_lock:
+        if _categories is None:
+            from importlib import resources
+            try:
+                with resources.open_binary(categories,
+                                           "categories.json") as cat:
+                    cats = load(cat)
+            except FileNotFoundError:
+                raise FileNotFoundError(
+                    "The categories.json database could not be loaded. "
+                    "Try to generate a new updated database with the "
+                    "extract_categories script, or to reinstall the "
+                    "module.") from None
+            _categories = cats, CategoryRegistry(cats)
+    return _categories
+
+
+def __getattr__(name):
+    """Load the categories the first time CATS or REGISTRY is used.
+
+    CATS
+        list: The categories database. Please refer to the categories
+        subpackage's documentation.
+    REGISTRY
+        CategoryRegistry: The index of the categories in CATS.
+    """
+    if name in ("CATS", "REGISTRY"):
+        globals()["CATS"], globals()["REGISTRY"] = _load_categories()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class SingleFlight:
+    """Share the result of a call among all the callers of the same key.
+
+    The first caller of a key runs the call, and the others, even from
+    other threads, wait for it and get the same result, so that the se-
+    ller of a product found by many searches run together is requested
+    only once. The results are kept for as long as the SingleFlight is,
+    and a call that raises an exception is run again by the next caller.
+
+    """
+
+    def __init__(self):
+        """Initialize the SingleFlight with no results."""
+        self._calls = {}
+        self._lock = Lock()
+
+    def __call__(self, key, function):
+        """Return the result of function, called only once for key.
+
+        Parameters
+        ----------
+        key
+            What identifies the call, such as the link of a product.
+        function
+            The function called, without arguments, if no other caller
+            of key has called it already.
+
+        Returns
+        -------
+        object
+            What function returned, in this call or in that of another
+            caller.
 
-        Please refer to the categories subpackage's documentation.
         """
-except FileNotFoundError:
-    raise FileNotFoundError("The categories.pickle database could not be "
-                            "loaded. Try to generate a new updated data"
-                            "base with the extract_categories script, or "
-                            "to reinstall the module.")
+        with self._lock:
+            call = self._calls.get(key)
+            first = call is None
+            if first:
+                call = self._calls[key] = Future()
+        if first:
+            try:
+                call.set_result(function())
+            except BaseException as error:
+                with self._lock:
+                    del self._calls[key]
+                call.set_exception(error)
+        return call.result()
+
+    def __len__(self):
+        return len(self._calls)
 
 
 class Product:
@@ -62,22 +220,36 @@ class Product:
     """The minimum reputation for a seller to be reputable."""
     aggressiveness = 3
     """The speed with which html requests will be performed."""
+    cache = None
+    """The ReputationCache where the reputation of sellers is kept."""
+    transport = None
+    """The Transport used to request product pages, or the default."""
+    stats = None
+    """The QueryStats where the reputation checks are recorded, if any."""
+    flights = None
+    """The SingleFlight through which the reputation checks are shared."""
+
+    _SETTINGS = ("min_rep", "aggressiveness", "cache", "transport", "stats",
+                 "flights")
+    """The class variables that may be set for a single product."""
 
     _THERMOMETER_LEVELS = ("newbie", "red",
                            "orange", "yellow",
                            "light_green", "green")
     """The 6 possible level for the reputation of a seller, in order."""
 
-    def __init__(self, product_tag, process=True, check_rep=True):
+    def __init__(self, product_tag, process=True, check_rep=True,
+                 **settings):
         """Initialize Product with the html tag.
 
-        Before initializing the first Product object, it is recommended
-        to set the class variable 'min_rep' to the desired value for
-        that particular search, to assure consistency between all pro-
-        ducts. self._html_tag is always initialized with the bs4 html
-        tag for the product. The initialization of other attributes can
-        be delayed until the first time they are acessed. To do this,
-        the arguments process and/or check_rep need to be set to False.
+        The 'min_rep' and the other settings of the reputation check are
+        read from the class variables, unless they are given in settings,
+        which sets them for this product only, so that searches with dif-
+        ferent settings may run at the same time. self._html_tag is al-
+        ways initialized with the bs4 html tag for the product. The ini-
+        tialization of other attributes can be delayed until the first
+        time they are acessed. To do this, the arguments process and/or
+        check_rep need to be set to False.
 
         Parameters
         ----------
@@ -89,22 +261,21 @@ class Product:
         check_rep
             Whether the reputation of the seller is to be verified in
             initialization or later on.
-        min_rep
-            The reputation level threshold that a seller of the product
-            has to reach for them to be considered reputable.
+        **settings
+            Values of min_rep, aggressiveness, cache, transport, stats or
+            flights for this product, instead of the class variables.
 
         """
+        for name, value in settings.items():
+            if name not in self._SETTINGS:
+                raise TypeError(f"Product got an unexpected keyword "
+                                f"argument '{name}'")
+            setattr(self, name, value)
         self._html_tag = product_tag
         if process:
-            # accessing the attribute for the first time sets it
-            self.link
-            self.title
-            self.price
-            self.no_interest
-            self.free_shipping
-            self.in_sale
-            self.picture
+            self._extract_fields()
             if check_rep:
+                # accessing the attribute for the first time sets it
                 self.reputable
 
     @property
@@ -117,7 +288,7 @@ class Product:
 
         """
         if not hasattr(self, '_link'):
-            self._link = self._extract_link()
+            self._extract_fields()
         return self._link
 
     @property
@@ -130,7 +301,7 @@ class Product:
 
         """
         if not hasattr(self, '_title'):
-            self._title = self._extract_title()
+            self._extract_fields()
         return self._title
 
     @title.setter
@@ -149,7 +320,7 @@ class Product:
 
         """
         if not hasattr(self, '_price'):
-            self._price = self._extract_price()
+            self._extract_fields()
         return self._price
 
     @property
@@ -162,7 +333,7 @@ class Product:
 
         """
         if not hasattr(self, '_no_interest'):
-            self._no_interest = self._is_no_interest()
+            self._extract_fields()
         return self._no_interest
 
     @property
@@ -175,7 +346,7 @@ class Product:
 
         """
         if not hasattr(self, '_free_shipping'):
-            self._free_shipping = self._has_free_shipping()
+            self._extract_fields()
         return self._free_shipping
 
     @property
@@ -188,7 +359,7 @@ class Product:
 
         """
         if not hasattr(self, '_in_sale'):
-            self._in_sale = self._is_in_sale()
+            self._extract_fields()
         return self._in_sale
 
     @property
@@ -201,9 +372,22 @@ class Product:
 
         """
         if not hasattr(self, '_picture'):
-            self._picture = self._extract_picture()
+            self._extract_fields()
         return self._picture
 
+    @property
+    def item_id(self):
+        """str: The MercadoLivre id of the listing, such as "MLB123".
+
+        In case the property was not initialized in __init__, in the
+        first time it is accessed, it extracts the id of the listing
+        from self._html_tag.
+
+        """
+        if not hasattr(self, '_item_id'):
+            self._extract_fields()
+        return self._item_id
+
     @property
     def reputable(self):
         """bool: Whether the product's seller is reputable.
@@ -219,6 +403,29 @@ class Product:
 
         return self._reputable
 
+    @reputable.setter
+    def reputable(self, value):
+        if not isinstance(value, bool):
+            raise ValueError("Type must be bool")
+        self._reputable = value
+
+    def _extract_fields(self):
+        """Extract every field of the product in a single pass.
+
+        Walks self._html_tag only once, setting all the attributes that
+        the properties of the product read from it: link, title, price,
+        no_interest, free_shipping, in_sale, picture and item_id. Attri-
+        butes that were already set are kept. The values are the same
+        that the _extract_* and _is_*/_has_* methods return for each of
+        them, which would otherwise search the tag once each.
+
+        """
+        with timer(self.stats, "extract"):
+            fields = _extract_fields(self._html_tag)
+        for field, value in fields.items():
+            if not hasattr(self, f"_{field}"):
+                setattr(self, f"_{field}", value)
+
     def _extract_link(self):
         """Extract the link for the product tag.
 
@@ -238,15 +445,7 @@ class Product:
             an empty string otherwise.
 
         """
-        LINK_CATCHER = compile(r"(https?://.+(?:MLB\d+\?|-_JM))")
-        link = self._html_tag.find(class_="item__info-title")
-        if link:
-            link = link.get("href").strip()
-            link = search(LINK_CATCHER, link)
-            link = link[0]
-            link = link[:-1] if link[-1] == '?' else link
-            return link
-        return ""
+        return _link_from(self._html_tag.find(class_="item__info-title"))
 
     def _extract_title(self):
         """Extract the title from the product tag.
@@ -258,12 +457,7 @@ class Product:
             string otherwise.
 
         """
-        title_tag = self._html_tag.find(class_="main-title")
-        if not title_tag:
-            title_tag = ""
-        else:
-            title_tag = title_tag.contents[0].strip()
-        return title_tag
+        return _title_from(self._html_tag.find(class_="main-title"))
 
     def _extract_price(self):
         """Extract the price from the product tag.
@@ -277,17 +471,7 @@ class Product:
             turns the tuple (float('nan'), float('nan')).
 
         """
-        price_container = self._html_tag.find(class_="price__container")
-        if price_container:
-            price_int = price_container.find(
-                class_="price__fraction").contents[0].strip()
-            price_int = int(price_int.replace('.', ''))
-            price_cents = price_container.find(class_="price__decimals")
-            price_cents = 0 if not price_cents else int(price_cents
-                                                        .contents[0].strip())
-        else:
-            price_int, price_cents = float('nan'), float('nan')
-        return (price_int, price_cents)
+        return _price_from(self._html_tag.find(class_="price__container"))
 
     def _is_no_interest(self):
         """Verify wether the installments for payment have interest.
@@ -333,16 +517,20 @@ class Product:
             ful, an empty string otherwise.
 
         """
-        picture = ""
-        img_tag = self._html_tag.find(class_="item__image item__image--stack")
-        if img_tag:
-            picture = img_tag.find("img").get("src")
-            if not picture:
-                picture = img_tag.find("img").get("data-src")
-            if not picture:
-                picture = ""
+        return _picture_from(
+            self._html_tag.find(class_="item__image item__image--stack"))
 
-        return picture
+    def _extract_item_id(self):
+        """Extract the MercadoLivre id of the listing from the product tag.
+
+        Returns
+        -------
+        str
+            The id of the listing, such as "MLB1543163640", if success-
+            ful, an empty string otherwise.
+
+        """
+        return _item_id_from(self._html_tag)
 
     def _is_reputable(self):
         """Verify wether the seller's reputation is sufficient.
@@ -371,25 +559,86 @@ class Product:
         html request, and then waits for a number of milisseconds. This is
         necessary to avoid being ip blocked from MercadoLivre servers, but
         adds a huge bottleneck to the package. Any optimization on this
-        function is very valuable.
+        function is very valuable. The product page is scanned as it is
+        received, and the connection is closed as soon as the seller is
+        known to be reputable, without the rest of the page being read.
+        If the class variable 'cache' is set, the rank of sellers already
+        known is read from it instead, and if 'flights' is set, a listing
+        being checked for another product, or another search, is not re-
+        quested again.
 
         """
         if self.min_rep > 0:
             if not self.link:
+                if metrics.ENABLED:
+                    metrics.REPUTATION_CHECKS.inc("failed")
                 return False
 
-            sleep(0.5**self.aggressiveness)
-            product_page = BeautifulSoup(get(self.link).text, "html.parser")
-
-            if "ui-pdp-other-sellers__title" not in str(product_page):
-                thermometer = (product_page
-                               .find(class_="card-section seller-thermometer"))
-                therm_levels = self._THERMOMETER_LEVELS[0:self.min_rep]
-                if any(badrep in str(thermometer)
-                       for badrep in therm_levels) or thermometer is None:
-                    return False
+            stats = self.stats
+            with timer(stats, "reputation"):
+                rank = None
+                if self.cache is not None:
+                    rank = self.cache.get(self._cache_key())
+                    if stats is not None:
+                        stats.lookup("reputation", rank is not None)
+                if rank is None:
+                    if self.flights is None:
+                        rank = self._request_rank()
+                    else:
+                        rank = self.flights(self._cache_key(),
+                                            self._request_rank)
+            if metrics.ENABLED:
+                metrics.REPUTATION_CHECKS.inc(
+                    "passed" if rank >= self.min_rep else "failed")
+            return rank >= self.min_rep
+        if metrics.ENABLED:
+            metrics.REPUTATION_CHECKS.inc("skipped")
         return True
 
+    def _request_rank(self):
+        """Request the product page and read the rank of the seller.
+
+        The rank is stored in the class variable 'cache', if it is set
+        and the page was received, so that a request that kept failing
+        isn't remembered as a seller without a thermometer.
+
+        Returns
+        -------
+        int
+            A rank between NO_THERMOMETER and len(_THERMOMETER_LEVELS).
+
+        """
+        stats = self.stats
+        transport = self.transport or transports.default()
+        with _request(transport, self.link, self.aggressiveness, stats,
+                      stream=True) as response:
+            rank = _stream_seller_rank(response, self.min_rep)
+            if stats is not None and response.raw is not None:
+                stats.received(self.link, response.raw.tell())
+            received = response.status_code == 200
+        if self.cache is not None and received:
+            self.cache.set(self._cache_key(), rank)
+        return rank
+
+    def _cache_key(self):
+        """Return the key for the rank of the product in the cache.
+
+        The rank read from a product page depends on the listing, and not
+        only on its seller, as catalogue listings are always reputable,
+        so it is kept for the link for the listing, and not shared by the
+        other listings of the same seller, or official store. It also
+        depends on min_rep, as the page stops being read once the seller
+        reaches it, before a later catalogue marker could raise the rank,
+        so it is only shared with the checks for the same min_rep.
+
+        Returns
+        -------
+        str
+            The min_rep and the link for the listing.
+
+        """
+        return f"{self.min_rep} {self.link}"
+
     def _format_price(self):
         price = self.price
         i = str(price[0])
@@ -416,6 +665,778 @@ class Product:
                 f"Imagem: {self.picture[8:]}")  # doesn't print https://
 
 
+class ProductRecord:
+    """A compact, immutable record of a product listing.
+
+    Holds only the values extracted from the product tag, so that, dif-
+    ferent from a Product, it doesn't keep the html tree of the search
+    page alive. The price is kept as an integer number of cents, and the
+    scheme and host of the links, which are the same for most listings,
+    are interned and shared by all the records.
+
+    """
+
+    __slots__ = ("_link_origin", "_link_path", "title", "price_cents",
+                 "no_interest", "free_shipping", "in_sale",
+                 "_picture_origin", "_picture_path", "reputable", "item_id")
+
+    def __init__(self, link, title, price_cents, no_interest, free_shipping,
+                 in_sale, picture, reputable=None, item_id=""):
+        """Initialize the record with the values of the product.
+
+        Parameters
+        ----------
+        link
+            The link for the product listing.
+        title
+            The title for the product listing.
+        price_cents
+            The price of the product in cents, or None if unknown.
+        no_interest
+            Whether payment in installments is interest free.
+        free_shipping
+            Whether the shipping of the product is free of charge.
+        in_sale
+            Whether product's price is discounted at the moment.
+        picture
+            The picture for the product listing.
+        reputable
+            Whether the product's seller is reputable, or None if it
+            wasn't checked.
+        item_id
+            The MercadoLivre id of the listing, or "" if unknown.
+
+        """
+        setattr_ = super().__setattr__
+        for slot, value in zip(("_link_origin", "_link_path"),
+                               _split_url(link)):
+            setattr_(slot, value)
+        setattr_("title", title)
+        setattr_("price_cents", price_cents)
+        setattr_("no_interest", no_interest)
+        setattr_("free_shipping", free_shipping)
+        setattr_("in_sale", in_sale)
+        for slot, value in zip(("_picture_origin", "_picture_path"),
+                               _split_url(picture)):
+            setattr_(slot, value)
+        setattr_("reputable", reputable)
+        setattr_("item_id", item_id)
+
+    @classmethod
+    def from_product(cls, product):
+        """Build the record with the values of a Product.
+
+        The reputation of the product is only copied if it was already
+        checked, so that building a record never makes a request.
+
+        Parameters
+        ----------
+        product
+            The Product whose values are copied.
+
+        Returns
+        -------
+        ProductRecord
+            The record for the product.
+
+        """
+        price_int, cents = product.price
+        return cls(product.link, product.title,
+                   None if isnan(price_int) else price_int * 100 + cents,
+                   product.no_interest, product.free_shipping,
+                   product.in_sale, product.picture,
+                   getattr(product, "_reputable", None), product.item_id)
+
+    @property
+    def link(self):
+        """str: The link for the product listing."""
+        return self._link_origin + self._link_path
+
+    @property
+    def picture(self):
+        """str: The picture for the product listing."""
+        return self._picture_origin + self._picture_path
+
+    @property
+    def price(self):
+        """tuple[int,int]: The price, in the same format of Product."""
+        if self.price_cents is None:
+            return (float('nan'), float('nan'))
+        return divmod(self.price_cents, 100)
+
+    def _values(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProductRecord is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ProductRecord is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    _format_price = Product._format_price
+    __repr__ = Product.__repr__
+
+
+def _split_url(url):
+    """Split the url in its interned scheme and host, and the rest."""
+    end = url.find("/", url.find("://") + 3) + 1 if "://" in url else 0
+    return intern(url[:end]), url[end:]
+
+
+class ProductList(list):
+    """A list of products that can also be looked up by their item id.
+
+    The products are indexed by their item_id the first time one is
+    looked up, and again after the list is changed.
+
+    """
+
+    def __init__(self, products=()):
+        """Initialize the list with the products.
+
+        Parameters
+        ----------
+        products
+            An iterable of Product or ProductRecord objects.
+
+        """
+        super().__init__(products)
+        self._by_id = None
+
+    def get(self, item_id, default=None):
+        """Return the product with item_id, or default.
+
+        Parameters
+        ----------
+        item_id
+            The MercadoLivre id of the listing, such as "MLB123".
+        default
+            What is returned if no product in the list has item_id.
+
+        Returns
+        -------
+        Product or ProductRecord
+            The first product in the list with item_id, or default.
+
+        """
+        if self._by_id is None:
+            self._by_id = {}
+            for product in self:
+                if product.item_id:
+                    self._by_id.setdefault(product.item_id, product)
+        return self._by_id.get(item_id, default)
+
+    def ids(self):
+        """Return the item ids of the products, in order."""
+        return [product.item_id for product in self]
+
+
+def _forget_index(method):
+    """Wrap a method that changes a ProductList to drop its index."""
+    def changed(self, *args, **kwargs):
+        self._by_id = None
+        return method(self, *args, **kwargs)
+    changed.__name__ = method.__name__
+    changed.__doc__ = method.__doc__
+    return changed
+
+
+for _method in ("__setitem__", "__delitem__", "__iadd__", "__imul__",
+                "append", "extend", "insert", "pop", "remove", "clear",
+                "sort", "reverse"):
+    setattr(ProductList, _method, _forget_index(getattr(list, _method)))
+del _method
+
+
+_ITEM_ID = compile(r"MLB-?(\d+)")
+"""Pattern: Matches the id of a listing in its link"""
+
+
+def _item_id_from(product_tag):
+    """Read the MercadoLivre id of a listing from its tag, or return "".
+
+    The id is the one of the 'rowItem' tag, or its 'item-id' attribute,
+    which come first in the tag. For 'catalogue' listings without them,
+    the 'product-id' attribute is used, and at last the link.
+
+    Parameters
+    ----------
+    product_tag
+        The bs4 html tag for the product.
+
+    Returns
+    -------
+    str
+        The id of the listing, such as "MLB1543163640".
+
+    """
+    product_id = None
+    for tag in chain((product_tag,), product_tag.descendants):
+        attrs = getattr(tag, "attrs", None)
+        if not attrs:
+            continue
+        item_id = _listing_id(attrs)
+        if item_id:
+            return item_id
+        if product_id is None and attrs.get("product-id"):
+            product_id = attrs["product-id"].strip()
+    return product_id or _linked_id(
+        product_tag.find(class_="item__info-title"))
+
+
+def _listing_id(attrs):
+    """Return the id of the listing in the attributes of a tag, or None."""
+    if attrs.get("item-id"):
+        return attrs["item-id"].strip()
+    if "rowItem" in attrs.get("class", ()) and attrs.get("id"):
+        return attrs["id"].strip()
+    return None
+
+
+def _linked_id(link):
+    """Read the id of the listing in the tag of its link, or return ""."""
+    match = link and search(_ITEM_ID, link.get("href", ""))
+    return f"MLB{match[1]}" if match else ""
+
+
+def _unseen(item_id, seen):
+    """Whether item_id is not in seen, adding it. Unknown ids always are."""
+    if not item_id:
+        return True
+    if item_id in seen:
+        return False
+    seen.add(item_id)
+    return True
+
+
+_FIELD_CLASSES = ("item__info-title", "main-title", "price__container",
+                  "item__image item__image--stack")
+"""The classes of the tags from which the fields of a product are read."""
+
+_FLAG_MARKERS = {"no_interest": "item-installments free-interest",
+                 "free_shipping": "stack_column_item shipping highlighted",
+                 "in_sale": "item__discount"}
+"""The class markers that set each boolean field of a product."""
+
+
+def _extract_fields(product_tag):
+    """Extract every field of a product walking its tag only once.
+
+    Every tag below product_tag is visited a single time, recording the
+    first tag of each class a field is read from, as tag.find would, the
+    ids of the listing in its attributes, and which of the markers for
+    no_interest, free_shipping and in_sale are in its classes. The
+    fields are then read from the recorded tags with the same functions
+    used by the Product methods.
+
+    Parameters
+    ----------
+    product_tag
+        The bs4 html tag for the product.
+
+    Returns
+    -------
+    dict
+        The value of each field, by the name of the Product property.
+
+    """
+    found = {}
+    markers = set()
+    item_id = product_id = None
+    for tag in chain((product_tag,), product_tag.descendants):
+        attrs = getattr(tag, "attrs", None)
+        if not attrs:
+            continue
+        if item_id is None:
+            item_id = _listing_id(attrs)
+            if product_id is None and attrs.get("product-id"):
+                product_id = attrs["product-id"].strip()
+        classes = attrs.get("class")
+        if not classes:
+            continue
+        joined = " ".join(classes) if isinstance(classes, list) else classes
+        for marker in _FLAG_MARKERS.values():
+            if marker in joined:
+                markers.add(marker)
+        if tag is product_tag:
+            continue
+        for class_ in _FIELD_CLASSES:
+            if class_ not in found and (class_ in classes or
+                                        class_ == joined):
+                found[class_] = tag
+    return {
+        "link": _link_from(found.get("item__info-title")),
+        "title": _title_from(found.get("main-title")),
+        "price": _price_from(found.get("price__container")),
+        "picture": _picture_from(found.get("item__image item__image--stack")),
+        "item_id": item_id or product_id or _linked_id(
+            found.get("item__info-title")),
+        **{field: marker in markers
+           for field, marker in _FLAG_MARKERS.items()}}
+
+
+def _link_from(link):
+    """Read the link for the listing from its tag, or return ""."""
+    if link:
+        link = search(LINK_CATCHER, link.get("href").strip())
+        if link:
+            link = link[0]
+            return link[:-1] if link[-1] == '?' else link
+    return ""
+
+
+def _title_from(title_tag):
+    """Read the title of the listing from its tag, or return ""."""
+    return title_tag.contents[0].strip() if title_tag else ""
+
+
+def _price_from(price_container):
+    """Read the price of the listing from its tag, or return NaNs."""
+    if price_container:
+        price_int = price_container.find(
+            class_="price__fraction").contents[0].strip()
+        price_int = int(price_int.replace('.', ''))
+        price_cents = price_container.find(class_="price__decimals")
+        price_cents = 0 if not price_cents else int(price_cents
+                                                    .contents[0].strip())
+    else:
+        price_int, price_cents = float('nan'), float('nan')
+    return (price_int, price_cents)
+
+
+def _picture_from(img_tag):
+    """Read the link for the picture from its tag, or return ""."""
+    picture = ""
+    if img_tag:
+        picture = img_tag.find("img").get("src")
+        if not picture:
+            picture = img_tag.find("img").get("data-src")
+        if not picture:
+            picture = ""
+    return picture
+
+
+def _parser():
+    """Return the name of the parser to be used by BeautifulSoup."""
+    if PARSER is not None:
+        return PARSER
+    from bs4.builder import builder_registry
+    return "lxml" if builder_registry.lookup("lxml") else "html.parser"
+
+
+def _parse_only(page, class_, name=None):
+    """Build the html tree of only the tags of a class in the page.
+
+    The rest of the page is skipped by the parser instead of being built
+    into a tree, which is most of the time spent in parsing a page.
+
+    Parameters
+    ----------
+    page
+        The raw html of the page.
+    class_
+        The class, with its names separated by spaces, of the wanted tags.
+    name
+        The name of the wanted tags, or None for tags of any name.
+
+    Returns
+    -------
+    BeautifulSoup
+        A tree which contains only the wanted tags and their contents.
+
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    def has_class(value):
+        return value is not None and " ".join(value.split()) == class_
+
+    return BeautifulSoup(page, _parser(),
+                         parse_only=SoupStrainer(name, {"class": has_class}))
+
+
+class _RankScanner:
+    """Read the rank of the seller from a product page as it arrives.
+
+    The page is fed to the scanner in pieces, in the order they are re-
+    ceived, and searched for the 'catalogue' marker and for the seller
+    thermometer card, without building any html tree. Only the end of
+    the text already fed, and the card once it starts, are kept.
+
+    """
+
+    _KEEP = 2048
+    """How many characters at the end of the text fed are kept."""
+
+    def __init__(self, min_rep=None):
+        """Initialize the scanner for a search with min_rep.
+
+        Parameters
+        ----------
+        min_rep
+            The reputation level threshold of the search. As soon as a
+            thermometer reaching it is read, the scan can end. If None,
+            the whole page is always scanned.
+
+        """
+        self.min_rep = min_rep
+        self.rank = None
+        self._buffer = ""
+        self._card_tag = None
+
+    def feed(self, text):
+        """Scan the next piece of the page.
+
+        Parameters
+        ----------
+        text
+            The piece of the page that follows the ones already fed.
+
+        Returns
+        -------
+        int or None
+            The rank of the seller, if it is already known for sure to
+            reach min_rep, None otherwise.
+
+        """
+        buffer = self._buffer + text
+        if "ui-pdp-other-sellers__title" in buffer:
+            self.rank = len(Product._THERMOMETER_LEVELS)
+            return self.rank
+        if self.rank is None:
+            if self._card_tag is None:
+                position = buffer.find(THERMOMETER_CLASS)
+                start = buffer.rfind("<", 0, position)
+                if position == -1 or start == -1:
+                    self._buffer = buffer[-self._KEEP:]
+                    return None
+                buffer = buffer[start:]
+                self._card_tag = search(r"<(\w+)", buffer)[1]
+            end = self._card_end(buffer)
+            if end is None:
+                self._buffer = buffer
+                return None
+            self.rank = self._card_rank(buffer[:end])
+            if self.min_rep is not None and self.rank >= self.min_rep:
+                return self.rank
+            buffer = buffer[end:]
+        self._buffer = buffer[-self._KEEP:]
+        return None
+
+    def result(self):
+        """Return the rank of the seller from all the text fed.
+
+        Returns
+        -------
+        int
+            A rank between NO_THERMOMETER and len(Product._THERMOMETER_LE-
+            VELS).
+
+        """
+        if self.rank is not None:
+            return self.rank
+        if self._card_tag is not None:
+            return self._card_rank(self._buffer)
+        return NO_THERMOMETER
+
+    def _card_end(self, card):
+        """Find where the card, starting at card[0], is closed."""
+        depth = 0
+        for tag in finditer(rf"<(/?){self._card_tag}\b[^>]*>", card):
+            depth += -1 if tag[1] else 1
+            if depth == 0:
+                return tag.end()
+        return None
+
+    @staticmethod
+    def _card_rank(card):
+        """Return the rank of the first level found in the card."""
+        for rank, level in enumerate(Product._THERMOMETER_LEVELS):
+            if level in card:
+                return rank
+        return len(Product._THERMOMETER_LEVELS)
+
+
+def _seller_rank(page, min_rep=None):
+    """Read in a product page the reputation rank of the seller.
+
+    The rank is the index, in Product._THERMOMETER_LEVELS, of the first
+    level found in the seller thermometer card. A seller is reputable
+    when its rank is at least the min_rep of the search. 'Catalogue'
+    listings, which aggregate many sellers, have the highest rank, and
+    pages without a thermometer have the lowest.
+
+    Parameters
+    ----------
+    page
+        The raw html of the product page.
+    min_rep
+        If given, the rest of the page isn't scanned once the seller is
+        known to reach it.
+
+    Returns
+    -------
+    int
+        A rank between NO_THERMOMETER and len(Product._THERMOMETER_LEVELS).
+
+    """
+    scanner = _RankScanner(min_rep)
+    rank = scanner.feed(page)
+    return scanner.result() if rank is None else rank
+
+
+def _stream_seller_rank(response, min_rep=None):
+    """Read the rank of the seller while the product page is received.
+
+    The body of the response is scanned as it arrives, and no more of it
+    is read once the rank is known to reach min_rep. Please refer to the
+    documentation of _seller_rank for the meaning of the rank.
+
+    Parameters
+    ----------
+    response
+        The requests.Response for the product page, requested with
+        stream=True. It is up to the caller to close it.
+    min_rep
+        The reputation level threshold of the search.
+
+    Returns
+    -------
+    int
+        A rank between NO_THERMOMETER and len(Product._THERMOMETER_LEVELS).
+
+    """
+    scanner = _RankScanner(min_rep)
+    decoder = getincrementaldecoder(response.encoding or "utf-8")(
+        errors="replace")
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        rank = scanner.feed(decoder.decode(chunk))
+        if rank is not None:
+            return rank
+    scanner.feed(decoder.decode(b"", final=True))
+    return scanner.result()
+
+
+def _request(transport, url, aggressiveness, stats=None, **kwargs):
+    """Request url when the LIMITER allows, retrying if it is overloaded.
+
+    The outcome of every attempt is reported to the LIMITER, so that the
+    pace of requests to the host adapts to how it is responding. A fresh
+    response in the cache of the transport is returned right away.
+
+    Parameters
+    ----------
+    transport
+        The Transport used to request the url.
+    url
+        The url requested.
+    aggressiveness
+        The level of aggressiveness (speed) of the search.
+    stats
+        The QueryStats in which every attempt is recorded, if any.
+    **kwargs
+        Passed on to Transport.get.
+
+    Returns
+    -------
+    requests.Response
+        The response of the server to the last attempt.
+
+    """
+    response = transport.cached(url)
+    if stats is not None and transport.cache is not None:
+        stats.lookup("response", response is not None)
+    if response is not None:
+        return response
+    host = urlsplit(url).netloc
+    for attempt in range(MAX_RETRIES + 1):
+        waited = LIMITER.wait(host, aggressiveness)
+        start = monotonic()
+        response = transport.get(url, **kwargs)
+        latency = monotonic() - start
+        LIMITER.feedback(host, response.status_code, latency,
+                         _retry_after(response.headers))
+        if metrics.ENABLED:
+            metrics.REQUESTS.inc(host, response.status_code)
+            metrics.LATENCY.observe(latency, host)
+        if stats is not None:
+            stats.request(url, response.status_code, latency, waited,
+                          None if kwargs.get("stream") else
+                          len(response.content))
+        if response.status_code not in THROTTLED or attempt == MAX_RETRIES:
+            return response
+        response.close()
+
+
+def _retry_after(headers):
+    """Return the seconds in the Retry-After header, if there are any."""
+    value = headers.get("Retry-After", "")
+    return int(value) if value.isdigit() else None
+
+
+def _result_count(page):
+    """Read the total number of results of a search from one of its pages.
+
+    Parameters
+    ----------
+    page
+        The raw html of a search result page.
+
+    Returns
+    -------
+    int or None
+        The number of results if the page tells it, None otherwise.
+
+    """
+    count = RESULT_COUNT.search(page)
+    return int(count[1].replace('.', '')) if count else None
+
+
+def _search_url(subdomain, suffix, term, index,
+                price_min, price_max, condition, order=0):
+    """Build the url for one page of a search.
+
+    Parameters
+    ----------
+    subdomain
+        The subdomain of the category, as returned by get_cat.
+    suffix
+        The suffix of the category, as returned by get_cat.
+    term
+        The search term.
+    index
+        The position, in the results, of the first product in the page.
+    price_min
+        The minimum price of a listing for it to be included.
+    price_max
+        The maximum price of a listing for it to be included.
+    condition
+        Whether the product listings should to be new (1), used (2)
+        or either (0).
+    order
+        Whether the results are sorted by 'relevance' (0), lower price
+        (1) or higher price (2) by MercadoLivre.
+
+    Returns
+    -------
+    str
+        The url for the requested page of the search.
+
+    """
+    return (f"https://{subdomain}.mercadolivre.com.br/{suffix}"
+            f"{quote(term, safe='')}_Desde_{index}"
+            f"_PriceRange_{price_min}-{price_max}{CONDITIONS[condition]}"
+            f"{ORDERS[order]}")
+
+
+def _prefetch(pool, function, items, ahead):
+    """Yield function(item) for each item, in order, calling it in pool.
+
+    Unlike pool.map, which submits every call at once, only 'ahead'
+    calls are running or waiting at a time, the next being submitted
+    as the results are taken.
+    """
+    items = iter(items)
+    pending = deque(pool.submit(function, item)
+                    for item in islice(items, ahead))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(pool.submit(function, item))
+        yield result
+
+
+def _plan_shards(fetch, page, price_min, price_max, workers=1):
+    """Split the price range of a search until each part fits in a search.
+
+    A range whose first page reports more than MAX_RESULTS results is
+    bisected into two ranges that share the middle price, as the prices
+    of the listings have cents, and the first page of each is requested,
+    by a pool of workers, to read how many results it has. The ranges
+    that can't be split, of a single real, are kept even if they don't
+    fit.
+
+    Parameters
+    ----------
+    fetch
+        A function that requests a page of the search, with the position
+        of its first product, the minimum and the maximum price.
+    page
+        The first page of the search in the whole range.
+    price_min
+        The minimum price of the search.
+    price_max
+        The maximum price of the search.
+    workers
+        How many pages may be requested at the same time.
+
+    Returns
+    -------
+    list[tuple[int, int, str, int]]
+        The minimum and maximum price, the first page and the number of
+        results of each part, ordered by their prices.
+
+    """
+    shards, pending = [], [(price_min, price_max, page)]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while pending:
+            ranges = []
+            for low, high, page in pending:
+                count = _result_count(page)
+                if count is None or count <= MAX_RESULTS or high - low < 2:
+                    shards.append((low, high, page, count))
+                else:
+                    middle = (low + high) // 2
+                    ranges += [(low, middle), (middle, high)]
+            pages = pool.map(lambda prices: fetch(1, *prices), ranges)
+            pending = [(low, high, page) for (low, high), page
+                       in zip(ranges, pages) if page is not None]
+    return sorted(shards, key=lambda shard: shard[:2])
+
+
+def _iter_shards(fetch, page, price_min, price_max, workers, step):
+    """Yield the pages of every part of a search planned by _plan_shards.
+
+    The pages of all the parts are requested by the same pool of work-
+    ers, and yielded in the order of the parts, skipping the parts with-
+    out any result. The pages of a part whose first page doesn't tell
+    how many results it has are requested one by one instead, until a
+    page isn't found, as those of a search that isn't split.
+    """
+    shards = _plan_shards(fetch, page, price_min, price_max, workers)
+    indexes = [range(1 + step, min(count or 0, MAX_RESULTS) + 1, step)
+               for *_, count in shards]
+    pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+    try:
+        pages = pool.map(lambda task: fetch(*task),
+                         [(index, low, high) for (low, high, *_), shard
+                          in zip(shards, indexes) for index in shard])
+        for (low, high, page, count), shard in zip(shards, indexes):
+            if count != 0:
+                yield page
+            for _ in shard:
+                page = next(pages)
+                if page is not None:
+                    yield page
+            if count is None:
+                index = 1 + step
+                while True:
+                    page = fetch(index, low, high)
+                    if page is None:
+                        break
+                    yield page
+                    index += step
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
 def get_cat(catid):
     """Fetch the category information from the database.
 
@@ -438,27 +1459,27 @@ def get_cat(catid):
         the requested category.
 
     """
-    father_num, child_num = map(int, catid.split('.'))
-    subdomain = False
-    for father_cat in CATS:
-        if father_cat[0][0] == father_num:
-            for child in father_cat[1]:
-                if child['number'] == child_num:
-                    subdomain = child['subdomain']
-                    suffix = child['suffix']
-                    break
-    if not subdomain:
-        raise ValueError(f"Categoria informada \"{catid}\" não existe.")
-
-    return subdomain, suffix
-
-
-def get_all_products(pages, min_rep=Product.min_rep, process=True):
+    try:
+        category = _load_categories()[1][catid]
+    except KeyError:
+        raise ValueError(
+            f"Categoria informada \"{catid}\" não existe.") from None
+
+    return category.subdomain, category.suffix
+
+
+def get_all_products(pages, min_rep=Product.min_rep, process=True,
+                     aggressiveness=Product.aggressiveness, workers=1,
+                     check_rep=True, cache=None, transport=None,
+                     records=False, stats=None, flights=None,
+                     dedupe=False):
     """Process the pages to generate final results.
 
     Goes through the pages in the list returned by get_search_pages ex-
     tracting each product from all the pages, and then extracting pro-
-    duct information from each product.
+    duct information from each product. When there is more than one
+    worker, the reputation of the sellers is checked by a pool of
+    threads, all of them paced by the same LIMITER.
 
     Parameters
     ----------
@@ -471,25 +1492,224 @@ def get_all_products(pages, min_rep=Product.min_rep, process=True):
     process
         Whether all products returned will be processed completely be-
         fore returning the list of products.
+    aggressiveness
+        The level of aggressiveness (speed) that the function will do
+        html requests. The higher its value, the shorter the delay be-
+        tween requests.
+    workers
+        How many reputation checks may be running at the same time.
+    check_rep
+        Whether the reputation of the sellers is to be verified when the
+        products are processed, or later on.
+    cache
+        The ReputationCache in which the reputation of the sellers is
+        looked up before being requested. If None, nothing is cached.
+    transport
+        The Transport used to request the product pages. If None, the
+        default Transport of the package is used.
+    records
+        Whether ProductRecord objects are returned instead of Product
+        objects. The html trees are released once the records are built.
+    stats
+        The QueryStats in which the time spent parsing the pages, ex-
+        tracting the products and checking their reputation is recorded.
+        If None, nothing is recorded.
+    flights
+        The SingleFlight through which the reputation checks are shared
+        with other searches, so that each seller is checked only once.
+        If None, they are shared only by the products of the pages.
+    dedupe
+        Whether a listing already found, by its item id, is skipped
+        when it appears again, before any request is made for it.
 
     Returns
     -------
-    list[Product]
-        A list of which each element is a Product object.
+    ProductList
+        A list of which each element is a Product object, or a Product-
+        Record object if 'records' is True.
 
     """
-    Product.min_rep = min_rep
-    products = [
-        BeautifulSoup(page, "html.parser")
-        .find_all(class_="results-item highlighted article stack product")
-        for page in pages]
-    return [Product(product_tag=product, process=process)
-            for page in products for product in page]
+    return ProductList(iter_products(pages, min_rep, process, aggressiveness,
+                                     workers, check_rep, cache, transport,
+                                     records, stats, flights, dedupe))
+
+
+def iter_products(pages, min_rep=Product.min_rep, process=True,
+                  aggressiveness=Product.aggressiveness, workers=1,
+                  check_rep=True, cache=None, transport=None,
+                  records=False, stats=None, flights=None,
+                  dedupe=False):
+    """Process the pages, yielding each product as soon as it is ready.
+
+    The generator version of get_all_products. Each page is parsed only
+    when it is taken from 'pages', which may itself be a generator such
+    as the one returned by iter_search_pages, and its products are yiel-
+    ded, in order, as soon as they are processed. With more than one
+    worker, the reputation checks of a page run in the background while
+    the next pages are requested and parsed.
+
+    Parameters
+    ----------
+    pages
+        An iterable of strings which contain raw html from the pages of
+        the search results.
+    min_rep
+        The reputation level threshold that a seller has to reach for
+        them to be considered reputable.
+    process
+        Whether each product will be processed completely before being
+        yielded.
+    aggressiveness
+        The level of aggressiveness (speed) that the function will do
+        html requests. The higher its value, the shorter the delay be-
+        tween requests.
+    workers
+        How many reputation checks may be running at the same time.
+    check_rep
+        Whether the reputation of the sellers is to be verified when the
+        products are processed, or later on.
+    cache
+        The ReputationCache in which the reputation of the sellers is
+        looked up before being requested. If None, nothing is cached.
+    transport
+        The Transport used to request the product pages. If None, the
+        default Transport of the package is used.
+    records
+        Whether ProductRecord objects are yielded instead of Product
+        objects. The html tree of each product is released once its re-
+        cord is built.
+    stats
+        The QueryStats in which the time spent parsing the pages, ex-
+        tracting the products and checking their reputation is recorded.
+        If None, nothing is recorded.
+    flights
+        The SingleFlight through which the reputation checks are shared
+        with other searches, so that each seller is checked only once.
+        If None, they are shared only by the products of the pages.
+    dedupe
+        Whether a listing already found, by its item id, is skipped
+        when it appears again, before any request is made for it.
+
+    Yields
+    ------
+    Product or ProductRecord
+        Each product of the pages, in the order they were found.
+
+    """
+    settings = {"min_rep": min_rep, "aggressiveness": aggressiveness,
+                "cache": cache, "transport": transport, "stats": stats,
+                "flights": SingleFlight() if flights is None else flights}
+    check_rep = process and check_rep
+    process = process or records
+    pool = ThreadPoolExecutor(max_workers=workers) if (
+        check_rep and workers > 1) else None
+    pending = deque()
+    seen = set()
+
+    def result(product):
+        if not records:
+            return product
+        record = ProductRecord.from_product(product)
+        product._html_tag.decompose()
+        return record
+
+    try:
+        for page in pages:
+            with timer(stats, "parse"):
+                product_tags = (_parse_only(page, RESULT_CLASS, "li")
+                                .find_all(class_=RESULT_CLASS))
+            if metrics.ENABLED:
+                metrics.PRODUCTS.inc(amount=len(product_tags))
+            for product_tag in product_tags:
+                product = Product(product_tag=product_tag, process=process,
+                                  check_rep=False, **settings)
+                # the id is read in the same pass as the other fields
+                if dedupe and not _unseen(product.item_id, seen):
+                    continue
+                if pool is None:
+                    if check_rep:
+                        # accessing the attribute for the first time sets it
+                        product.reputable
+                    yield result(product)
+                else:
+                    # accessing the attribute for the first time sets it
+                    pending.append((product, pool.submit(
+                        getattr, product, "reputable")))
+            while pending and pending[0][1].done():
+                yield result(pending.popleft()[0])
+        while pending:
+            product, check = pending.popleft()
+            check.result()
+            yield result(product)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def iter_reputable(products, workers=1, key=None, every=False):
+    """Yield the products whose seller is reputable, checking them lazily.
+
+    The reputation of the products is checked in their order, 'workers'
+    of them at a time, and only as the reputable ones are taken, so that
+    a caller that needs only the first of them doesn't pay for the rest.
+    The products may come from a generator, such as iter_products with
+    check_rep=False, which is then also advanced only as needed.
+
+    If 'key' is given, every product is taken at once and kept in a heap
+    by its key instead, the products being checked, and yielded, in the
+    order of their keys: the caller of the first N reputable products
+    pays for them and for the unreputable ones ranked before them only,
+    rather than for the whole search, as would sorting the checked pro-
+    ducts.
+
+    Parameters
+    ----------
+    products
+        An iterable of Product objects.
+    workers
+        How many reputation checks may be running at the same time.
+    key
+        A function of one product that returns its key, as in sorted.
+        Products with equal keys keep their order. If None, the products
+        are yielded in their order.
+    every
+        If True, every product is yielded once its reputation is check-
+        ed, whether its seller is reputable or not.
+
+    Yields
+    ------
+    Product
+        Each product with a reputable seller, or each product if 'every'
+        is True, in the order of products, or of their keys.
+
+    """
+    products = iter(products)
+    if key is not None:
+        heap = [(key(product), index, product)
+                for index, product in enumerate(products)]
+        heapify(heap)
+        products = (heappop(heap)[2] for _ in range(len(heap)))
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while True:
+            batch = list(islice(products, max(workers, 1)))
+            if not batch:
+                return
+            if pool is not None:
+                # accessing the attribute for the first time sets it
+                list(pool.map(getattr, batch, ["reputable"] * len(batch)))
+            for product in batch:
+                if product.reputable or every:
+                    yield product
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
 
 def get_search_pages(term, cat='0.0',
                      price_min=0, price_max=INT32_MAX,
-                     condition=0, aggressiveness=3):
+                     condition=0, aggressiveness=3, transport=None,
+                     workers=1, stats=None, shard=False, order=0):
     """Search in MercadoLivre with the specified arguments.
 
     This function does the requesting to MercadoLivre, returning every
@@ -515,6 +1735,23 @@ def get_search_pages(term, cat='0.0',
         The level of aggressiveness (speed) that the function will do
         html requests. The higher its value, the shorter the delay be-
         tween requests.
+    transport
+        The Transport used to request the pages. If None, the default
+        Transport of the package is used.
+    workers
+        How many pages may be requested at the same time.
+    stats
+        The QueryStats in which the requests for the pages, and the time
+        spent on them, are recorded. If None, nothing is recorded.
+    shard
+        Whether a search with more results than MAX_RESULTS is split in
+        searches of parts of its price range, which MercadoLivre pagi-
+        nates in full. The parts share their boundaries, so a listing
+        priced at one is found twice, and the pages of each part come
+        in the order of the prices.
+    order
+        Whether the results are sorted by 'relevance' (0), lower price
+        (1) or higher price (2) by MercadoLivre.
 
     Returns
     -------
@@ -523,19 +1760,113 @@ def get_search_pages(term, cat='0.0',
         result pages.
 
     """
-    CONDITIONS = ["", "_ITEM*CONDITION_2230284", "_ITEM*CONDITION_2230581"]
+    return list(iter_search_pages(term, cat, price_min, price_max,
+                                  condition, aggressiveness, transport,
+                                  workers, stats, shard, order))
+
+
+def iter_search_pages(term, cat='0.0',
+                      price_min=0, price_max=INT32_MAX,
+                      condition=0, aggressiveness=3, transport=None,
+                      workers=1, stats=None, shard=False, order=0):
+    """Search in MercadoLivre, yielding each page as soon as it arrives.
+
+    The generator version of get_search_pages. The total number of re-
+    sults is read from the first page, so that the position of every
+    other page is known, and they are requested by a pool of workers,
+    all of them paced by the LIMITER. Only if the first page doesn't
+    tell the number of results, or there are more of them than MAX_RE-
+    SULTS, the pages are requested one by one until there are no more,
+    unless the search is sharded by _plan_shards. No more than 'work-
+    ers' pages are requested ahead of the ones already taken, so that
+    a search which is no longer iterated stops requesting its pages.
+
+    Parameters
+    ----------
+    term
+        The search term. Trailing and leading spaces are stripped.
+    cat
+        The category number for the desired category for the products.
+    price_min
+        The minimum price of a listing for it to be included in the
+        results. Always a non-negative integer, lower than price_max.
+    price_max
+        The maximum price of a listing for it to be included in the
+        results. Always a non-negative integer, higher than price_min.
+    condition
+        Whether the product listings should to be new (1), used (2)
+        or either (0).
+    aggressiveness
+        The level of aggressiveness (speed) that the function will do
+        html requests. The higher its value, the shorter the delay be-
+        tween requests.
+    transport
+        The Transport used to request the pages. If None, the default
+        Transport of the package is used.
+    workers
+        How many pages may be requested at the same time.
+    stats
+        The QueryStats in which the requests for the pages, and the time
+        spent on them, are recorded. If None, nothing is recorded.
+    shard
+        Whether a search with more results than MAX_RESULTS is split in
+        searches of parts of its price range, which MercadoLivre pagi-
+        nates in full. The parts share their boundaries, so a listing
+        priced at one is found twice, and the pages of each part come
+        in the order of the prices.
+    order
+        Whether the results are sorted by 'relevance' (0), lower price
+        (1) or higher price (2) by MercadoLivre.
+
+    Yields
+    ------
+    str
+        The raw html of each search result page, in order.
+
+    """
     subdomain, suffix = get_cat(cat)
-    index = 1
-    pages = []
+    transport = transport or transports.default()
+
+    def fetch(index, low=price_min, high=price_max):
+        with timer(stats, "search"):
+            page = _request(transport,
+                            _search_url(subdomain, suffix, term, index,
+                                        low, high, condition, order),
+                            aggressiveness, stats)
+            if page.status_code == 404:
+                return None
+            if metrics.ENABLED:
+                metrics.PAGES.inc()
+            return page.text
+
+    if metrics.ENABLED:
+        metrics.SEARCHES.inc()
+    step = RESULTS_PER_PAGE * (SKIP_PAGES + 1)  # DEBUG
+    page = fetch(1)
+    if page is None:
+        return
+    count = _result_count(page)
+    if shard and count is not None and count > MAX_RESULTS:
+        yield from _iter_shards(fetch, page, price_min, price_max, workers,
+                                step)
+        return
+    yield page
+    index = 1 + step
+    if count is not None:
+        indexes = range(index, min(count, MAX_RESULTS) + 1, step)
+        pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        try:
+            for page in _prefetch(pool, fetch, indexes, max(workers, 1)):
+                if page is not None:
+                    yield page
+        finally:
+            pool.shutdown(cancel_futures=True)
+        if count <= MAX_RESULTS or page is None:
+            return
+        index += len(indexes) * step
     while True:
-        sleep(0.5**aggressiveness)
-        page = get(
-            f"https://{subdomain}.mercadolivre.com.br/{suffix}"
-            f"{quote(term, safe='')}_Desde_{index}"
-            f"_PriceRange_{price_min}-{price_max}{CONDITIONS[condition]}")
-        index += 50 * (SKIP_PAGES + 1)  # DEBUG
-        if page.status_code == 404:
+        page = fetch(index)
+        if page is None:
             break
-        else:
-            pages.append(page.text)
-    return pages
+        yield page
+        index += step
@@ -0,0 +1,239 @@
+"""Pace the html requests made to MercadoLivre.
+
+This module contains the rate limiter used by every request of the
+package. A single limiter is shared by all the threads that perform
+requests, so that the pace set by 'aggressiveness' holds for the whole
+process, no matter how many requests are running at the same time.
+
+The limiter keeps a token bucket for each host, whose rate adapts to
+how the host is responding: it is cut by half as soon as the host
+answers that it is overloaded (429 or 503) or becomes much slower than
+usual, and it grows back slowly while the requests go well, up to the
+ceiling set by the 'aggressiveness' of the search.
+"""
+from threading import Lock
+from time import monotonic, sleep
+
+THROTTLED = (429, 503)
+"""tuple[int]: The status codes of a host asking for fewer requests"""
+
+
+def preset(aggressiveness):
+    """Return the rates, in requests per second, for an aggressiveness.
+
+    The starting rate is the one of the fixed delay of 0.5**aggressive-
+    ness seconds between requests used before the limiter adapted, and
+    the ceiling is twice that.
+
+    Parameters
+    ----------
+    aggressiveness
+        The level of aggressiveness (speed) of the search.
+
+    Returns
+    -------
+    tuple[float, float]
+        The starting rate and the ceiling for the rate.
+
+    """
+    return 2.0 ** aggressiveness, 2.0 ** (aggressiveness + 1)
+
+
+class _Bucket:
+    """The token bucket, and its adaptive rate, of a single host."""
+
+    __slots__ = ("rate", "ceiling", "burst", "tat", "latency", "cut")
+
+    def __init__(self, rate, ceiling, burst):
+        self.rate = rate
+        self.ceiling = ceiling
+        self.burst = burst
+        self.tat = 0.0  # theoretical arrival time of the next token
+        self.latency = None  # moving average of the latency
+        self.cut = 0.0  # when the last token reserved before a cut starts
+
+
+class RateLimiter:
+    """A thread-safe, adaptive, token bucket limiter for each host.
+
+    Every caller reserves a token of the bucket of the host it is about
+    to request, and waits until that token is available. Tokens are
+    handed out at the current rate of the host, allowing up to 'burst'
+    of them at once, so that the rate of requests stays the same whether
+    they are made by one thread or by many, or by coroutines of an event
+    loop. The outcome of each request is then reported with feedback, so
+    that the rate adapts to the host.
+
+    """
+
+    floor = 0.1
+    """The lowest rate, in requests per second, that a host can have."""
+    backoff = 0.5
+    """By how much the rate is multiplied when a host is overloaded."""
+    ramp_up = 0.05
+    """Fraction of the ceiling added to the rate per second of successes."""
+    slow_down = 3
+    """How many times slower than usual a host has to be to be overloaded."""
+    jitter = 0.1
+    """Latency, in seconds, below which a host is never considered slow."""
+
+    def __init__(self, burst=1):
+        """Initialize the limiter, with no bucket for any host yet.
+
+        Parameters
+        ----------
+        burst
+            How many requests to the same host may start at once, if the
+            host hasn't been requested for a while.
+
+        """
+        self.burst = burst
+        self._lock = Lock()
+        self._buckets = {}
+
+    def reserve(self, host, aggressiveness=3):
+        """Reserve the next token for a request to host.
+
+        Parameters
+        ----------
+        host
+            The host that is going to be requested.
+        aggressiveness
+            The level of aggressiveness of the search, which sets the
+            ceiling for the rate of the host.
+
+        Returns
+        -------
+        float
+            How long, in seconds, the caller has to wait before making
+            the request. Never negative.
+
+        """
+        rate, ceiling = preset(aggressiveness)
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = _Bucket(rate, ceiling,
+                                                       self.burst)
+            elif bucket.ceiling != ceiling:
+                bucket.ceiling = ceiling
+                bucket.rate = min(bucket.rate, ceiling)
+            now = monotonic()
+            interval = 1 / bucket.rate
+            start = max(now, bucket.tat - (bucket.burst - 1) * interval)
+            bucket.tat = max(bucket.tat, start) + interval
+        return start - now
+
+    def wait(self, host, aggressiveness=3):
+        """Block the calling thread until its token for host is available.
+
+        Parameters
+        ----------
+        host
+            The host that is going to be requested.
+        aggressiveness
+            The level of aggressiveness of the search.
+
+        Returns
+        -------
+        float
+            How long, in seconds, the caller waited.
+
+        """
+        delay = self.reserve(host, aggressiveness)
+        if delay > 0:
+            sleep(delay)
+        return delay
+
+    async def wait_async(self, host, aggressiveness=3):
+        """Suspend the calling coroutine until its token is available.
+
+        Parameters
+        ----------
+        host
+            The host that is going to be requested.
+        aggressiveness
+            The level of aggressiveness of the search.
+
+        Returns
+        -------
+        float
+            How long, in seconds, the caller waited.
+
+        """
+        from asyncio import sleep as async_sleep
+
+        delay = self.reserve(host, aggressiveness)
+        if delay > 0:
+            await async_sleep(delay)
+        return delay
+
+    def feedback(self, host, status, latency, retry_after=None):
+        """Adapt the rate of host to the outcome of a request to it.
+
+        Parameters
+        ----------
+        host
+            The host that was requested.
+        status
+            The status code of the response.
+        latency
+            How long, in seconds, the host took to respond.
+        retry_after
+            How long, in seconds, the host asked the client to wait
+            before the next request, if it did.
+
+        """
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                return
+            usual = bucket.latency
+            if status in THROTTLED or (usual is not None and latency > max(
+                    self.slow_down * usual, self.jitter)):
+                # the requests reserved before the last cut don't cut again
+                if now - latency >= bucket.cut:
+                    bucket.rate = max(self.floor, bucket.rate * self.backoff)
+                    bucket.cut = max(now, bucket.tat)
+            else:
+                # 'rate' successes per second add ramp_up of the ceiling
+                bucket.rate = min(bucket.ceiling, bucket.rate + self.ramp_up
+                                  * bucket.ceiling / bucket.rate)
+            if status not in THROTTLED:
+                bucket.latency = (latency if usual is None
+                                  else 0.8 * usual + 0.2 * latency)
+            if retry_after:
+                bucket.tat = max(bucket.tat, now + retry_after)
+
+    def rate(self, host):
+        """Return the current rate, in requests per second, of host.
+
+        Parameters
+        ----------
+        host
+            The host whose rate is requested.
+
+        Returns
+        -------
+        float or None
+            The rate of the host, or None if it wasn't requested yet.
+
+        """
+        with self._lock:
+            bucket = self._buckets.get(host)
+            return None if bucket is None else bucket.rate
+
+    def state(self):
+        """Return the current rate and ceiling of every host requested.
+
+        Returns
+        -------
+        dict
+            A tuple of the rate and the ceiling, in requests per second,
+            by host.
+
+        """
+        with self._lock:
+            return {host: (bucket.rate, bucket.ceiling)
+                    for host, bucket in self._buckets.items()}
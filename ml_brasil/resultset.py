@@ -0,0 +1,291 @@
+"""Columnar storage of the results of a search, for analyses.
+
+This module keeps the results of a search in a ResultSet, in which every
+field of the products is a NumPy array, so that the results of large
+searches can be filtered and sorted without a loop over the products:
+
+>>> results = ResultSet.from_products(ML_query("celular", records=True))
+>>> cheap = results[results.mask(price_max=1000, free_shipping=True)]
+>>> cheap.sort("-reputable", "price").to_pandas()
+
+NumPy needs to be installed for this module to be used, and pandas or
+pyarrow for the results to be exported to them.
+"""
+from .parse import ProductRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NO_PRICE = -1
+"""int: The price_cents of a product whose price couldn't be read
+
+As prices are never negative, it is told apart by ResultSet.priced.
+"""
+
+TEXTS = ("item_id", "title", "link", "picture")
+"""tuple[str]: The columns of a ResultSet kept as arrays of strings"""
+
+FLAGS = ("no_interest", "free_shipping", "in_sale", "reputable")
+"""tuple[str]: The columns of a ResultSet kept as arrays of booleans"""
+
+COLUMNS = (*TEXTS, "price_cents", *FLAGS)
+"""tuple[str]: Every column of a ResultSet, in the order they are exported"""
+
+
+def _numpy():
+    """Return numpy, if it is installed."""
+    if numpy is None:
+        raise ImportError("The result sets require the numpy package. "
+                          "Install it with 'pip install numpy'.")
+    return numpy
+
+
+class ResultSet:
+    """The results of a search, as a set of parallel NumPy arrays.
+
+    The price of each product is kept in the int64 array price_cents,
+    with NO_PRICE for the products whose price couldn't be read, the
+    flags in arrays of booleans, and the texts in arrays of strings. The
+    reputable array is False for the products whose reputation wasn't
+    checked, which are told apart by the checked array.
+
+    Indexing a ResultSet with an integer returns the ProductRecord of a
+    product, and with a slice, an array of indices or a boolean mask,
+    such as the ones returned by mask, a ResultSet of those products.
+
+    """
+
+    def __init__(self, columns):
+        """Build the set from its columns.
+
+        Parameters
+        ----------
+        columns
+            A dict with an array, or sequence, for each name in COLUMNS,
+            and for "checked", all of the same length.
+
+        """
+        np = _numpy()
+        self._columns = {}
+        for name in TEXTS:
+            self._columns[name] = np.asarray(columns[name], dtype=object)
+        self._columns["price_cents"] = np.asarray(columns["price_cents"],
+                                                  dtype=np.int64)
+        for name in (*FLAGS, "checked"):
+            self._columns[name] = np.asarray(columns[name], dtype=bool)
+        lengths = {len(column) for column in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("The columns of a ResultSet must have the "
+                             f"same length, not {sorted(lengths)}")
+
+    @classmethod
+    def from_products(cls, products):
+        """Build the set with the values of the products.
+
+        Parameters
+        ----------
+        products
+            An iterable of ProductRecord objects, or of Product objects,
+            whose reputation is only copied if it was already checked.
+
+        Returns
+        -------
+        ResultSet
+            The set of the products, in their order.
+
+        """
+        records = [product if isinstance(product, ProductRecord)
+                   else ProductRecord.from_product(product)
+                   for product in products]
+        columns = {name: [getattr(record, name) for record in records]
+                   for name in (*TEXTS, *FLAGS[:-1])}
+        columns["price_cents"] = [NO_PRICE if record.price_cents is None
+                                  else record.price_cents
+                                  for record in records]
+        columns["reputable"] = [bool(record.reputable) for record in records]
+        columns["checked"] = [record.reputable is not None
+                              for record in records]
+        return cls(columns)
+
+    def __getattr__(self, name):
+        """Return the array of the column name."""
+        try:
+            return self.__dict__["_columns"][name]
+        except KeyError:
+            raise AttributeError(f"'ResultSet' object has no attribute "
+                                 f"{name!r}") from None
+
+    @property
+    def priced(self):
+        """numpy.ndarray: Whether the price of each product is known."""
+        return self.price_cents != NO_PRICE
+
+    def __len__(self):
+        return len(self.price_cents)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, numpy.integer)):
+            return self._record(index)
+        return ResultSet({name: column[index]
+                          for name, column in self._columns.items()})
+
+    def __iter__(self):
+        """Iterate over the ProductRecord of each product, in order."""
+        for index in range(len(self)):
+            yield self._record(index)
+
+    def _record(self, index):
+        """Return the ProductRecord of the product at index."""
+        values = {name: column[index]
+                  for name, column in self._columns.items()}
+        price_cents = int(values["price_cents"])
+        return ProductRecord(
+            values["link"], values["title"],
+            None if price_cents == NO_PRICE else price_cents,
+            bool(values["no_interest"]), bool(values["free_shipping"]),
+            bool(values["in_sale"]), values["picture"],
+            bool(values["reputable"]) if values["checked"] else None,
+            values["item_id"])
+
+    def mask(self, price_min=None, price_max=None, **flags):
+        """Return which products are in a price range and have the flags.
+
+        Parameters
+        ----------
+        price_min
+            The minimum price, in reais, of the products. If given, the
+            products whose price is unknown are excluded.
+        price_max
+            The maximum price, in reais, of the products, its cents in-
+            cluded. If given, the products whose price is unknown are ex-
+            cluded.
+        **flags
+            The value, True or False, that each flag in FLAGS must have.
+            A product whose reputation wasn't checked is never reputable,
+            nor not reputable.
+
+        Returns
+        -------
+        numpy.ndarray
+            An array of booleans, True for each product that matches.
+
+        Raises
+        ------
+        TypeError
+            If a flag isn't in FLAGS.
+
+        """
+        np = _numpy()
+        mask = np.ones(len(self), dtype=bool)
+        if price_min is not None:
+            mask &= self.priced & (self.price_cents >= price_min * 100)
+        if price_max is not None:
+            mask &= self.priced & (self.price_cents < (price_max + 1) * 100)
+        for name, value in flags.items():
+            if name not in FLAGS:
+                raise TypeError(f"Unknown flag: {name!r}")
+            mask &= self._columns[name] == bool(value)
+            if name == "reputable":
+                mask &= self.checked
+        return mask
+
+    def sort(self, *keys):
+        """Return the set sorted by the columns in keys.
+
+        Parameters
+        ----------
+        *keys
+            The names of the columns by which the products are sorted,
+            the first being the main one, each preceded by "-" for a
+            descending order. "price" sorts by price_cents, the unknown
+            prices last in either order. Products with equal keys keep
+            their order.
+
+        Returns
+        -------
+        ResultSet
+            The sorted set.
+
+        Raises
+        ------
+        KeyError
+            If a key isn't the name of a column.
+
+        """
+        np = _numpy()
+        columns = []
+        for key in keys:
+            name = key.lstrip("-")
+            descending = key.startswith("-")
+            if name == "price":
+                name = "price_cents"
+            if name not in COLUMNS:
+                raise KeyError(f"Unknown column: {name!r}")
+            column = self._columns[name]
+            if column.dtype == object:
+                # the rank of each string, as lexsort can't compare them
+                column = np.unique(column.astype(str), return_inverse=True)[1]
+            if name == "price_cents":
+                columns.append(~self.priced)
+            column = column.astype(np.int64)
+            columns.append(-column if descending else column)
+        # lexsort sorts by the last key first, and is stable
+        return self[np.lexsort(columns[::-1])] if columns else self[:]
+
+    def to_pandas(self):
+        """Return the set as a pandas DataFrame.
+
+        The arrays are wrapped rather than copied row by row. The price
+        and the reputation are nullable columns, missing where the price
+        is unknown and where the reputation wasn't checked.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A frame with a column for each name in COLUMNS.
+
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("Exporting a ResultSet to pandas requires the "
+                              "pandas package. Install it with "
+                              "'pip install pandas'.") from None
+        data = {name: self._columns[name] for name in COLUMNS}
+        data["price_cents"] = pandas.arrays.IntegerArray(self.price_cents,
+                                                         ~self.priced)
+        data["reputable"] = pandas.arrays.BooleanArray(self.reputable,
+                                                       ~self.checked)
+        return pandas.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        """Return the set as a pyarrow Table.
+
+        The numeric and boolean arrays are converted as a whole. The
+        price and the reputation are null where the price is unknown and
+        where the reputation wasn't checked.
+
+        Returns
+        -------
+        pyarrow.Table
+            A table with a column for each name in COLUMNS.
+
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Exporting a ResultSet to Arrow requires the "
+                              "pyarrow package. Install it with "
+                              "'pip install pyarrow'.") from None
+        arrays = {name: pyarrow.array(self._columns[name],
+                                      type=pyarrow.string())
+                  for name in TEXTS}
+        arrays["price_cents"] = pyarrow.array(self.price_cents,
+                                              mask=~self.priced)
+        for name in FLAGS[:-1]:
+            arrays[name] = pyarrow.array(self._columns[name])
+        arrays["reputable"] = pyarrow.array(self.reputable,
+                                            mask=~self.checked)
+        return pyarrow.table({name: arrays[name] for name in COLUMNS})
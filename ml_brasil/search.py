@@ -4,16 +4,27 @@ This module is the search interface of the package. Through ML_query,
 the user may request a search with only the search term, and optional
 keyword arguments. The results by default come already processed, in
 their final form, but this behaviour can be changed with the 'process'
-argument in ML_query.
+argument in ML_query. ML_query_iter performs the same search, but yields
+each result as soon as it is ready, in the order of MercadoLivre, or the
+reputable ones by price, checking them only as they are taken, and
+ML_query_many performs many searches at once, sharing their work.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from math import isnan
 from . import parse
+from .stats import timer
+from .transport import PRODUCT_HOSTS, Transport
 
 
 def ML_query(search_term, order=1,
              min_rep=3, category='0.0',
              price_min=0, price_max=parse.INT32_MAX,
-             condition=0, aggressiveness=3, process=True):
+             condition=0, aggressiveness=3, process=True, workers=1,
+             cache=None, transport=None, records=False, stats=None,
+             flights=None, dedupe=True, shard=False, limit=None):
     """Call for the search and return ordered results.
 
     This function is the main interface of the package. ML_query is in-
@@ -44,32 +55,318 @@ def ML_query(search_term, order=1,
     aggressiveness
         The level of aggressiveness (speed) that the function will do
         html requests. The higher its value, the shorter the delay be-
-        tween requests.
+        tween requests. It sets where the pace of the requests to each
+        host starts, and how high it may adapt to, in parse.LIMITER.
     process
         Whether all products returned will be processed completely be-
         fore returning the list of products.
+    workers
+        How many search pages, or reputation checks, may be requested at
+        the same time. The delay set by 'aggressiveness' is still respec-
+        ted between the start of any two requests.
+    cache
+        A ReputationCache in which the reputation of the sellers is
+        looked up before their product pages are requested, and stored
+        after. If None, nothing is cached.
+    transport
+        The Transport whose connections are used by the search. If None,
+        a new Transport, with the default settings, is created for it,
+        and closed at the end.
+        A Transport with a ResponseCache lets a search repeated shortly
+        after reuse the pages it downloaded.
+    records
+        Whether compact ProductRecord objects, which don't keep the html
+        of the search pages in memory, are returned instead of Product
+        objects.
+    stats
+        A QueryStats in which the time spent in each stage of the search,
+        the requests it made, the time it waited for the rate limiter and
+        the hits of the caches are recorded. If None, nothing is.
+    flights
+        A SingleFlight shared with other searches, through which the
+        seller of a product found by many of them is checked only once.
+        If None, the checks are shared only within this search.
+    dedupe
+        Whether a listing found more than once, as when the pages shift
+        while the search is paginated, is kept only the first time. It
+        is skipped before its seller is checked.
+    shard
+        Whether a search with more results than MercadoLivre paginates,
+        parse.MAX_RESULTS, is split in searches of parts of the price
+        range, so that none of its results are lost. The parts are re-
+        quested at the same time by the workers.
+    limit
+        If given, only the first 'limit' products with a reputable sel-
+        ler, as per the 'order' argument, are returned. The search is
+        then sorted by MercadoLivre, and its pages are requested, and
+        the reputation of its products checked, only until they are
+        found. Such a search is never sharded, and is always deduplicat-
+        ed, so 'shard' must be False and 'dedupe' True.
 
     Returns
     -------
-    list[Product]
-        A list of which each element is a Product object, ordered as per
-        the 'order' argument.
+    parse.ProductList
+        A list of which each element is a Product object, or a Product-
+        Record object if 'records' is True, ordered as per the 'order'
+        argument. The products may also be looked up by their item id.
+
+    Raises
+    ------
+    ValueError
+        If 'limit' is given along with 'shard', or without 'dedupe'.
+
+    """
+    if limit is not None:
+        if shard or not dedupe:
+            raise ValueError("A search with a limit can't be sharded, and "
+                             "is always deduplicated")
+        return parse.ProductList(_iter_first(
+            limit, search_term, order, min_rep, category, price_min,
+            price_max, condition, aggressiveness, process, workers, cache,
+            transport, records, stats, flights))
+    products = parse.ProductList(ML_query_iter(
+        search_term, min_rep, category, price_min, price_max, condition,
+        aggressiveness, process, workers, cache, transport, records, stats,
+        flights, dedupe, shard))
+    if order:
+        products.sort(key=_price_key(order))
+    return products
+
+
+def ML_query_iter(search_term, min_rep=3, category='0.0',
+                  price_min=0, price_max=parse.INT32_MAX,
+                  condition=0, aggressiveness=3, process=True, workers=1,
+                  cache=None, transport=None, records=False, stats=None,
+                  flights=None, dedupe=True, shard=False, order=0):
+    """Call for the search and yield the results as soon as they are ready.
+
+    The streaming version of ML_query. Each search page is parsed as
+    soon as it arrives, and its products are yielded, once processed,
+    while the next pages are still to be requested. As the results are
+    only known as the search goes, they come in MercadoLivre's order
+    ('relevance'), unless 'order' is given. Please refer to the documen-
+    tation of ML_query for the meaning of the other arguments.
+
+    Parameters
+    ----------
+    order
+        If 1 or 2, the products are yielded from the lowest or the high-
+        est price, respectively, and every search page is requested be-
+        fore the first product is yielded. If 'process' is True, the re-
+        putation of a product is checked only when the ones before it
+        have been taken, so that taking the first few products costs
+        about as many checks.
+
+    Yields
+    ------
+    Product or ProductRecord
+        Each product found by the search, in MercadoLivre's order, or in
+        the order of their prices.
 
     """
     search_term = search_term.strip()
     if len(search_term) < 2:
-        return []
-
-    products = parse.get_all_products(parse.get_search_pages(search_term,
-                                                             category,
-                                                             price_min,
-                                                             price_max,
-                                                             condition,
-                                                             aggressiveness),
-                                      min_rep=min_rep,
-                                      process=process)
+        return
     if order:
-        products = sorted(products,
-                          key=lambda p: p.price,
-                          reverse=(order == 2))
-    return products
+        yield from _iter_ranked(
+            search_term, order, min_rep, category, price_min, price_max,
+            condition, aggressiveness, process, workers, cache, transport,
+            records, stats, flights, dedupe, shard)
+        return
+
+    with timer(stats, "query"), _connected(
+            transport, workers, category, process and min_rep > 0,
+            aggressiveness) as transport:
+        yield from parse.iter_products(
+            parse.iter_search_pages(search_term, category, price_min,
+                                    price_max, condition, aggressiveness,
+                                    transport, workers, stats, shard),
+            min_rep=min_rep, process=process, aggressiveness=aggressiveness,
+            workers=workers, cache=cache, transport=transport,
+            records=records, stats=stats, flights=flights, dedupe=dedupe)
+
+
+@contextmanager
+def _connected(transport, workers, category, check_rep, aggressiveness):
+    """Provide the Transport of a search, ready for its first requests.
+
+    The connections to the hosts of the search are opened beforehand.
+    If transport is None, a new Transport is created for the search, and
+    closed when it ends, so that its connections aren't left open.
+
+    Parameters
+    ----------
+    transport
+        The Transport given to the search, or None.
+    workers
+        How many requests the search may make at the same time.
+    category
+        The category of the search.
+    check_rep
+        Whether the product pages will be requested.
+    aggressiveness
+        The level of aggressiveness of the search.
+
+    """
+    own_transport = transport is None
+    if own_transport:
+        transport = Transport(pool_size=max(workers, 1))
+    try:
+        subdomain, _ = parse.get_cat(category)
+        transport.prewarm(f"{subdomain}.mercadolivre.com.br",
+                          *(PRODUCT_HOSTS if check_rep else ()),
+                          aggressiveness=aggressiveness)
+        yield transport
+    finally:
+        if own_transport:
+            transport.close()
+
+
+def _price_key(order):
+    """Return the key that ranks the products by price, as per order.
+
+    Products whose price couldn't be read come last in either order.
+    """
+    sign = -1 if order == 2 else 1
+
+    def key(product):
+        reais, cents = product.price
+        if isnan(reais):
+            return (1, 0, 0)
+        return (0, sign * reais, sign * cents)
+    return key
+
+
+def _iter_ranked(search_term, order, min_rep, category, price_min,
+                 price_max, condition, aggressiveness, process, workers,
+                 cache, transport, records, stats, flights, dedupe, shard):
+    """Yield the products of a search, ranked by their price.
+
+    Every search page is requested and parsed, without the reputation
+    of the products being checked. If process is True, parse.iter_re-
+    putable then checks them only as they are taken, from the best
+    ranked, and yields every one of them once checked. Otherwise, every
+    product is yielded, unchecked. Please refer to the documentation of ML_query_-
+    iter for the meaning of the arguments.
+    """
+    with timer(stats, "query"), _connected(
+            transport, workers, category, process and min_rep > 0,
+            aggressiveness) as transport:
+        products = parse.get_all_products(
+            parse.get_search_pages(search_term, category, price_min,
+                                   price_max, condition, aggressiveness,
+                                   transport, workers, stats, shard),
+            min_rep, aggressiveness=aggressiveness, check_rep=False,
+            cache=cache, transport=transport, stats=stats, flights=flights,
+            dedupe=dedupe)
+        if process:
+            ranked = parse.iter_reputable(products, workers,
+                                          key=_price_key(order), every=True)
+        else:
+            ranked = (product for product in
+                      sorted(products, key=_price_key(order)))
+        try:
+            for product in ranked:
+                if records:
+                    product = parse.ProductRecord.from_product(product)
+                yield product
+        finally:
+            ranked.close()
+
+
+def _iter_first(limit, search_term, order, min_rep, category, price_min,
+                price_max, condition, aggressiveness, process, workers,
+                cache, transport, records, stats, flights):
+    """Yield the first 'limit' reputable products of a search, in order.
+
+    The search is sorted by MercadoLivre as per 'order', and its pages
+    are requested one at a time, the next one only while the products
+    of the previous are checked, so that the search stops as soon as
+    'limit' products are found: no product of a later page can come
+    before them. Please refer to the documentation of ML_query for the
+    meaning of the arguments.
+    """
+    search_term = search_term.strip()
+    if len(search_term) < 2 or limit < 1:
+        return
+
+    with timer(stats, "query"), _connected(
+            transport, workers, category, min_rep > 0,
+            aggressiveness) as transport:
+        products = parse.iter_products(
+            parse.iter_search_pages(search_term, category, price_min,
+                                    price_max, condition, aggressiveness,
+                                    transport, 1, stats, order=order),
+            min_rep=min_rep, process=process, aggressiveness=aggressiveness,
+            check_rep=False, cache=cache, transport=transport, stats=stats,
+            flights=flights, dedupe=True)
+        reputable = parse.iter_reputable(products, workers)
+        try:
+            for product in islice(reputable, limit):
+                if records:
+                    product = parse.ProductRecord.from_product(product)
+                yield product
+        finally:
+            reputable.close()
+            products.close()
+
+
+def ML_query_many(queries, parallel=4, cache=None, transport=None,
+                  stats=None, **arguments):
+    """Perform many searches at once, sharing their work.
+
+    The searches run at the same time, all of them through the same
+    Transport, paced by the same parse.LIMITER and with the same
+    ReputationCache. The seller of a product found by more than one
+    search, with the same min_rep, is checked only once, even if the
+    searches find it at the same time, so that the time taken grows with
+    the products that are different, not with the number of searches.
+
+    Parameters
+    ----------
+    queries
+        The searches. Each is either a search term, or a dict of argu-
+        ments of ML_query, with at least the 'search_term'.
+    parallel
+        How many searches may run at the same time.
+    cache
+        The ReputationCache shared by the searches. If None, the ranks
+        of the sellers are shared by the searches only while they run.
+    transport
+        The Transport shared by the searches. If None, a new Transport,
+        with connections enough for every worker of every search, is
+        created for them and closed at the end.
+    stats
+        A QueryStats in which every search is recorded. If None, nothing
+        is recorded.
+    **arguments
+        Arguments of ML_query, such as 'min_rep' or 'workers', for every
+        search whose dict doesn't set them.
+
+    Returns
+    -------
+    list[parse.ProductList]
+        The results of each search, in the order of queries. Please
+        refer to the documentation of ML_query for their type and order.
+
+    """
+    queries = [{"search_term": query} if isinstance(query, str) else query
+               for query in queries]
+    flights = parse.SingleFlight()
+    own_transport = transport is None
+    if own_transport:
+        workers = max([query.get("workers", arguments.get("workers", 1))
+                       for query in queries], default=1)
+        transport = Transport(pool_size=max(parallel * workers, 1))
+
+    def search(query):
+        return ML_query(**{**arguments, **query, "cache": cache,
+                           "transport": transport, "stats": stats,
+                           "flights": flights})
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as pool:
+            return list(pool.map(search, queries))
+    finally:
+        if own_transport:
+            transport.close()
@@ -0,0 +1,416 @@
+"""Imitate MercadoLivre locally, for tests and benchmarks.
+
+This module contains the Simulator, a local HTTP server that answers the
+requests of the package as MercadoLivre would: search pages for the
+subdomain and suffix of each category, with the number of results and
+the tags of the products, product pages with the seller thermometer
+card, and 404 past the last page of a search. The number of results,
+the latency of the responses and the throttling of the requests are
+configurable, so that the speed of the package, and how it behaves when
+the server struggles, can be measured without hitting the real site.
+
+The requests are sent to the Simulator by a Transport created with its
+origin, which keeps the original host in the Host header:
+
+>>> with Simulator(results=300) as simulator:
+...     products = ML_query("celular", transport=simulator.transport())
+"""
+import random
+from collections import Counter
+from html import escape
+from math import log
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from re import compile
+from threading import Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import unquote, urlsplit
+from . import parse
+from .transport import PRODUCT_HOSTS, Transport
+
+FILTER = compile(r"_(Desde|PriceRange|ITEM\*CONDITION|OrderId)_([^_/]+)")
+"""re.Pattern: Matches each filter of a search url, and its value"""
+
+CONDITION_IDS = {"2230284": 1, "2230581": 2}
+"""dict: The condition of the products, by the id in the search url"""
+
+SLUG = compile(r"[^a-z0-9]+")
+"""re.Pattern: Matches what is replaced by a dash in the link of a product"""
+
+_PRODUCT = (
+    '<li class="{result_class} "><div class="rowItem item product-item '
+    'highlighted item--stack {condition}" id="{item_id}"><div class="item__'
+    'image item__image--stack"><div class="images-viewer" item-url="{link}"'
+    ' item-id="{item_id}"><div class="image-content"><a href="{link}" class'
+    '="figure item-image item__js-link"><img class="lazy-load" width="160" '
+    'height="160" alt="{title}" src="https://http2.mlstatic.com/D_NQ_NP_'
+    '{number}-V.webp"></a></div></div></div><div class="item__info-containe'
+    'r highlighted"><div class="item__info item--show-right-col"><h2 class='
+    '"item__title list-view-item-title"><a href="{link}" class="item__info-'
+    'title"><span class="main-title"> {title} </span></a>{brand}</h2><div '
+    'class="price__container">{old_price}<div class="item__price"><span '
+    'class="price__symbol">R$</span> <span class="price__fraction">{price}'
+    '</span>{cents}</div>{discount}</div><div class="item__stack_column '
+    'highlighted"><div class="item__stack_column__info">{installments}'
+    '{shipping}</div></div></div></div></div></li>')
+"""The tag of a product in a search page, as in MercadoLivre's."""
+
+
+def lognormal(median, sigma=0.5):
+    """Return a lognormal distribution of latencies, for the Simulator.
+
+    Parameters
+    ----------
+    median
+        The median latency, in seconds.
+    sigma
+        The standard deviation of the logarithm of the latency. The
+        larger it is, the longer the tail of slow responses.
+
+    Returns
+    -------
+    callable
+        A function that returns a random latency every time it is called.
+
+    """
+    mu = log(median)
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+def _format_number(number):
+    """Write an integer with dots separating the thousands."""
+    return f"{number:,}".replace(",", ".")
+
+
+class Simulator:
+    """A local HTTP server that imitates MercadoLivre.
+
+    Every search, whatever its term or category, has 'results' products,
+    generated from a seed so that the same search always has the same
+    results, of which only the ones within the price range and condition
+    of the search are returned. Each product has its own product page,
+    with a seller thermometer, or the marker of 'catalogue' listings.
+
+    The counters of the requests answered, by kind ("search", "product",
+    "not_found", "throttled" and "head"), are kept in 'requests'.
+
+    """
+
+    def __init__(self, results=500, latency=0, rate_limit=None, burst=10,
+                 throttle=0.0, page_size=0, max_depth=parse.MAX_RESULTS,
+                 seed=0, port=0):
+        """Initialize the Simulator, which isn't started yet.
+
+        Parameters
+        ----------
+        results
+            How many products a search has before it is filtered, or a
+            dict mapping a search term to that number.
+        latency
+            The seconds the server waits before each response, or a func-
+            tion that returns them, such as the one of lognormal.
+        rate_limit
+            How many requests per second each host accepts before an-
+            swering 429. If None, the requests aren't limited.
+        burst
+            How many requests above rate_limit each host accepts at once.
+        throttle
+            The probability of any request being answered with 429.
+        page_size
+            How many bytes of filler each product page has before the
+            seller thermometer, as the real pages are large.
+        max_depth
+            How deep a search can be paginated. Pages starting beyond it
+            are answered with 404.
+        seed
+            The seed from which the products are generated.
+        port
+            The port the server listens on. If 0, a free one is chosen.
+
+        """
+        self.results = results
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.throttle = throttle
+        self.page_size = page_size
+        self.max_depth = max_depth
+        self.seed = seed
+        self.requests = Counter()
+        self._lock = Lock()
+        self._next_allowed = {}
+        self._catalogues = {}
+        self._pages = {}
+        self._categories = {(category.subdomain, category.suffix)
+                            for category in parse.REGISTRY}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def origin(self):
+        """str: The scheme, host and port the Simulator is listening on."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start answering requests, in a background thread."""
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop answering requests, and close the server."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def transport(self, **kwargs):
+        """Return a Transport that sends its requests to the Simulator.
+
+        Parameters
+        ----------
+        **kwargs
+            Passed on to Transport.
+
+        Returns
+        -------
+        Transport
+            The new Transport.
+
+        """
+        return Transport(origin=self.origin, **kwargs)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def catalogue(self, term):
+        """Return every product of a search for term, before filtering.
+
+        Parameters
+        ----------
+        term
+            The search term.
+
+        Returns
+        -------
+        list[dict]
+            The fields of each product, in the order of relevance.
+
+        """
+        with self._lock:
+            products = self._catalogues.get(term)
+            if products is None:
+                products = self._catalogues[term] = self._generate(term)
+                self._pages.update((product["link"].split("?")[0], product)
+                                   for product in products)
+        return products
+
+    def _generate(self, term):
+        """Generate the products of a search for term."""
+        count = (self.results.get(term, 0) if isinstance(self.results, dict)
+                 else self.results)
+        rng = random.Random(f"{self.seed}:{term}")
+        levels = parse.Product._THERMOMETER_LEVELS
+        products = []
+        for index in range(count):
+            number = rng.randrange(10**9, 10**10)
+            catalogue = rng.random() < 0.1
+            slug = SLUG.sub("-", f"{term}-{index}".lower())
+            products.append({
+                "item_id": f"MLB{number}",
+                "number": number,
+                "title": escape(f"{term.title()} {index}"),
+                "price": rng.randrange(10, 10000),
+                "cents": rng.choice((0, 0, rng.randrange(1, 100))),
+                "condition": rng.choice((1, 1, 2)),
+                "link": (f"https://www.mercadolivre.com.br/{slug}/p/"
+                         f"MLB{number}?source=search" if catalogue else
+                         f"https://produto.mercadolivre.com.br/"
+                         f"MLB-{number}-{slug}-_JM"),
+                "catalogue": catalogue,
+                "level": rng.choice((*levels, levels[-1], None)),
+                "store": rng.random() < 0.2,
+                "no_interest": rng.random() < 0.5,
+                "free_shipping": rng.random() < 0.5,
+                "in_sale": rng.random() < 0.2})
+        return products
+
+    def _throttled(self, host):
+        """Whether the request to host must be answered with 429."""
+        if self.throttle and random.random() < self.throttle:
+            return True
+        if self.rate_limit is None:
+            return False
+        with self._lock:
+            now = monotonic()
+            allowed = self._next_allowed.get(host, now)
+            if allowed > now + self.burst / self.rate_limit:
+                return True
+            self._next_allowed[host] = max(allowed, now) + 1 / self.rate_limit
+        return False
+
+    def search_page(self, host, path):
+        """Return the search page for a url, or None if it doesn't exist.
+
+        Parameters
+        ----------
+        host
+            The host of the url.
+        path
+            The path of the url.
+
+        Returns
+        -------
+        str or None
+            The html of the page.
+
+        """
+        subdomain = host.split(".", 1)[0]
+        path = path.lstrip("/")
+        suffix = max((suffix for sub, suffix in self._categories
+                      if sub == subdomain and path.startswith(suffix)),
+                     key=len, default=None)
+        first = FILTER.search(path)
+        if suffix is None or first is None:
+            return None
+        term = path[len(suffix):first.start()]
+        if "/" in term:  # the term is quoted, so this is an unknown suffix
+            return None
+        term = unquote(term)
+        filters = dict(FILTER.findall(path))
+        index = int(filters.get("Desde", 1))
+        price_min, price_max = map(int, filters.get(
+            "PriceRange", f"0-{parse.INT32_MAX}").split("-"))
+        condition = CONDITION_IDS.get(filters.get("ITEM*CONDITION"))
+        products = [product for product in self.catalogue(term)
+                    if price_min <= product["price"] <= price_max
+                    and condition in (None, product["condition"])]
+        if filters.get("OrderId") in ("PRICE", "PRICE*DESC"):
+            products.sort(key=lambda product: (product["price"],
+                                               product["cents"]),
+                          reverse=filters["OrderId"] == "PRICE*DESC")
+        if index > 1 and (index > len(products) or index > self.max_depth):
+            return None
+        page = products[index - 1:index - 1 + parse.RESULTS_PER_PAGE]
+        return (f'<html><body><div class="quantity-results">'
+                f' {_format_number(len(products))} resultados</div>'
+                f'<ol id="searchResults">'
+                f'{"".join(map(self._product_tag, page))}</ol></body></html>')
+
+    def product_page(self, host, path):
+        """Return the product page for a url, or None if it doesn't exist.
+
+        Parameters
+        ----------
+        host
+            The host of the url.
+        path
+            The path of the url.
+
+        Returns
+        -------
+        str or None
+            The html of the page.
+
+        """
+        product = self._pages.get(f"https://{host.lower()}{unquote(path)}")
+        if product is None:
+            return None
+        filler = "<p>" + "x" * max(self.page_size - 7, 0) + "</p>"
+        if product["catalogue"]:
+            card = ('<h2 class="ui-pdp-other-sellers__title">'
+                    'Outras opções de compra</h2>')
+        elif product["level"] is None:
+            card = ""
+        else:
+            card = (f'<div class="card-section seller-thermometer"><ol '
+                    f'class="thermometer"><li class="thermometer__level '
+                    f'{product["level"]}"></li></ol></div>')
+        return (f"<html><body><h1>{product['title']}</h1>{filler}{card}"
+                f"</body></html>")
+
+    @staticmethod
+    def _product_tag(product):
+        """Return the tag of a product for a search page."""
+        return _PRODUCT.format(
+            result_class=parse.RESULT_CLASS,
+            condition=("new", "new", "used")[product["condition"]],
+            brand=('<div class="item__brand"><a class="item__brand-link" '
+                   f'href="https://loja.mercadolivre.com.br/loja-'
+                   f'{product["number"] % 100}"><span>por Loja</span></a>'
+                   '</div>' if product["store"] else ""),
+            old_price=('<span class="price-old"><del> R$&nbsp;'
+                       f'{_format_number(product["price"] * 2)} </del></span>'
+                       if product["in_sale"] else ""),
+            price=_format_number(product["price"]),
+            cents=(f'<span class="price__decimals">{product["cents"]:02}'
+                   '</span>' if product["cents"] else ""),
+            discount=('<div class="item__discount">50% OFF</div>'
+                      if product["in_sale"] else ""),
+            installments=('<div class="stack_column_item installments '
+                          'highlighted"><span class="item-installments '
+                          'free-interest"> 12x sem juros </span></div>'
+                          if product["no_interest"] else ""),
+            shipping=('<div class="stack_column_item shipping highlighted">'
+                      '<span class="text-shipping">Frete grátis</span></div>'
+                      if product["free_shipping"] else ""),
+            **{key: product[key] for key in ("item_id", "link", "title",
+                                             "number")})
+
+    def _handler(self):
+        """Return the request handler class bound to the Simulator."""
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # the headers and the body are separate writes, which Nagle's
+            # algorithm would hold back for a delayed ACK on every page
+            disable_nagle_algorithm = True
+
+            def do_HEAD(self):
+                with simulator._lock:
+                    simulator.requests["head"] += 1
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                latency = simulator.latency
+                latency = latency() if callable(latency) else latency
+                if latency > 0:
+                    sleep(latency)
+                host = self.headers.get("Host", "lista.mercadolivre.com.br")
+                path = urlsplit(self.path).path
+                if simulator._throttled(host):
+                    return self._answer("throttled", 429, "",
+                                        {"Retry-After": "1"})
+                if host.lower() in PRODUCT_HOSTS:
+                    kind, page = "product", simulator.product_page(host, path)
+                else:
+                    kind, page = "search", simulator.search_page(host, path)
+                if page is None:
+                    return self._answer("not_found", 404, "")
+                self._answer(kind, 200, page)
+
+            def _answer(self, kind, status, page, headers=()):
+                with simulator._lock:
+                    simulator.requests[kind] += 1
+                body = page.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for header in dict(headers).items():
+                    self.send_header(*header)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
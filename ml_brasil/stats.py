@@ -0,0 +1,233 @@
+"""Measure where the time of a search goes.
+
+This module contains QueryStats, an object in which a search records,
+when one is given to it, how long each of its stages took, the requests
+it made to each host, the time it waited for the rate limiter, how much
+the caches helped and which urls were the slowest to respond. It lets
+'aggressiveness' and 'workers' be tuned from data instead of guesses:
+
+>>> stats = QueryStats()
+>>> products = ML_query("celular", workers=8, stats=stats)
+>>> print(stats)
+"""
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from heapq import heappush, heappushpop
+from threading import Lock
+from time import perf_counter
+from urllib.parse import urlsplit
+
+STAGES = ("query", "search", "parse", "extract", "reputation")
+"""tuple[str]: The stages of a search that are timed, in order
+
+'query' is the whole search, and the others the time spent requesting
+the search pages, building the trees of their products, reading the
+fields of the products and checking the reputation of the sellers.
+"""
+
+
+def timer(stats, stage):
+    """Return a context manager that times stage, if there are stats.
+
+    Parameters
+    ----------
+    stats
+        The QueryStats of the search, or None.
+    stage
+        The name of the stage, one of STAGES.
+
+    Returns
+    -------
+    contextmanager
+        QueryStats.stage, or a context manager that does nothing if
+        stats is None.
+
+    """
+    return nullcontext() if stats is None else stats.stage(stage)
+
+
+class QueryStats:
+    """The timing and counters of a search.
+
+    The time of each stage is the sum of the time spent in it by every
+    thread, so, when requests run at the same time, the stages may add
+    up to more than the 'query' stage, which is the wall time of the
+    search. Every method may be called from many threads.
+
+    Attributes
+    ----------
+    stages
+        A Counter of the seconds spent in each stage.
+    requests
+        A Counter of the requests made to each host.
+    bytes
+        A Counter of the bytes of the bodies received from each host.
+    statuses
+        A Counter of the responses with each status code.
+    throttle_wait
+        The seconds spent waiting for the rate limiter.
+    cache
+        The Counters of the hits and misses of the "reputation" cache and
+        of the "response" cache of the transport.
+
+    """
+
+    slowest_count = 10
+    """How many of the slowest urls are kept."""
+
+    def __init__(self):
+        """Initialize the stats of a search, with every counter at zero."""
+        self.stages = Counter()
+        self.requests = Counter()
+        self.bytes = Counter()
+        self.statuses = Counter()
+        self.throttle_wait = 0.0
+        self.cache = {"reputation": Counter(), "response": Counter()}
+        self._slowest = []
+        self._lock = Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the code run in the context, adding it to stage name.
+
+        Parameters
+        ----------
+        name
+            The name of the stage, one of STAGES.
+
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            with self._lock:
+                self.stages[name] += elapsed
+
+    def request(self, url, status, seconds, waited=0.0, size=None):
+        """Record a request made by the search.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+        status
+            The status code of the response.
+        seconds
+            How long the server took to respond.
+        waited
+            How long the request waited for the rate limiter.
+        size
+            How many bytes of the body were received, if already known.
+
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            self.requests[host] += 1
+            self.statuses[status] += 1
+            self.throttle_wait += waited
+            if size:
+                self.bytes[host] += size
+            if len(self._slowest) < self.slowest_count:
+                heappush(self._slowest, (seconds, url))
+            else:
+                heappushpop(self._slowest, (seconds, url))
+
+    def received(self, url, size):
+        """Record the bytes received for url after the request was made.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+        size
+            How many bytes of the body were received.
+
+        """
+        with self._lock:
+            self.bytes[urlsplit(url).netloc] += size
+
+    def lookup(self, cache, hit):
+        """Record a lookup in one of the caches.
+
+        Parameters
+        ----------
+        cache
+            "reputation" for the ReputationCache, "response" for the
+            ResponseCache of the transport.
+        hit
+            Whether the entry was found in the cache.
+
+        """
+        with self._lock:
+            self.cache[cache]["hit" if hit else "miss"] += 1
+
+    def hit_rate(self, cache):
+        """Return the fraction of the lookups in cache that were hits.
+
+        Parameters
+        ----------
+        cache
+            "reputation" or "response".
+
+        Returns
+        -------
+        float or None
+            The hit rate, or None if there were no lookups.
+
+        """
+        counts = self.cache[cache]
+        total = counts["hit"] + counts["miss"]
+        return counts["hit"] / total if total else None
+
+    def slowest(self):
+        """Return the slowest urls requested, the slowest first.
+
+        Returns
+        -------
+        list[tuple[float, str]]
+            The seconds each url took to respond, and the url.
+
+        """
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def as_dict(self):
+        """Return every stat in a dict of builtin types, for JSON.
+
+        Returns
+        -------
+        dict
+            The stats, by the name of the attributes.
+
+        """
+        with self._lock:
+            return {"stages": dict(self.stages),
+                    "requests": dict(self.requests),
+                    "bytes": dict(self.bytes),
+                    "statuses": dict(self.statuses),
+                    "throttle_wait": self.throttle_wait,
+                    "cache": {name: dict(counts)
+                              for name, counts in self.cache.items()},
+                    "slowest": sorted(self._slowest, reverse=True)}
+
+    def __str__(self):
+        """Return a human readable report of the stats."""
+        lines = ["Etapas:"]
+        lines += [f"  {name:<12}{self.stages[name]:>10.3f} s"
+                  for name in STAGES if name in self.stages]
+        lines.append("Requisições:")
+        lines += [f"  {host:<32}{count:>6}{self.bytes[host] // 1024:>10} KiB"
+                  for host, count in self.requests.most_common()]
+        lines.append("Códigos: " + ", ".join(
+            f"{status}: {count}" for status, count
+            in sorted(self.statuses.items())))
+        lines.append(f"Espera do limitador: {self.throttle_wait:.3f} s")
+        for name in self.cache:
+            rate = self.hit_rate(name)
+            if rate is not None:
+                lines.append(f"Acertos no cache ({name}): {rate:.0%}")
+        lines.append("Mais lentas:")
+        lines += [f"  {seconds:>7.3f} s  {url}"
+                  for seconds, url in self.slowest()]
+        return "\n".join(lines)
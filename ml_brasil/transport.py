@@ -0,0 +1,221 @@
+"""Manage the connections made to MercadoLivre.
+
+This module contains the Transport class, which owns the connections
+used by a search. All requests of a search, for the search pages and
+for the product pages, go through the same pooled session, so that the
+TCP and TLS connections to each host are opened once and then kept
+alive, instead of being opened again for every request. A Transport may
+also keep the pages it receives in a ResponseCache, so that a search
+repeated shortly after doesn't download them again.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+
+CONNECT_TIMEOUT = 5
+"""float: Seconds to wait for a connection to be established"""
+
+READ_TIMEOUT = 30
+"""float: Seconds to wait between bytes received from the server"""
+
+PRODUCT_HOSTS = ("produto.mercadolivre.com.br", "www.mercadolivre.com.br")
+"""tuple[str]: The hosts that serve the product pages"""
+
+_default = None
+_default_lock = Lock()
+
+
+class Transport:
+    """The pooled connections used by a search.
+
+    A Transport holds a requests Session whose connections are kept
+    alive and reused, with a pool of connections for each host. Every
+    request has connect and read timeouts, so a stalled connection
+    raises an exception instead of hanging the search forever. If it
+    has a ResponseCache, the fresh pages in it are returned without any
+    request, and the stale ones are revalidated with the server.
+
+    """
+
+    def __init__(self, pool_size=10, pool_sizes=None,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 cache=None, origin=None):
+        """Initialize the session and its pools of connections.
+
+        Parameters
+        ----------
+        pool_size
+            How many connections are kept alive for each host.
+        pool_sizes
+            A dict mapping a host to the number of connections kept alive
+            for it, overriding pool_size for that host.
+        connect_timeout
+            Seconds to wait for a connection to be established.
+        read_timeout
+            Seconds to wait between bytes received from the server.
+        cache
+            A ResponseCache in which the responses are looked up before
+            being requested, and stored after. If None, nothing is cached.
+        origin
+            The scheme, host and port, such as "http://127.0.0.1:8000",
+            to which every request is sent instead, with the original
+            host in the Host header. Used to search on a Simulator.
+
+        """
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.origin = origin
+        self._warmed = set()
+        self._lock = Lock()
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        for host, size in (pool_sizes or {}).items():
+            self.session.mount(f"https://{host}/",
+                               HTTPAdapter(pool_connections=1,
+                                           pool_maxsize=size))
+
+    def get(self, url, **kwargs):
+        """Request url with the session and its timeouts.
+
+        With a cache, a successful response is read in full, even if it
+        was requested with stream=True, so that it can be stored.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+        **kwargs
+            Passed on to requests.Session.get.
+
+        Returns
+        -------
+        requests.Response
+            The response of the server.
+
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if self.cache is None:
+            return self._send(url, **kwargs)
+        response, validators = self.cache.lookup(url)
+        if response is not None:
+            return response
+        if validators:
+            kwargs["headers"] = {**validators,
+                                 **(kwargs.get("headers") or {})}
+        response = self._send(url, **kwargs)
+        if response.status_code == 304 and validators:
+            cached = self.cache.revalidate(url)
+            if cached is not None:
+                response.close()
+                return cached
+        elif response.status_code == 200:
+            self.cache.set(url, response)
+        return response
+
+    def cached(self, url):
+        """Return the fresh response for url in the cache, if there is any.
+
+        Parameters
+        ----------
+        url
+            The url requested.
+
+        Returns
+        -------
+        requests.Response or None
+            The cached response, or None if there is no cache or no fresh
+            entry for url in it.
+
+        """
+        if self.cache is None:
+            return None
+        return self.cache.lookup(url)[0]
+
+    def prewarm(self, *hosts, aggressiveness=3):
+        """Open, at the same time, a connection to each of the hosts.
+
+        The connections are then kept in the pool, ready for the first
+        requests of the search. Each host is connected to only once by
+        the Transport, so that the searches that share it after the first
+        don't wait for a request that their connections don't need, and
+        the requests are paced by parse.LIMITER, as every other request.
+        Failures are ignored, as they will show up again, and be raised,
+        when the hosts are actually requested.
+
+        Parameters
+        ----------
+        *hosts
+            The hosts to connect to, such as the subdomain of a category
+            returned by get_cat, followed by ".mercadolivre.com.br".
+        aggressiveness
+            The level of aggressiveness of the search, by which the re-
+            quests are paced.
+
+        """
+        from requests import RequestException
+        from .parse import LIMITER
+
+        def connect(host):
+            url, headers = self._route(f"https://{host}/")
+            LIMITER.wait(host, aggressiveness)
+            try:
+                self.session.head(url, headers=headers, timeout=self.timeout)
+            except RequestException:
+                pass
+
+        with self._lock:
+            hosts = [host for host in dict.fromkeys(hosts)
+                     if host not in self._warmed]
+            self._warmed.update(hosts)
+        if hosts:
+            with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+                list(pool.map(connect, hosts))
+
+    def _send(self, url, **kwargs):
+        """Request url, or its route to the origin, with the session."""
+        url, headers = self._route(url)
+        if headers:
+            kwargs["headers"] = {**headers, **(kwargs.get("headers") or {})}
+        return self.session.get(url, **kwargs)
+
+    def _route(self, url):
+        """Return where url is requested, and the headers that it needs."""
+        if self.origin is None:
+            return url, {}
+        parts = urlsplit(url)
+        query = f"?{parts.query}" if parts.query else ""
+        return f"{self.origin}{parts.path}{query}", {"Host": parts.netloc}
+
+    def close(self):
+        """Close every connection kept by the session."""
+        self.session.close()
+        with self._lock:
+            self._warmed.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def default():
+    """Return the Transport shared by the requests that have none.
+
+    Returns
+    -------
+    Transport
+        The same Transport in every call, created in the first one.
+
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Transport()
+    return _default
@@ -2,13 +2,17 @@ import ml_brasil
 import csv
 from datetime import datetime
 
+WORKERS = 4
+"""int: How many reputation checks may be running at the same time"""
+
 
 def print_cats():
-    for father_cat in ml_brasil.parse.CATS:
-        print(f"{father_cat[0][0]} ---> {father_cat[0][1]}:")
+    registry = ml_brasil.parse.REGISTRY
+    for number, name in registry.parents():
+        print(f"{number} ---> {name}:")
         print()
-        for cat in father_cat[1]:
-            print(f"{father_cat[0][0]}.{cat['number']} -> {cat['name']}")
+        for cat in registry.children(number):
+            print(f"{cat.id} -> {cat.name}")
         print()
 
 
@@ -108,10 +112,11 @@ if __name__ == "__main__":
             order = 1
             min_rep = 3
 
-        products = ml_brasil.ML_query(search_term, order,
-                                      min_rep, *args, process=False)
         print("RESULTADOS:\n")
-        for product in products:
+        products = []
+        for product in ml_brasil.ML_query_iter(search_term, min_rep, *args,
+                                               workers=WORKERS, order=order):
+            products.append(product)
             if product.reputable:
                 print(product)
                 print()
@@ -1,8 +1,22 @@
 import unittest
-from re import search, match, compile
+from re import search, match, compile, findall
 from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
 from random import choice, randint
 from math import isnan
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import zlib
+from tempfile import TemporaryDirectory
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlsplit
+from time import monotonic, sleep
+import requests
+import importlib.util
+import subprocess
 import sys
 
 try:
@@ -569,5 +583,2035 @@ class TestIsReputable(unittest.TestCase):
         # would break fairly frequently.
 
 
+class TestRateLimiter(unittest.TestCase):
+    """Test the behaviour of the class RateLimiter.
+
+    What is tested
+    --------------
+    - the first reservation doesn't have to wait
+    - reservations are spaced by the rate of the aggressiveness
+    - each host has its own bucket
+    - concurrent reservations never share a token
+    - the rate backs off on 429/503 and ramps up slowly on success
+    - a burst of 429 answers backs off only once
+    - the rate never goes above the ceiling of the aggressiveness
+
+    """
+
+    def test_first_reservation_is_immediate(self):
+        """Test that a new limiter doesn't delay the first request."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        self.assertEqual(limiter.reserve("a", 1), 0)
+
+    def test_reservations_are_spaced(self):
+        """Test that each reservation waits for the previous token."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        delays = [limiter.reserve("a", 1) for _ in range(3)]
+        self.assertAlmostEqual(delays[1], 0.5, places=2)
+        self.assertAlmostEqual(delays[2], 1, places=2)
+
+    def test_hosts_are_independent(self):
+        """Test that requests to another host don't wait."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        limiter.reserve("a", 1)
+        self.assertEqual(limiter.reserve("b", 1), 0)
+
+    def test_concurrent_reservations_are_unique(self):
+        """Test that threads reserving together get distinct tokens."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            delays = sorted(pool.map(lambda _: limiter.reserve("a", 0),
+                                     range(32)))
+        for former, curr in zip(delays, delays[1:]):
+            self.assertAlmostEqual(curr - former, 1, places=1)
+
+    def test_backs_off_and_ramps_up(self):
+        """Test that throttling halves the rate, and successes regrow it."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        limiter.reserve("a", 2)
+        limiter.feedback("a", 429, 0.1)
+        self.assertEqual(limiter.rate("a"), 2)
+        limiter.feedback("a", 200, 0.1)
+        self.assertAlmostEqual(limiter.rate("a"), 2.2)
+
+    def test_backs_off_once_per_burst(self):
+        """Test that requests reserved before a cut don't cut it again."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        for _ in range(4):
+            limiter.reserve("a", 2)
+        for _ in range(4):
+            limiter.feedback("a", 429, 0)
+        self.assertEqual(limiter.rate("a"), 2)
+
+    def test_slow_host_backs_off(self):
+        """Test that a host much slower than usual gets a lower rate."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        limiter.reserve("a", 2)
+        limiter.feedback("a", 200, 0.1)
+        rate = limiter.rate("a")
+        limiter.feedback("a", 200, 1)
+        self.assertEqual(limiter.rate("a"), rate / 2)
+
+    def test_rate_capped_by_ceiling(self):
+        """Test that the rate stops growing at the ceiling."""
+        limiter = ml_brasil.ratelimit.RateLimiter()
+        limiter.reserve("a", 2)
+        for _ in range(1000):
+            limiter.feedback("a", 200, 0.1)
+        self.assertEqual(limiter.rate("a"),
+                         ml_brasil.ratelimit.preset(2)[1])
+
+
+class TestGetAllProductsWorkers(unittest.TestCase):
+    """Test get_all_products with a pool of reputation checkers.
+
+    What is tested
+    --------------
+    - the pool returns the same products, in the same order
+    - every product has its reputation checked by the pool
+
+    Details
+    -------
+    min_rep is set to 0 so that no request is performed.
+
+    """
+
+    PAGES = [f"<ol>{product * 3}</ol>", f"<ol>{product * 2}</ol>"]
+
+    def test_same_products_as_serial(self):
+        """Test that the pool doesn't change the returned products."""
+        serial = ml_brasil.parse.get_all_products(self.PAGES, min_rep=0)
+        pooled = ml_brasil.parse.get_all_products(self.PAGES, min_rep=0,
+                                                  workers=4)
+        self.assertEqual(len(serial), 5)
+        self.assertEqual([p.link for p in serial], [p.link for p in pooled])
+
+    def test_reputation_checked_by_pool(self):
+        """Test that the reputation is set for every product."""
+        pooled = ml_brasil.parse.get_all_products(self.PAGES, min_rep=0,
+                                                  workers=4)
+        for product_ in pooled:
+            self.assertTrue(hasattr(product_, "_reputable"))
+            self.assertTrue(product_.reputable)
+
+
+class TestAsyncSearch(unittest.TestCase):
+    """Test the behaviour of the asyncsearch module offline.
+
+    What is tested
+    --------------
+    - async_ML_query returns an empty list for a too short search term
+    - async_is_reputable stores its result in the product
+    - async_is_reputable returns True without a request if min_rep is 0
+    - the checks of a page start before the next page is requested
+    - the checks are cancelled if a page can't be requested
+    - the products whose price couldn't be read come last
+
+    """
+
+    default_min_rep = ml_brasil.parse.Product.min_rep
+
+    def tearDown(self):
+        ml_brasil.parse.Product.min_rep = self.default_min_rep
+
+    def test_short_search_term_returns_empty_list(self):
+        """Assures search term too short always returns empty list."""
+        self.assertEqual(asyncio.run(ml_brasil.async_ML_query("  a ")), [])
+
+    def test_is_reputable_without_request(self):
+        """Test that min_rep 0 sets the product as reputable."""
+        ml_brasil.parse.Product.min_rep = 0
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, process=False)
+        self.assertTrue(asyncio.run(
+            ml_brasil.asyncsearch.async_is_reputable(product_, None)))
+        self.assertTrue(product_._reputable)
+
+    def run_query(self, pages, log):
+        """Run async_ML_query on the pages, logging the requests."""
+        async def iter_search_pages(*args):
+            for page in pages:
+                await asyncio.sleep(0.01)
+                if page is None:
+                    raise RuntimeError("page not found")
+                log.append("S")
+                yield page
+
+        async def is_reputable(product, session):
+            try:
+                await asyncio.sleep(0)
+                log.append("P")
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                log.append("C")
+                raise
+
+        async def query():
+            return await ml_brasil.async_ML_query("mesa", session=False)
+
+        module = ml_brasil.asyncsearch
+        originals = module._iter_search_pages, module.async_is_reputable
+        module._iter_search_pages = iter_search_pages
+        module.async_is_reputable = is_reputable
+        try:
+            return asyncio.run(query())
+        finally:
+            module._iter_search_pages, module.async_is_reputable = originals
+
+    def test_checks_start_with_their_page(self):
+        """Test that the products are checked while pages are requested."""
+        with ml_brasil.simulator.Simulator(results=150) as simulator:
+            pages = [simulator.search_page("lista.mercadolivre.com.br",
+                                           f"/mesa_Desde_{index}")
+                     for index in (1, 51, 101)]
+        log = []
+        self.assertEqual(len(self.run_query(pages, log)), 150)
+        self.assertLess(log.index("P"), len(log) - log[::-1].index("S") - 1)
+
+    def test_checks_cancelled_on_failure(self):
+        """Test that a failed page cancels the checks already started."""
+        with ml_brasil.simulator.Simulator(results=50) as simulator:
+            pages = [simulator.search_page("lista.mercadolivre.com.br",
+                                           "/mesa_Desde_1"), None]
+        log = []
+        with self.assertRaises(RuntimeError):
+            self.run_query(pages, log)
+        self.assertEqual(log.count("C"), 50)
+
+    def test_unknown_prices_last(self):
+        """Test that the products without a price are sorted last."""
+        with ml_brasil.simulator.Simulator(results=50) as simulator:
+            page = simulator.search_page("lista.mercadolivre.com.br",
+                                         "/mesa_Desde_1")
+        page = page.replace('class="price__container"', 'class="none"', 1)
+        products = self.run_query([page], [])
+        self.assertTrue(isnan(products[-1].price[0]))
+        prices = [product.price for product in products[:-1]]
+        self.assertEqual(prices, sorted(prices))
+
+
+class TestSellerRank(unittest.TestCase):
+    """Test the behaviour of the function _seller_rank.
+
+    What is tested
+    --------------
+    - 'catalogue' pages have the highest rank
+    - pages without a thermometer have the lowest rank
+    - the rank is the first level found in the thermometer
+
+    """
+
+    LEVELS = ml_brasil.parse.Product._THERMOMETER_LEVELS
+
+    def test_catalogue_has_highest_rank(self):
+        """Test that pages with other sellers are always reputable."""
+        page = '<h2 class="ui-pdp-other-sellers__title">Outros</h2>'
+        self.assertEqual(ml_brasil.parse._seller_rank(page), len(self.LEVELS))
+
+    def test_no_thermometer_has_lowest_rank(self):
+        """Test that pages without a thermometer are never reputable."""
+        self.assertEqual(ml_brasil.parse._seller_rank("<p>404</p>"),
+                         ml_brasil.parse.NO_THERMOMETER)
+
+    def test_rank_is_first_level_found(self):
+        """Test that the rank is the index of the level in the card."""
+        for rank, level in enumerate(self.LEVELS):
+            page = (f'<div class="card-section seller-thermometer">'
+                    f'<span class="{level}"></span></div>')
+            self.assertEqual(ml_brasil.parse._seller_rank(page), rank)
+
+
+class TestReputationCache(unittest.TestCase):
+    """Test the behaviour of the class ReputationCache.
+
+    What is tested
+    --------------
+    - stored ranks are returned, unknown keys return None
+    - expired entries are not returned
+    - invalidate removes one or every entry
+    - the least recently used entries are evicted above the limit
+    - entries persist after the file is closed
+    - Product reads the rank from the cache instead of requesting it
+    - the cache doesn't change the verdict of any listing of a search
+    - the rank of a page that wasn't received isn't stored
+    - a rank is only used for the min_rep it was read for
+
+    """
+
+    def setUp(self):
+        self.cache = ml_brasil.cache.ReputationCache(":memory:")
+
+    def tearDown(self):
+        self.cache.close()
+        ml_brasil.parse.Product.cache = None
+
+    def test_get_returns_stored_rank(self):
+        """Test that what is set can be read back."""
+        self.cache.set("seller", 4)
+        self.assertEqual(self.cache.get("seller"), 4)
+        self.assertEqual(self.cache.get("unknown"), None)
+
+    def test_expired_entries_are_ignored(self):
+        """Test that entries older than the ttl are not returned."""
+        self.cache.ttl = -1
+        self.cache.set("seller", 4)
+        self.assertEqual(self.cache.get("seller"), None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        """Test that invalidate removes the requested entries."""
+        for key in ("a", "b", "c"):
+            self.cache.set(key, 1)
+        self.cache.invalidate("a")
+        self.assertEqual(self.cache.get("a"), None)
+        self.assertEqual(len(self.cache), 2)
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_evicted(self):
+        """Test that purge keeps only the most recently used entries."""
+        self.cache.max_entries = 2
+        for key in ("a", "b", "c"):
+            self.cache.set(key, 1)
+        self.cache.get("a")
+        self.cache.purge()
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get("b"), None)
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_persists_in_file(self):
+        """Test that a reopened cache file keeps its entries."""
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite3")
+            with ml_brasil.cache.ReputationCache(path) as cache:
+                cache.set("seller", 2)
+            with ml_brasil.cache.ReputationCache(path) as cache:
+                self.assertEqual(cache.get("seller"), 2)
+
+    def test_product_uses_cache(self):
+        """Test that a cached seller doesn't need to be requested."""
+        ml_brasil.parse.Product.cache = self.cache
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, process=False)
+        for min_rep in (2, 3):
+            product_.min_rep = min_rep
+            self.cache.set(product_._cache_key(), 2)
+        product_.min_rep = 2
+        self.assertTrue(product_._is_reputable())
+        product_.min_rep = 3
+        self.assertFalse(product_._is_reputable())
+
+    def test_rank_kept_for_its_min_rep(self):
+        """Test that a rank read for a min_rep isn't used for another."""
+        with ml_brasil.simulator.Simulator(results=0) as simulator:
+            product_ = ml_brasil.parse.Product(
+                PRODUCT_TAG, process=False, min_rep=1, aggressiveness=10,
+                cache=self.cache, transport=simulator.transport())
+            key = product_._cache_key()
+            self.cache.set(key, 1)
+            product_.min_rep = 4
+            self.assertNotEqual(product_._cache_key(), key)
+            self.assertFalse(product_.reputable)
+            self.assertEqual(simulator.requests["not_found"], 1)
+
+    def test_cache_keeps_verdicts(self):
+        """Test that a search finds the same sellers with the cache."""
+        with ml_brasil.simulator.Simulator(results=300) as simulator:
+            transport = simulator.transport()
+            verdicts = [[product.reputable for product in ml_brasil.ML_query(
+                "mesa", order=0, aggressiveness=10, workers=4,
+                transport=transport, cache=cache)]
+                for cache in (None, self.cache, self.cache)]
+        self.assertEqual(verdicts[1], verdicts[0])
+        self.assertEqual(verdicts[2], verdicts[0])
+
+    def test_failed_request_not_stored(self):
+        """Test that a page that wasn't found doesn't store a rank."""
+        with ml_brasil.simulator.Simulator(results=0) as simulator:
+            product_ = ml_brasil.parse.Product(
+                PRODUCT_TAG, process=False, min_rep=1, aggressiveness=10,
+                cache=self.cache, transport=simulator.transport())
+            self.assertFalse(product_.reputable)
+        self.assertEqual(len(self.cache), 0)
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """Answer every request with 'ok', after '/slow' seconds if asked."""
+
+    def do_GET(self):
+        if self.path.startswith("/slow"):
+            sleep(1)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport(unittest.TestCase):
+    """Test the behaviour of the class Transport.
+
+    What is tested
+    --------------
+    - requests are made with the session
+    - a stalled read raises a Timeout instead of hanging
+    - hosts can have their own pool sizes
+    - prewarm ignores hosts that can't be reached
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_get(self):
+        """Test that a request returns the server's response."""
+        with ml_brasil.transport.Transport() as transport:
+            self.assertEqual(transport.get(self.url).text, "ok")
+
+    def test_read_timeout(self):
+        """Test that a stalled response raises a Timeout."""
+        with ml_brasil.transport.Transport(read_timeout=0.1) as transport:
+            with self.assertRaises(requests.Timeout):
+                transport.get(f"{self.url}/slow")
+
+    def test_pool_size_per_host(self):
+        """Test that a host with its own pool size gets its own pool."""
+        transport = ml_brasil.transport.Transport(
+            pool_size=2, pool_sizes={"produto.mercadolivre.com.br": 20})
+        adapter = transport.session.get_adapter(
+            "https://produto.mercadolivre.com.br/MLB-1-_JM")
+        self.assertEqual(adapter._pool_maxsize, 20)
+        adapter = transport.session.get_adapter("https://lista.mercadolivre"
+                                                ".com.br/4-gb")
+        self.assertEqual(adapter._pool_maxsize, 2)
+
+    def test_prewarm_ignores_failures(self):
+        """Test that unreachable hosts don't make prewarm raise."""
+        with ml_brasil.transport.Transport(connect_timeout=0.1) as transport:
+            transport.prewarm("127.0.0.1:1", "nao-existe.invalid")
+
+
+class TestIterProducts(unittest.TestCase):
+    """Test the behaviour of the generator iter_products.
+
+    What is tested
+    --------------
+    - products are yielded before the next page is taken
+    - with a pool, the products keep the order of the pages
+    - ML_query_iter yields nothing for a too short search term
+
+    Details
+    -------
+    min_rep is set to 0 so that no request is performed.
+
+    """
+
+    def pages(self, taken):
+        """Yield two pages, recording in taken how many were taken."""
+        for page in (f"<ol>{product * 2}</ol>", f"<ol>{product}</ol>"):
+            taken.append(page)
+            yield page
+
+    def test_yields_before_next_page(self):
+        """Test that the first product doesn't wait for the next page."""
+        taken = []
+        products = ml_brasil.parse.iter_products(self.pages(taken),
+                                                 min_rep=0)
+        next(products)
+        self.assertEqual(len(taken), 1)
+        self.assertEqual(len(list(products)), 2)
+        self.assertEqual(len(taken), 2)
+
+    def test_pool_keeps_order(self):
+        """Test that the pool yields every product, in order."""
+        taken = []
+        pooled = list(ml_brasil.parse.iter_products(self.pages(taken),
+                                                    min_rep=0, workers=3))
+        self.assertEqual(len(pooled), 3)
+        for product_ in pooled:
+            self.assertTrue(product_._reputable)
+
+    def test_short_search_term_yields_nothing(self):
+        """Test that a too short search term yields no product."""
+        self.assertEqual(list(ml_brasil.ML_query_iter(" a ")), [])
+
+
+class _SearchHandler(BaseHTTPRequestHandler):
+    """Serve 'total' search results, 50 per page, then 404.
+
+    The position of the first result of each requested page is recorded
+    in 'requested'. If 'show_count' is False, the pages don't tell the
+    total number of results.
+    """
+
+    total = 120
+    show_count = True
+    requested = []
+
+    def do_GET(self):
+        index = int(search(r"_Desde_(\d+)", self.path)[1])
+        self.requested.append(index)
+        if index > self.total:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = (f'<div class="quantity-results">{self.total} resultados'
+                f'</div>' if self.show_count else "")
+        body += f"<p>{index}</p><ol>{product}</ol>"
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _LocalTransport(ml_brasil.transport.Transport):
+    """A Transport that sends every request to a local server."""
+
+    def __init__(self, port):
+        super().__init__()
+        self.origin = f"http://127.0.0.1:{port}"
+
+    def get(self, url, **kwargs):
+        return super().get(self.origin + "/" + url.split("/", 3)[3],
+                           **kwargs)
+
+
+class TestIterSearchPages(unittest.TestCase):
+    """Test the pagination of the generator iter_search_pages.
+
+    What is tested
+    --------------
+    - every page is yielded, in order
+    - with the number of results known, there is no 404 probe
+    - without it, the pages are probed one by one until a 404
+    - the number of results is read from the page
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _SearchHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.transport = _LocalTransport(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _SearchHandler.requested = []
+        _SearchHandler.show_count = True
+
+    def pages(self):
+        return ml_brasil.parse.get_search_pages(
+            "4 GB", aggressiveness=10, transport=self.transport, workers=4)
+
+    def test_pages_in_order(self):
+        """Test that every page is yielded in the order of the search."""
+        pages = self.pages()
+        self.assertEqual([int(search(r"<p>(\d+)</p>", page)[1])
+                          for page in pages], [1, 51, 101])
+
+    def test_no_probe_with_count(self):
+        """Test that no page past the last one is requested."""
+        self.pages()
+        self.assertEqual(sorted(_SearchHandler.requested), [1, 51, 101])
+
+    def test_probe_without_count(self):
+        """Test that without a count the search stops at a 404."""
+        _SearchHandler.show_count = False
+        self.assertEqual(len(self.pages()), 3)
+        self.assertEqual(_SearchHandler.requested, [1, 51, 101, 151])
+
+    def test_result_count(self):
+        """Test that the count is read, with thousands separators."""
+        page = '<div class="quantity-results"> 12.345 resultados</div>'
+        self.assertEqual(ml_brasil.parse._result_count(page), 12345)
+        self.assertEqual(ml_brasil.parse._result_count("<p></p>"), None)
+
+
+class TestParseOnly(unittest.TestCase):
+    """Test the targeted parsing of pages with _parse_only.
+
+    What is tested
+    --------------
+    - only the tags of the requested class are built
+    - the class is matched regardless of extra spaces
+    - PARSER selects the parser, and every parser gives the same products
+
+    """
+
+    PAGE = f"<div><p>cabeçalho</p><ol>{product * 2}</ol><p>rodapé</p></div>"
+
+    def tearDown(self):
+        ml_brasil.parse.PARSER = None
+
+    def test_only_wanted_tags_built(self):
+        """Test that the tree holds only the products."""
+        tree = ml_brasil.parse._parse_only(self.PAGE,
+                                           ml_brasil.parse.RESULT_CLASS, "li")
+        self.assertEqual(len(tree.find_all("p")), 0)
+        self.assertEqual(len(tree.find_all(
+            class_=ml_brasil.parse.RESULT_CLASS)), 2)
+
+    def test_parser_selection(self):
+        """Test that PARSER overrides the automatic choice."""
+        ml_brasil.parse.PARSER = "html.parser"
+        self.assertEqual(ml_brasil.parse._parser(), "html.parser")
+
+    def test_same_products_with_every_parser(self):
+        """Test that the installed parsers extract the same products."""
+        extracted = []
+        for parser in ("html.parser", "lxml"):
+            if not builder_registry.lookup(parser):
+                continue
+            ml_brasil.parse.PARSER = parser
+            extracted.append([
+                (p.link, p.title, p.price, p.picture, p.in_sale)
+                for p in ml_brasil.parse.get_all_products(
+                    [self.PAGE], min_rep=0)])
+        for products in extracted:
+            self.assertEqual(products, extracted[0])
+
+
+class TestExtractFields(unittest.TestCase):
+    """Test the single pass extractor _extract_fields.
+
+    What is tested
+    --------------
+    - every field equals the one from the field's own method
+    - the boolean fields follow the markers in the tag
+    - fields already set in the Product are kept
+
+    """
+
+    @staticmethod
+    def by_methods(product_object):
+        """Return the fields extracted by each Product method."""
+        return {"link": product_object._extract_link(),
+                "title": product_object._extract_title(),
+                "price": product_object._extract_price(),
+                "no_interest": product_object._is_no_interest(),
+                "free_shipping": product_object._has_free_shipping(),
+                "in_sale": product_object._is_in_sale(),
+                "picture": product_object._extract_picture(),
+                "item_id": product_object._extract_item_id()}
+
+    def test_same_as_methods(self):
+        """Test that the single pass gives the same values as before."""
+        self.assertEqual(ml_brasil.parse._extract_fields(PRODUCT_TAG),
+                         self.by_methods(PRODUCT_OBJECT))
+        fields = ml_brasil.parse._extract_fields(INCORRECT_TAG)
+        self.assertTrue(isnan(fields.pop("price")[0]))
+        expected = self.by_methods(INCORRECT_OBJECT)
+        expected.pop("price")
+        self.assertEqual(fields, expected)
+
+    def test_flags_follow_markers(self):
+        """Test the boolean fields in a tag with the markers changed."""
+        tag = BeautifulSoup(product.replace("item__discount", "x")
+                            .replace("stack_column_item status",
+                                     "stack_column_item shipping highlighted"),
+                            "html.parser")
+        fields = ml_brasil.parse._extract_fields(tag)
+        self.assertFalse(fields["in_sale"])
+        self.assertTrue(fields["free_shipping"])
+        self.assertTrue(fields["no_interest"])
+
+    def test_keeps_fields_already_set(self):
+        """Test that a title set before the extraction isn't replaced."""
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, process=False)
+        product_.title = "Outro título"
+        self.assertEqual(product_.price, (4629, 0))
+        self.assertEqual(product_.title, "Outro título")
+
+
+class TestProductRecord(unittest.TestCase):
+    """Test the behaviour of the class ProductRecord.
+
+    What is tested
+    --------------
+    - a record has the same values as the Product it was built from
+    - the price is stored in cents, and NaN prices as None
+    - records are immutable and have no __dict__
+    - the scheme and host of the links are shared between records
+    - get_all_products returns records and releases the html trees
+
+    """
+
+    def test_same_values_as_product(self):
+        """Test that the values are copied from the Product."""
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, min_rep=0)
+        product_.reputable = True
+        record = ml_brasil.parse.ProductRecord.from_product(product_)
+        for field in ("link", "title", "price", "no_interest",
+                      "free_shipping", "in_sale", "picture", "reputable"):
+            self.assertEqual(getattr(record, field), getattr(product_, field))
+        self.assertEqual(repr(record), repr(product_))
+
+    def test_price_in_cents(self):
+        """Test that the price is kept as an integer number of cents."""
+        record = ml_brasil.parse.ProductRecord.from_product(PRODUCT_OBJECT)
+        self.assertEqual(record.price_cents, 462900)
+        record = ml_brasil.parse.ProductRecord.from_product(INCORRECT_OBJECT)
+        self.assertEqual(record.price_cents, None)
+        self.assertTrue(isnan(record.price[0]))
+
+    def test_immutable(self):
+        """Test that the values of a record can't be changed."""
+        record = ml_brasil.parse.ProductRecord.from_product(PRODUCT_OBJECT)
+        with self.assertRaises(AttributeError):
+            record.title = "Outro título"
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_origins_are_shared(self):
+        """Test that records share the same scheme and host strings."""
+        first, second = (
+            ml_brasil.parse.ProductRecord.from_product(
+                ml_brasil.parse.Product(BeautifulSoup(product, "html.parser"),
+                                        min_rep=0))
+            for _ in range(2))
+        self.assertIs(first._link_origin, second._link_origin)
+        self.assertEqual(first._link_origin, "https://www.mercadolivre.com.br/")
+
+    def test_get_all_products_returns_records(self):
+        """Test that the records come with the trees released."""
+        records = ml_brasil.parse.get_all_products(
+            [f"<ol>{product * 2}</ol>"], min_rep=0, records=True)
+        self.assertEqual(len(records), 2)
+        for record in records:
+            self.assertTrue(isinstance(record, ml_brasil.parse.ProductRecord))
+            self.assertTrue(record.reputable)
+            self.assertEqual(record.title, "iPhone 11 128 GB Preto 4 GB RAM")
+
+
+class TestRankScanner(unittest.TestCase):
+    """Test the streaming reputation scanner of product pages.
+
+    What is tested
+    --------------
+    - the rank is the same however the page is split in pieces
+    - nested tags inside the card don't end it early
+    - the scan ends as soon as the seller reaches min_rep
+    - a low rank is still overturned by a later 'catalogue' marker
+
+    """
+
+    CARD = ('<div class="card-section seller-thermometer"><div><ul>'
+            '<li class="{}"></li></ul></div><div>fim</div></div>')
+    LEVELS = ml_brasil.parse.Product._THERMOMETER_LEVELS
+
+    class Response:
+        """A response whose body is received in pieces of 'size' bytes."""
+
+        encoding = "utf-8"
+
+        def __init__(self, page, size):
+            self.body = page.encode()
+            self.size = size
+            self.read = 0
+
+        def iter_content(self, chunk_size):
+            while self.read < len(self.body):
+                self.read += self.size
+                yield self.body[self.read - self.size:self.read]
+
+    def page(self, level, after="<p>ç</p>" * 5000):
+        return "<p>início</p>" * 300 + self.CARD.format(level) + after
+
+    def test_rank_independent_of_pieces(self):
+        """Test that any split of the page gives the same rank."""
+        for rank, level in enumerate(self.LEVELS):
+            page = self.page(level)
+            for size in (1, 7, 100, 4096, len(page.encode())):
+                response = self.Response(page, size)
+                self.assertEqual(
+                    ml_brasil.parse._stream_seller_rank(response), rank)
+
+    def test_nested_tags_inside_card(self):
+        """Test that the level after nested divs is still in the card."""
+        page = self.CARD.replace("<li", "<div></div><li").format("red")
+        self.assertEqual(ml_brasil.parse._seller_rank(page), 1)
+        page = self.CARD.format("x") + "<p>red</p>"
+        self.assertEqual(ml_brasil.parse._seller_rank(page),
+                         len(self.LEVELS))
+
+    def test_early_exit(self):
+        """Test that the rest of the page isn't read after the verdict."""
+        response = self.Response(self.page("light_green"), 1024)
+        self.assertEqual(ml_brasil.parse._stream_seller_rank(response, 3), 4)
+        self.assertLess(response.read, len(response.body) / 4)
+
+    def test_catalogue_marker_after_card(self):
+        """Test that a low rank is overturned by a later marker."""
+        page = self.page("red", '<h2 class="ui-pdp-other-sellers__title">')
+        response = self.Response(page, 1024)
+        self.assertEqual(ml_brasil.parse._stream_seller_rank(response, 3),
+                         len(self.LEVELS))
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """Answer 429 to the first 'throttled' requests, and 'ok' after."""
+
+    throttled = 2
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        if type(self).requests <= self.throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRequest(unittest.TestCase):
+    """Test the behaviour of the function _request.
+
+    What is tested
+    --------------
+    - a throttled request is retried until it succeeds
+    - the rate of the host is cut after each throttled answer
+    - the last answer is returned once the retries are over
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.transport = _LocalTransport(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.transport.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _ThrottlingHandler.requests = 0
+        self.limiter = ml_brasil.parse.LIMITER
+        ml_brasil.parse.LIMITER = ml_brasil.ratelimit.RateLimiter()
+
+    def tearDown(self):
+        ml_brasil.parse.LIMITER = self.limiter
+
+    def test_retries_throttled(self):
+        """Test that a request answered with 429 is retried."""
+        url = "https://lista.mercadolivre.com.br/retry"
+        response = ml_brasil.parse._request(self.transport, url, 6)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_ThrottlingHandler.requests, 3)
+        self.assertLess(ml_brasil.parse.LIMITER.rate(
+            "lista.mercadolivre.com.br"), 64)
+
+    def test_gives_up(self):
+        """Test that the last answer is returned after MAX_RETRIES."""
+        url = "https://lista.mercadolivre.com.br/retry"
+        retries = ml_brasil.parse.MAX_RETRIES
+        ml_brasil.parse.MAX_RETRIES = 1
+        try:
+            response = ml_brasil.parse._request(self.transport, url, 6)
+        finally:
+            ml_brasil.parse.MAX_RETRIES = retries
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(_ThrottlingHandler.requests, 2)
+
+
+class _ETagHandler(BaseHTTPRequestHandler):
+    """Answer with a page and its ETag, or 304 if the client has it."""
+
+    requests = 0
+    not_modified = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        if self.headers.get("If-None-Match") == '"v1"':
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = "página".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the behaviour of the classes ResponseCache and Transport.
+
+    What is tested
+    --------------
+    - the key ignores tracking, case of the host and order of filters
+    - product pages and search pages have their own ttl
+    - a fresh response is served from the cache, with its encoding
+    - a stale response is revalidated with its ETag
+    - the least recently used entries are evicted above max_bytes
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ETagHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/page"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _ETagHandler.requests = _ETagHandler.not_modified = 0
+        self.cache = ml_brasil.cache.ResponseCache(":memory:")
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_key(self):
+        """Test that equivalent urls have the same key."""
+        key = ml_brasil.cache.ResponseCache.key
+        self.assertEqual(
+            key("https://lista.mercadolivre.com.br/iphone_Desde_51"
+                "_PriceRange_0-100"),
+            key("https://Lista.mercadolivre.com.br/iphone_PriceRange_0-100"
+                "_Desde_51/"))
+        self.assertNotEqual(
+            key("https://lista.mercadolivre.com.br/iphone_Desde_51"),
+            key("https://lista.mercadolivre.com.br/iphone_Desde_101"))
+        link = search(r'href="([^"]+)"', product).group(1)
+        self.assertEqual(key(link), "https://www.mercadolivre.com.br/"
+                                    "iphone-11-128-gb-preto-4-gb-ram/p/"
+                                    "MLB15149567")
+
+    def test_ttl(self):
+        """Test that product pages are fresh for longer."""
+        cache = ml_brasil.cache.ResponseCache(":memory:", search_ttl=1,
+                                              product_ttl=2)
+        self.assertEqual(cache.ttl("https://lista.mercadolivre.com.br/a"), 1)
+        self.assertEqual(cache.ttl("https://produto.mercadolivre.com.br/a"),
+                         2)
+        cache.close()
+
+    def test_fresh_from_cache(self):
+        """Test that a fresh response doesn't make a new request."""
+        with ml_brasil.transport.Transport(cache=self.cache) as transport:
+            first = transport.get(self.url)
+            second = transport.get(self.url, stream=True)
+            self.assertIsNotNone(transport.cached(self.url))
+        self.assertEqual(_ETagHandler.requests, 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(b"".join(second.iter_content(3)), first.content)
+
+    def test_revalidated(self):
+        """Test that a stale response is revalidated with its ETag."""
+        self.cache.search_ttl = 0
+        with ml_brasil.transport.Transport(cache=self.cache) as transport:
+            transport.get(self.url)
+            self.assertIsNone(transport.cached(self.url))
+            response = transport.get(self.url)
+        self.assertEqual(_ETagHandler.not_modified, 1)
+        self.assertEqual(response.text, "página")
+
+    def test_evicted(self):
+        """Test that the least recently used entry is evicted first."""
+        with ml_brasil.transport.Transport(cache=self.cache) as transport:
+            response = transport.get(self.url)
+        self.cache.max_bytes = 2 * len(zlib.compress(response.content))
+        for path in ("a", "b", "c"):
+            self.cache.set(self.url + path, response)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.lookup(self.url)[0])
+        self.assertIsNotNone(self.cache.lookup(self.url + "c")[0])
+
+
+class TestSimulator(unittest.TestCase):
+    """Test the behaviour of the class Simulator.
+
+    What is tested
+    --------------
+    - a search is paginated until a 404 past its last page
+    - the products follow the price range and condition of the search
+    - product pages have the thermometer the package reads
+    - unknown categories are answered with 404
+    - requests above the rate limit are answered with 429
+    - a small page on a kept-alive connection isn't held back by Nagle
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.simulator = ml_brasil.simulator.Simulator(results=120).start()
+        cls.transport = cls.simulator.transport()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.transport.close()
+        cls.simulator.stop()
+
+    def test_small_page_not_delayed(self):
+        """Test that a product page takes far less than a delayed ACK."""
+        link = self.simulator.catalogue("mesa")[0]["link"]
+        self.transport.get(link)
+        start = monotonic()
+        for _ in range(10):
+            self.assertEqual(self.transport.get(link).status_code, 200)
+        self.assertLess((monotonic() - start) / 10, 0.02)
+
+    def test_pagination(self):
+        """Test that every product is found, and the last page is a 404."""
+        pages = ml_brasil.parse.get_search_pages(
+            "mesa", aggressiveness=8, transport=self.transport)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(ml_brasil.parse._result_count(pages[0]), 120)
+        url = ml_brasil.parse._search_url("lista", "", "mesa", 151, 0,
+                                          ml_brasil.parse.INT32_MAX, 0)
+        self.assertEqual(self.transport.get(url).status_code, 404)
+
+    def test_filters(self):
+        """Test that the price range and condition filter the products."""
+        products = ml_brasil.ML_query("mesa", category="1.1", price_min=100,
+                                      price_max=3000, condition=1,
+                                      aggressiveness=8, process=False,
+                                      transport=self.transport)
+        expected = [product for product in self.simulator.catalogue("mesa")
+                    if 100 <= product["price"] <= 3000
+                    and product["condition"] == 1]
+        self.assertEqual(len(products), len(expected))
+        for product in products:
+            self.assertTrue(100 <= product.price[0] <= 3000)
+
+    def test_reputation(self):
+        """Test that the rank read matches the product page."""
+        levels = ml_brasil.parse.Product._THERMOMETER_LEVELS
+        products = ml_brasil.parse.get_all_products(
+            [ml_brasil.parse.get_search_pages("mesa", aggressiveness=8,
+                                              transport=self.transport)[0]],
+            process=False, check_rep=False)
+        for product, fields in zip(products,
+                                   self.simulator.catalogue("mesa")):
+            with self.transport.get(product.link, stream=True) as response:
+                rank = ml_brasil.parse._stream_seller_rank(response)
+            if fields["catalogue"]:
+                self.assertEqual(rank, len(levels))
+            elif fields["level"] is None:
+                self.assertEqual(rank, ml_brasil.parse.NO_THERMOMETER)
+            else:
+                self.assertEqual(rank, levels.index(fields["level"]))
+
+    def test_unknown_category(self):
+        """Test that a suffix of no category is answered with 404."""
+        response = self.transport.get(
+            "https://lista.mercadolivre.com.br/nao-existe/mesa_Desde_1")
+        self.assertEqual(response.status_code, 404)
+
+    def test_rate_limit(self):
+        """Test that requests above the rate limit get a 429."""
+        with ml_brasil.simulator.Simulator(rate_limit=1, burst=1) as simulator:
+            with simulator.transport() as transport:
+                statuses = [transport.get(
+                    "https://lista.mercadolivre.com.br/mesa_Desde_1"
+                ).status_code for _ in range(3)]
+        self.assertEqual(statuses[0], 200)
+        self.assertIn(429, statuses)
+        self.assertEqual(simulator.requests["throttled"],
+                         statuses.count(429))
+
+
+class TestQueryStats(unittest.TestCase):
+    """Test the behaviour of the class QueryStats.
+
+    What is tested
+    --------------
+    - the time of the stages adds up
+    - requests, bytes and statuses are counted by host
+    - only the slowest urls are kept, the slowest first
+    - the hit rate of the caches
+    - a search records every stage and request in it
+
+    """
+
+    def test_stage(self):
+        """Test that the time of each run of a stage is added."""
+        stats = ml_brasil.stats.QueryStats()
+        for _ in range(2):
+            with stats.stage("parse"):
+                sleep(0.01)
+        self.assertGreaterEqual(stats.stages["parse"], 0.02)
+        with ml_brasil.stats.timer(None, "parse"):
+            pass
+
+    def test_requests(self):
+        """Test that the requests are counted by host and status."""
+        stats = ml_brasil.stats.QueryStats()
+        stats.request("https://a.com/1", 200, 0.1, 0.5, 100)
+        stats.request("https://a.com/2", 429, 0.2, 0.5)
+        stats.received("https://a.com/2", 50)
+        stats.request("https://b.com/1", 200, 0.3)
+        self.assertEqual(stats.requests, {"a.com": 2, "b.com": 1})
+        self.assertEqual(stats.bytes, {"a.com": 150})
+        self.assertEqual(stats.statuses, {200: 2, 429: 1})
+        self.assertEqual(stats.throttle_wait, 1)
+
+    def test_slowest(self):
+        """Test that only the slowest_count slowest urls are kept."""
+        stats = ml_brasil.stats.QueryStats()
+        stats.slowest_count = 2
+        for seconds in (0.3, 0.1, 0.5, 0.2):
+            stats.request(f"https://a.com/{seconds}", 200, seconds)
+        self.assertEqual([url for _, url in stats.slowest()],
+                         ["https://a.com/0.5", "https://a.com/0.3"])
+
+    def test_hit_rate(self):
+        """Test the hit rate of the lookups in a cache."""
+        stats = ml_brasil.stats.QueryStats()
+        self.assertIsNone(stats.hit_rate("reputation"))
+        for hit in (True, False, True, True):
+            stats.lookup("reputation", hit)
+        self.assertEqual(stats.hit_rate("reputation"), 0.75)
+
+    def test_search(self):
+        """Test that a search on the Simulator records all it did."""
+        stats = ml_brasil.stats.QueryStats()
+        with ml_brasil.simulator.Simulator(results=60) as simulator:
+            with simulator.transport() as transport:
+                ml_brasil.ML_query("mesa", aggressiveness=8,
+                                   transport=transport, stats=stats)
+        self.assertEqual(set(stats.stages), set(ml_brasil.stats.STAGES))
+        # the HEAD requests that warm the connections aren't recorded
+        self.assertEqual(sum(stats.requests.values()),
+                         sum(simulator.requests.values())
+                         - simulator.requests["head"])
+        self.assertEqual(stats.statuses[200], 62)
+        self.assertGreater(stats.bytes["lista.mercadolivre.com.br"], 0)
+        self.assertEqual(stats.as_dict()["statuses"], {200: 62})
+        self.assertIn("lista.mercadolivre.com.br", str(stats))
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the behaviour of the metrics module.
+
+    What is tested
+    --------------
+    - nothing is recorded while the metrics are disabled
+    - a search records its pages, products, checks and requests
+    - an asynchronous search records its pages, checks and requests
+    - the histogram buckets are cumulative
+    - the metrics are served in the Prometheus text format
+
+    """
+
+    def setUp(self):
+        ml_brasil.metrics.reset()
+
+    def tearDown(self):
+        ml_brasil.metrics.disable()
+        ml_brasil.metrics.reset()
+
+    def search(self):
+        with ml_brasil.simulator.Simulator(results=60) as simulator:
+            with simulator.transport() as transport:
+                return ml_brasil.ML_query("mesa", aggressiveness=8,
+                                          transport=transport)
+
+    def test_disabled(self):
+        """Test that a search records nothing while disabled."""
+        self.search()
+        for metric in ml_brasil.metrics.METRICS[:-2]:
+            self.assertEqual(metric.samples(), [])
+
+    def test_search(self):
+        """Test that a search records what it did."""
+        ml_brasil.metrics.enable()
+        products = self.search()
+        metrics = ml_brasil.metrics
+        self.assertEqual(metrics.SEARCHES.samples()[0][2], 1)
+        self.assertEqual(metrics.PAGES.samples()[0][2], 2)
+        self.assertEqual(metrics.PRODUCTS.samples()[0][2], 60)
+        checks = {labels["result"]: value for _, labels, value
+                  in metrics.REPUTATION_CHECKS.samples()}
+        self.assertEqual(checks.get("passed", 0),
+                         sum(product.reputable for product in products))
+        self.assertEqual(sum(checks.values()), 60)
+        hosts = {labels["host"] for _, labels, _
+                 in metrics.RATE.samples()}
+        self.assertIn("lista.mercadolivre.com.br", hosts)
+
+    def test_async_search(self):
+        """Test that an asynchronous search records what it did."""
+        class Response:
+            def __init__(self, page):
+                self.status = 404 if page is None else 200
+                self.headers = {}
+                self.page = page
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc_info):
+                pass
+
+            async def text(self):
+                return self.page
+
+        class Session:
+            async def get(self, url):
+                parts = urlsplit(url)
+                return Response(simulator.search_page(parts.netloc,
+                                                      parts.path))
+
+        ml_brasil.metrics.enable()
+        with ml_brasil.simulator.Simulator(results=60) as simulator:
+            asyncio.run(ml_brasil.asyncsearch.async_get_search_pages(
+                "mesa", aggressiveness=10, session=Session()))
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, process=False,
+                                           min_rep=0)
+        asyncio.run(ml_brasil.asyncsearch.async_is_reputable(product_, None))
+        metrics = ml_brasil.metrics
+        self.assertEqual(metrics.SEARCHES.samples()[0][2], 1)
+        self.assertEqual(metrics.PAGES.samples()[0][2], 2)
+        requests_ = {labels["status"]: value for _, labels, value
+                     in metrics.REQUESTS.samples()}
+        self.assertEqual(requests_, {200: 2})
+        self.assertEqual(metrics.REPUTATION_CHECKS.samples(),
+                         [(metrics.REPUTATION_CHECKS.name,
+                           {"result": "skipped"}, 1)])
+
+    def test_histogram(self):
+        """Test that each bucket counts the observations up to its bound."""
+        histogram = ml_brasil.metrics.Histogram("h", "A histogram.",
+                                                buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        samples = {labels.get("le", name): value
+                   for name, labels, value in histogram.samples()}
+        self.assertEqual(samples, {"1": 2, "2": 3, "+Inf": 4,
+                                   "h_sum": 6.0, "h_count": 4})
+
+    def test_serve(self):
+        """Test that the metrics are served over HTTP."""
+        server = ml_brasil.metrics.serve(0)
+        try:
+            ml_brasil.metrics.REQUESTS.inc("a.com", 200)
+            response = requests.get(
+                f"http://127.0.0.1:{server.server_address[1]}/metrics")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertTrue(ml_brasil.metrics.ENABLED)
+        self.assertEqual(response.headers["Content-Type"],
+                         ml_brasil.metrics.CONTENT_TYPE)
+        self.assertIn("# TYPE ml_brasil_requests_total counter",
+                      response.text)
+        self.assertIn('ml_brasil_requests_total{host="a.com",status="200"} 1',
+                      response.text)
+
+
+class TestCategoryRegistry(unittest.TestCase):
+    """Test the behaviour of the class CategoryRegistry.
+
+    What is tested
+    --------------
+    - every category in CATS is found by its id
+    - every category is found by its subdomain and suffix
+    - ids are read as integers, and unknown ids aren't found
+    - the search by prefix ignores case and accents
+    - the parents and children are kept in order
+
+    """
+
+    registry = ml_brasil.parse.REGISTRY
+
+    def test_by_id(self):
+        """Test that each category in CATS is found by its id."""
+        count = 0
+        for (parent, parent_name), children in backup_CATS:
+            for child in children:
+                category = self.registry[f"{parent}.{child['number']}"]
+                self.assertEqual(category.name, child["name"])
+                self.assertEqual(category.parent_name, parent_name)
+                self.assertEqual(category.subdomain, child["subdomain"])
+                self.assertEqual(category.suffix, child["suffix"])
+                count += 1
+        self.assertEqual(len(self.registry), count)
+
+    def test_by_url(self):
+        """Test that each category is found by its subdomain and suffix."""
+        for category in self.registry:
+            self.assertEqual(
+                self.registry.find(category.subdomain, category.suffix),
+                category)
+        self.assertIsNone(self.registry.find("lista", "nao-existe/"))
+
+    def test_ids(self):
+        """Test that ids are read as integers and unknown ones missed."""
+        self.assertEqual(self.registry["01.01"], self.registry["1.1"])
+        self.assertIn("0.0", self.registry)
+        self.assertNotIn("10000.1", self.registry)
+        self.assertIsNone(self.registry.get("a.b"))
+        with self.assertRaises(KeyError):
+            self.registry["10000.1"]
+
+    def test_search(self):
+        """Test that the search ignores case and accents."""
+        category = choice([category for category in self.registry
+                           if category.parent])
+        found = self.registry.search(category.name.upper())
+        self.assertIn(category, found)
+        self.assertEqual(self.registry.search("nauticos"),
+                         self.registry.search("NÁUTICOS"))
+        for category in self.registry.search("acess"):
+            self.assertIn("acess", ml_brasil.categories.fold(
+                f"{category.name} {category.parent_name}"))
+        self.assertEqual(self.registry.search(""), [])
+
+    def test_parents_and_children(self):
+        """Test that the parents and children are in the order of CATS."""
+        self.assertEqual(self.registry.parents(),
+                         [tuple(parent) for parent, _ in backup_CATS])
+        for (parent, _), children in backup_CATS:
+            self.assertEqual(
+                [category.name for category in
+                 self.registry.children(parent)],
+                [child["name"] for child in children])
+
+
+class TestLazyImports(unittest.TestCase):
+    """Test that the package imports its modules only when needed.
+
+    What is tested
+    --------------
+    - importing the package imports none of its dependencies
+    - the categories are loaded only when a category is first needed
+    - the functions and modules are attributes of the package
+    - the categories database is read with the expected structure
+
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(
+        ml_brasil.__file__)))
+
+    def run_code(self, code):
+        """Run code in a new interpreter, and return what it printed."""
+        return subprocess.run([sys.executable, "-c", code], cwd=self.root,
+                              capture_output=True, text=True,
+                              check=True).stdout.split()
+
+    def test_import_defers_dependencies(self):
+        """Test that importing the package imports no dependency."""
+        self.assertEqual(self.run_code(
+            "import sys, ml_brasil; print(*(name for name in "
+            "('bs4', 'requests', 'aiohttp', 'http.server', "
+            "'ml_brasil.parse', 'ml_brasil.asyncsearch') "
+            "if name in sys.modules))"), [])
+
+    def test_categories_loaded_on_first_use(self):
+        """Test that the categories are read when first looked up."""
+        self.assertEqual(self.run_code(
+            "import ml_brasil.parse as parse; "
+            "print(parse._categories is None); parse.get_cat('0.0'); "
+            "print(parse._categories is None, len(parse.REGISTRY))"),
+            ["True", "False", str(len(ml_brasil.parse.REGISTRY))])
+
+    def test_package_attributes(self):
+        """Test that the package gives its functions and modules."""
+        self.assertIs(ml_brasil.ML_query, ml_brasil.search.ML_query)
+        self.assertIs(ml_brasil.ML_query_iter, ml_brasil.search.ML_query_iter)
+        self.assertIn("async_ML_query", dir(ml_brasil))
+        with self.assertRaises(AttributeError):
+            ml_brasil.nonexistent
+        with self.assertRaises(AttributeError):
+            ml_brasil.parse.nonexistent
+
+    def test_categories_database(self):
+        """Test that every category has a number, name, and urls."""
+        self.assertIs(ml_brasil.parse.CATS,
+                      ml_brasil.parse._load_categories()[0])
+        for (number, name), children in ml_brasil.parse.CATS:
+            self.assertIsInstance(number, int)
+            self.assertIsInstance(name, str)
+            for child in children:
+                self.assertEqual(set(child),
+                                 {"number", "name", "subdomain", "suffix"})
+
+
+class TestQueryMany(unittest.TestCase):
+    """Test the behaviour of ML_query_many and the SingleFlight.
+
+    What is tested
+    --------------
+    - the results come back for each search, in order
+    - a product found by many searches is requested only once
+    - the arguments of each search override the shared ones
+    - a SingleFlight runs the call once for every caller of a key
+    - a call that fails is run again by the next caller
+    - the settings given to a Product don't change the class variables
+
+    """
+
+    def test_shared_checks(self):
+        """Test that repeated products are checked only once."""
+        with ml_brasil.simulator.Simulator(
+                results={"mesa": 60, "cadeira": 40}) as simulator:
+            results = ml_brasil.ML_query_many(
+                ["mesa", "cadeira", {"search_term": "mesa", "order": 2}],
+                parallel=3, aggressiveness=10, workers=4,
+                transport=simulator.transport())
+            self.assertEqual([len(products) for products in results],
+                             [60, 40, 60])
+            self.assertEqual(sorted(p.link for p in results[0]),
+                             sorted(p.link for p in results[2]))
+            self.assertEqual([p.price for p in results[2]],
+                             sorted((p.price for p in results[2]),
+                                    reverse=True))
+            self.assertEqual(simulator.requests["product"],
+                             len({p.link for products in results
+                                  for p in products}))
+
+    def test_query_arguments(self):
+        """Test that each search may override the shared arguments."""
+        with ml_brasil.simulator.Simulator(results=30) as simulator:
+            results = ml_brasil.ML_query_many(
+                [{"search_term": "mesa", "min_rep": 0}], min_rep=5,
+                aggressiveness=10, transport=simulator.transport())
+            self.assertEqual(len(results[0]), 30)
+            self.assertTrue(all(p.reputable for p in results[0]))
+            self.assertEqual(simulator.requests["product"], 0)
+
+    def test_single_flight(self):
+        """Test that concurrent callers of a key share one call."""
+        flights = ml_brasil.parse.SingleFlight()
+        calls = []
+
+        def call():
+            calls.append(None)
+            sleep(0.05)
+            return len(calls)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: flights("key", call), range(8)))
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(flights("other", call), 2)
+        self.assertEqual(len(flights), 2)
+
+    def test_single_flight_failure(self):
+        """Test that a failed call is run again by the next caller."""
+        flights = ml_brasil.parse.SingleFlight()
+
+        def fail():
+            raise OSError("falhou")
+
+        with self.assertRaises(OSError):
+            flights("key", fail)
+        self.assertEqual(flights("key", lambda: 4), 4)
+
+    def test_product_settings(self):
+        """Test that settings apply to a single Product."""
+        default_min_rep = ml_brasil.parse.Product.min_rep
+        product_ = ml_brasil.parse.Product(PRODUCT_TAG, process=False,
+                                           min_rep=0)
+        self.assertEqual(product_.min_rep, 0)
+        self.assertEqual(ml_brasil.parse.Product.min_rep, default_min_rep)
+        self.assertTrue(product_._is_reputable())
+        with self.assertRaises(TypeError):
+            ml_brasil.parse.Product(PRODUCT_TAG, process=False, color=1)
+
+
+class TestItemIds(unittest.TestCase):
+    """Test the item ids of the listings and the ProductList.
+
+    What is tested
+    --------------
+    - the item id is read from the rowItem tag, item-id or product-id
+    - the item id is read from the link when the tag has none
+    - the item id is read in the same pass as the other fields
+    - repeated listings are skipped before their reputation is checked
+    - the products of a ProductList are looked up by their item id
+    - the index of a ProductList follows the changes to the list
+
+    """
+
+    def test_item_id(self):
+        """Test the id of the example listing and of its records."""
+        self.assertEqual(PRODUCT_OBJECT.item_id, "MLB1543163640")
+        self.assertEqual(ml_brasil.parse.ProductRecord.from_product(
+            PRODUCT_OBJECT).item_id, "MLB1543163640")
+        self.assertEqual(INCORRECT_OBJECT.item_id, "")
+
+    def test_item_id_fallbacks(self):
+        """Test the product-id attribute and the link as fallbacks."""
+        tag = BeautifulSoup(product.replace(' id="MLB1543163640"', "")
+                            .replace(' item-id="MLB1543163640"', ""),
+                            "html.parser")
+        self.assertEqual(ml_brasil.parse._item_id_from(tag), "MLB15149567")
+        self.assertEqual(ml_brasil.parse._extract_fields(tag)["item_id"],
+                         "MLB15149567")
+        tag = BeautifulSoup(
+            '<li><a class="item__info-title" href="https://produto.'
+            'mercadolivre.com.br/MLB-123456-mesa-_JM">Mesa</a></li>',
+            "html.parser")
+        self.assertEqual(ml_brasil.parse._item_id_from(tag), "MLB123456")
+        self.assertEqual(ml_brasil.parse._extract_fields(tag)["item_id"],
+                         "MLB123456")
+
+    def test_item_id_single_pass(self):
+        """Test that deduping reads the id with the other fields."""
+        def item_id_from(tag):
+            raise AssertionError("the tag was walked again for its id")
+
+        original = ml_brasil.parse._item_id_from
+        ml_brasil.parse._item_id_from = item_id_from
+        try:
+            products = ml_brasil.parse.get_all_products(
+                [f"<ol>{product * 2}</ol>"], min_rep=0, dedupe=True)
+        finally:
+            ml_brasil.parse._item_id_from = original
+        self.assertEqual(products.ids(), ["MLB1543163640"])
+
+    def test_dedupe(self):
+        """Test that a repeated listing is kept only the first time."""
+        pages = [f"<ol>{product * 2}</ol>", f"<ol>{product}</ol>"]
+        products = ml_brasil.parse.get_all_products(pages, min_rep=0,
+                                                    dedupe=True)
+        self.assertEqual(len(products), 1)
+        self.assertEqual(len(ml_brasil.parse.get_all_products(
+            pages, min_rep=0)), 3)
+        with ml_brasil.simulator.Simulator(results=60) as simulator:
+            pages = ml_brasil.parse.get_search_pages(
+                "mesa", aggressiveness=10, transport=simulator.transport())
+            products = ml_brasil.parse.get_all_products(
+                pages + pages[:1], aggressiveness=10, dedupe=True,
+                transport=simulator.transport())
+            self.assertEqual(len(products), 60)
+            self.assertEqual(simulator.requests["product"], 60)
+
+    def test_product_list(self):
+        """Test the lookup of the products by their item id."""
+        products = ml_brasil.parse.get_all_products(
+            [f"<ol>{product}</ol>"], min_rep=0, records=True)
+        self.assertIsInstance(products, ml_brasil.parse.ProductList)
+        self.assertIs(products.get("MLB1543163640"), products[0])
+        self.assertIs(products.get("MLB0"), None)
+        self.assertEqual(products.ids(), ["MLB1543163640"])
+        products.pop()
+        self.assertIs(products.get("MLB1543163640", 0), 0)
+        products.append(PRODUCT_OBJECT)
+        self.assertIs(products.get("MLB1543163640"), PRODUCT_OBJECT)
+        record = ml_brasil.parse.ProductRecord.from_product(PRODUCT_OBJECT)
+        products.append(record)
+        products.sort(key=lambda product: product is not record)
+        self.assertIs(products.get("MLB1543163640"), record)
+        products.reverse()
+        self.assertIs(products.get("MLB1543163640"), PRODUCT_OBJECT)
+
+
+class TestDelta(unittest.TestCase):
+    """Test the incremental searches of the delta module.
+
+    What is tested
+    --------------
+    - a first run finds every listing as added
+    - a saved snapshot is loaded back the same
+    - only the new and changed listings are checked again
+    - added, removed and repriced listings are reported
+    - listings without an item id are never reported as removed
+    - a snapshot of another search is refused
+
+    """
+
+    def test_delta(self):
+        """Test a search run again after its listings changed."""
+        with ml_brasil.simulator.Simulator(results=80) as simulator, \
+                TemporaryDirectory() as directory:
+            transport = simulator.transport()
+            first = ml_brasil.ML_query_delta("mesa", aggressiveness=10,
+                                             workers=4, transport=transport)
+            self.assertEqual(len(first.added), 80)
+            self.assertEqual(simulator.requests["product"], 80)
+            path = os.path.join(directory, "mesa.json")
+            ml_brasil.delta.save(first.current, path)
+            previous = ml_brasil.delta.load(path)
+            self.assertEqual(previous, first.current)
+
+            catalogue = simulator.catalogue("mesa")
+            catalogue[0]["price"] += 1
+            catalogue[1]["title"] = "Outra mesa"
+            removed = catalogue.pop(2)
+            simulator.requests.clear()
+            second = ml_brasil.ML_query_delta("mesa", previous,
+                                              aggressiveness=10, workers=4,
+                                              transport=transport)
+            self.assertEqual(simulator.requests["product"], 2)
+            self.assertEqual(len(second.added), 0)
+            self.assertEqual(second.removed.ids(), [removed["item_id"]])
+            self.assertEqual([(old.item_id, new.price_cents - old.price_cents)
+                              for old, new in second.repriced],
+                             [(catalogue[0]["item_id"], 100)])
+            self.assertEqual(second.changed.ids(), [catalogue[0]["item_id"],
+                                                    catalogue[1]["item_id"]])
+            self.assertEqual(len(second.current.products), 79)
+            self.assertTrue(all(record.reputable is not None
+                                for record in second.current.products))
+
+    def test_no_id_not_removed(self):
+        """Test that a listing without an id isn't reported as removed."""
+        with ml_brasil.simulator.Simulator(results=10) as simulator:
+            transport = simulator.transport()
+            first = ml_brasil.ML_query_delta("mesa", aggressiveness=10,
+                                             transport=transport)
+            products = ml_brasil.parse.ProductList(first.current.products)
+            products.append(ml_brasil.parse.ProductRecord(
+                "", "Mesa", 1000, False, False, False, "", True, ""))
+            previous = first.current._replace(products=products)
+            second = ml_brasil.ML_query_delta("mesa", previous,
+                                              aggressiveness=10,
+                                              transport=transport)
+        self.assertEqual(len(second.removed), 0)
+
+    def test_other_search_refused(self):
+        """Test that a snapshot of other parameters can't be compared."""
+        previous = ml_brasil.delta.Snapshot(
+            "mesa", {"min_rep": 3}, "2020-01-01T00:00:00+00:00",
+            ml_brasil.parse.ProductList())
+        with self.assertRaises(ValueError):
+            ml_brasil.ML_query_delta("mesa", previous)
+
+
+class TestShards(unittest.TestCase):
+    """Test the sharding of searches by price range.
+
+    What is tested
+    --------------
+    - ranges are bisected until each fits, sharing their boundaries
+    - a range of a single real isn't split, even if it doesn't fit
+    - a sharded search finds every result beyond MAX_RESULTS
+    - without sharding, the results beyond MAX_RESULTS are lost
+    - the pages of a part without a result count are probed one by one
+
+    """
+
+    def setUp(self):
+        self.max_results = ml_brasil.parse.MAX_RESULTS
+
+    def tearDown(self):
+        ml_brasil.parse.MAX_RESULTS = self.max_results
+
+    @staticmethod
+    def fetch(prices):
+        """Return a fetch for a search of products with these prices."""
+        def fetch(index, low, high):
+            count = sum(low <= price <= high for price in prices)
+            return f'<div class="quantity-results"> {count} resultados</div>'
+        return fetch
+
+    def test_plan(self):
+        """Test that each shard fits, and that they cover the range."""
+        ml_brasil.parse.MAX_RESULTS = 10
+        fetch = self.fetch(range(100))
+        shards = ml_brasil.parse._plan_shards(fetch, fetch(1, 0, 99), 0, 99,
+                                              workers=4)
+        self.assertEqual(shards[0][0], 0)
+        self.assertEqual(shards[-1][1], 99)
+        for (_, high, *_), (low, *_) in zip(shards, shards[1:]):
+            self.assertEqual(high, low)
+        self.assertTrue(all(count <= 10 for *_, count in shards))
+
+    def test_unsplittable_range(self):
+        """Test that a range of a single real is kept as it is."""
+        ml_brasil.parse.MAX_RESULTS = 10
+        fetch = self.fetch([5] * 20)
+        shards = ml_brasil.parse._plan_shards(fetch, fetch(1, 0, 10), 0, 10)
+        self.assertEqual([shard[:2] for shard in shards if shard[3]],
+                         [(4, 5), (5, 6)])
+
+    def test_sharded_search(self):
+        """Test that sharding finds the results a single search loses."""
+        ml_brasil.parse.MAX_RESULTS = 200
+        with ml_brasil.simulator.Simulator(results=600,
+                                           max_depth=200) as simulator:
+            transport = simulator.transport()
+            products = ml_brasil.ML_query("mesa", min_rep=0, order=0,
+                                          aggressiveness=10,
+                                          transport=transport)
+            self.assertEqual(len(products), 200)
+            products = ml_brasil.ML_query("mesa", min_rep=0, workers=4,
+                                          aggressiveness=10, shard=True,
+                                          transport=transport)
+            self.assertEqual(sorted(products.ids()), sorted(
+                product["item_id"]
+                for product in simulator.catalogue("mesa")))
+
+    def test_shard_without_count(self):
+        """Test that a part without a result count is fully paginated."""
+        ml_brasil.parse.MAX_RESULTS = 10
+        prices = range(40)
+
+        def fetch(index, low, high):
+            found = [price for price in prices if low <= price <= high]
+            if index > 1 and index > len(found):
+                return None
+            page = " ".join(f"[{price}]" for price in found[index - 1:
+                                                           index + 4])
+            if low >= 20:  # these pages don't tell how many results
+                return page
+            return (f'<div class="quantity-results"> {len(found)} '
+                    f'resultados</div>{page}')
+
+        pages = ml_brasil.parse._iter_shards(fetch, fetch(1, 0, 39), 0, 39,
+                                             workers=2, step=5)
+        found = {int(price) for page in pages
+                 for price in findall(r"\[(\d+)\]", page)}
+        self.assertEqual(found, set(prices))
+
+
+class TestLimit(unittest.TestCase):
+    """Test the searches limited to their first reputable results.
+
+    What is tested
+    --------------
+    - the search url asks MercadoLivre for the order of the prices
+    - the cheapest, or most expensive, reputable results are returned
+    - only the first page, and few product pages, are requested
+    - a limit can't be combined with shard, nor without dedupe
+    - iter_reputable checks only the products it needs
+
+    """
+
+    def test_search_url(self):
+        """Test that the order is a filter of the search url."""
+        url = ml_brasil.parse._search_url("lista", "", "mesa", 1, 0, 100, 0,
+                                          order=1)
+        self.assertTrue(url.endswith("_OrderId_PRICE"))
+        url = ml_brasil.parse._search_url("lista", "", "mesa", 1, 0, 100, 0,
+                                          order=2)
+        self.assertTrue(url.endswith("_OrderId_PRICE*DESC"))
+
+    def test_limit(self):
+        """Test that the first reputable results are found cheaply."""
+        with ml_brasil.simulator.Simulator(results=500) as simulator:
+            transport = simulator.transport()
+            cheapest = ml_brasil.ML_query("mesa", limit=20,
+                                          aggressiveness=10, workers=4,
+                                          transport=transport)
+            requests = simulator.requests.copy()
+            dearest = ml_brasil.ML_query("mesa", order=2, limit=5,
+                                         aggressiveness=10,
+                                         transport=transport)
+            everything = ml_brasil.ML_query("mesa", aggressiveness=10,
+                                            workers=4, transport=transport)
+        reputable = [product.item_id for product in everything
+                     if product.reputable]
+        self.assertEqual(cheapest.ids(), reputable[:20])
+        self.assertEqual(dearest.ids(), reputable[::-1][:5])
+        self.assertEqual(requests["search"], 1)
+        self.assertLess(requests["product"], 100)
+
+    def test_limit_conflicts(self):
+        """Test that a limit is refused with shard or without dedupe."""
+        for settings in ({"shard": True}, {"dedupe": False}):
+            with self.assertRaises(ValueError):
+                ml_brasil.ML_query("mesa", limit=5, **settings)
+
+    def test_iter_reputable(self):
+        """Test that the products are checked only as they are taken."""
+        checked = []
+
+        class Listing:
+            def __init__(self, number):
+                self.number = number
+
+            @property
+            def reputable(self):
+                checked.append(self.number)
+                return self.number % 2 == 0
+
+        found = ml_brasil.parse.iter_reputable(map(Listing, range(100)))
+        self.assertEqual([listing.number for listing in islice(found, 3)],
+                         [0, 2, 4])
+        self.assertEqual(checked, [0, 1, 2, 3, 4])
+
+
+class TestRanked(unittest.TestCase):
+    """Test the lazy checks of the reputation of ranked products.
+
+    What is tested
+    --------------
+    - iter_reputable checks the products in the order of their keys
+    - the products with equal keys keep their order
+    - iter_reputable yields every checked product if asked to
+    - ML_query_iter with an order yields every product by price, checked
+    - taking the first few of them checks few products
+    - the products whose price couldn't be read come last
+    - unprocessed products are all yielded by price, unchecked
+
+    """
+
+    class Listing:
+        """A product whose reputation check is recorded."""
+
+        def __init__(self, number, checked):
+            self.number = number
+            self.checked = checked
+
+        @property
+        def reputable(self):
+            self.checked.append(self.number)
+            return self.number % 3 != 0
+
+    def test_key(self):
+        """Test that the products are checked in the order of the key."""
+        checked = []
+        listings = [self.Listing(number, checked)
+                    for number in (9, 4, 7, 1, 3, 8, 2, 5)]
+        found = ml_brasil.parse.iter_reputable(
+            listings, key=lambda listing: listing.number)
+        self.assertEqual([listing.number for listing in islice(found, 3)],
+                         [1, 2, 4])
+        self.assertEqual(checked, [1, 2, 3, 4])
+
+    def test_every(self):
+        """Test that every product is yielded once checked if asked to."""
+        checked = []
+        listings = [self.Listing(number, checked)
+                    for number in (9, 4, 7, 1, 3, 8, 2, 5)]
+        found = ml_brasil.parse.iter_reputable(
+            listings, key=lambda listing: listing.number, every=True)
+        self.assertEqual([listing.number for listing in islice(found, 3)],
+                         [1, 2, 3])
+        self.assertEqual(checked, [1, 2, 3])
+
+    def test_ties(self):
+        """Test that products with equal keys keep their order."""
+        listings = [self.Listing(number, []) for number in (1, 2, 4, 5)]
+        found = ml_brasil.parse.iter_reputable(listings, workers=2,
+                                               key=lambda listing: 0)
+        self.assertEqual(list(found), listings)
+
+    def test_price_key(self):
+        """Test that the products without a price come last."""
+        class Priced:
+            def __init__(self, price):
+                self.price = price
+
+        products = [Priced(price) for price in
+                    ((10, 50), (float('nan'), float('nan')), (10, 5),
+                     (300, 0))]
+        for order, expected in ((1, [2, 0, 3, 1]), (2, [3, 0, 2, 1])):
+            ranked = sorted(products,
+                            key=ml_brasil.search._price_key(order))
+            self.assertEqual([products.index(product) for product in ranked],
+                             expected)
+
+    def test_query_iter(self):
+        """Test that the first products by price cost few checks."""
+        with ml_brasil.simulator.Simulator(results=300) as simulator:
+            transport = simulator.transport()
+            ranked = ml_brasil.ML_query_iter("mesa", aggressiveness=10,
+                                             workers=2, transport=transport,
+                                             order=1)
+            first = list(islice(ranked, 10))
+            ranked.close()
+            checks = simulator.requests["product"]
+            everything = ml_brasil.ML_query("mesa", aggressiveness=10,
+                                            transport=transport)
+        ranked = sorted(everything, key=ml_brasil.search._price_key(1))
+        self.assertEqual([product.item_id for product in first],
+                         [product.item_id for product in ranked[:10]])
+        self.assertEqual([product.reputable for product in first],
+                         [product.reputable for product in ranked[:10]])
+        self.assertLess(checks, 40)
+
+    def test_query_iter_unprocessed(self):
+        """Test that unprocessed products are ranked without checks."""
+        with ml_brasil.simulator.Simulator(results=120) as simulator:
+            ranked = list(ml_brasil.ML_query_iter(
+                "mesa", aggressiveness=10, process=False, order=2,
+                transport=simulator.transport()))
+            self.assertEqual(simulator.requests["product"], 0)
+        prices = [product.price for product in ranked]
+        self.assertEqual(len(ranked), 120)
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+
+@unittest.skipIf(ml_brasil.resultset.numpy is None, "numpy isn't installed")
+class TestResultSet(unittest.TestCase):
+    """Test the columnar result sets.
+
+    What is tested
+    --------------
+    - the records of the products are kept, and read back, as they were
+    - prices are int64 cents, the unknown ones told apart
+    - the masks of price ranges and flags select the right products
+    - sorting by many keys, unknown prices last, keeps ties in order
+    - the sets are exported with nulls to pandas and Arrow
+
+    """
+
+    RECORDS = [ml_brasil.parse.ProductRecord(
+        f"https://produto.mercadolivre.com.br/MLB-{number}-mesa-_JM",
+        f"Mesa {name}", cents, number % 2 == 0, number % 3 == 0, False,
+        f"https://http2.mlstatic.com/D_{number}-V.webp", reputable,
+        f"MLB{number}")
+        for number, name, cents, reputable in (
+            (1, "b", 15000, True), (2, "a", 9999, False), (3, "c", None, True),
+            (4, "a", 15000, None), (5, "d", 250050, True))]
+
+    def setUp(self):
+        self.results = ml_brasil.resultset.ResultSet.from_products(
+            self.RECORDS)
+
+    def test_records(self):
+        """Test that the products are read back as they were."""
+        self.assertEqual(len(self.results), 5)
+        self.assertEqual(list(self.results), self.RECORDS)
+        self.assertEqual(self.results[2], self.RECORDS[2])
+        self.assertEqual(self.results.price_cents.dtype.name, "int64")
+        self.assertEqual(self.results.priced.tolist(),
+                         [True, True, False, True, True])
+        self.assertEqual(self.results.checked.tolist(),
+                         [True, True, True, False, True])
+
+    def test_mask(self):
+        """Test that the masks select the products in range and flagged."""
+        results = self.results
+        self.assertEqual(results[results.mask(price_min=100)].item_id
+                         .tolist(), ["MLB1", "MLB4", "MLB5"])
+        self.assertEqual(results[results.mask(price_max=99)].item_id
+                         .tolist(), ["MLB2"])
+        self.assertEqual(results[results.mask(reputable=False)].item_id
+                         .tolist(), ["MLB2"])
+        self.assertEqual(results[results.mask(no_interest=True,
+                                              reputable=True)].item_id
+                         .tolist(), [])
+        with self.assertRaises(TypeError):
+            results.mask(sold=True)
+
+    def test_sort(self):
+        """Test that the sorts are by many keys, and stable."""
+        self.assertEqual(self.results.sort("price").item_id.tolist(),
+                         ["MLB2", "MLB1", "MLB4", "MLB5", "MLB3"])
+        self.assertEqual(self.results.sort("-price").item_id.tolist(),
+                         ["MLB5", "MLB1", "MLB4", "MLB2", "MLB3"])
+        self.assertEqual(self.results.sort("title", "-price").item_id
+                         .tolist(), ["MLB4", "MLB2", "MLB1", "MLB3", "MLB5"])
+        self.assertEqual(self.results.sort("-reputable", "price").item_id
+                         .tolist(), ["MLB1", "MLB5", "MLB3", "MLB2", "MLB4"])
+        with self.assertRaises(KeyError):
+            self.results.sort("seller")
+
+    @unittest.skipIf(importlib.util.find_spec("pandas") is None,
+                     "pandas isn't installed")
+    def test_to_pandas(self):
+        """Test that the export to pandas keeps the unknown values."""
+        frame = self.results.to_pandas()
+        self.assertEqual(list(frame.columns),
+                         list(ml_brasil.resultset.COLUMNS))
+        self.assertEqual(frame["price_cents"].isna().tolist(),
+                         [False, False, True, False, False])
+        self.assertEqual(frame["reputable"].isna().tolist(),
+                         [False, False, False, True, False])
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow") is None,
+                     "pyarrow isn't installed")
+    def test_to_arrow(self):
+        """Test that the export to Arrow keeps the unknown values."""
+        table = self.results.to_arrow()
+        self.assertEqual(table.column_names,
+                         list(ml_brasil.resultset.COLUMNS))
+        self.assertEqual(table.column("price_cents").to_pylist(),
+                         [15000, 9999, None, 15000, 250050])
+        self.assertEqual(table.column("reputable").null_count, 1)
+
+
+class TestOwnTransport(unittest.TestCase):
+    """Test that the searches close the Transport they create.
+
+    What is tested
+    --------------
+    - ML_query, ML_query_iter, a limited ML_query and ML_query_delta
+      close the Transport they created when they end
+    - a Transport given to a search is left open
+    - a Transport shared by many searches connects to each host once
+
+    """
+
+    def test_created_transport_closed(self):
+        """Test that every kind of search closes its own Transport."""
+        with ml_brasil.simulator.Simulator(results=60) as simulator:
+            created, closed = [], []
+
+            def new_transport(**kwargs):
+                transport = simulator.transport(**kwargs)
+                close = transport.close
+                transport.close = lambda: closed.append(close())
+                created.append(transport)
+                return transport
+
+            searches = (
+                lambda: ml_brasil.ML_query("mesa", aggressiveness=10),
+                lambda: list(ml_brasil.ML_query_iter("mesa",
+                                                     aggressiveness=10)),
+                lambda: ml_brasil.ML_query("mesa", limit=3,
+                                           aggressiveness=10),
+                lambda: ml_brasil.ML_query_delta("mesa", aggressiveness=10))
+            original = ml_brasil.search.Transport
+            ml_brasil.search.Transport = new_transport
+            try:
+                for number, search in enumerate(searches, 1):
+                    search()
+                    self.assertEqual((len(created), len(closed)),
+                                     (number, number))
+            finally:
+                ml_brasil.search.Transport = original
+
+    def test_given_transport_left_open(self):
+        """Test that a Transport given to a search isn't closed."""
+        with ml_brasil.simulator.Simulator(results=10) as simulator:
+            transport = simulator.transport()
+            closed = []
+            transport.close = lambda: closed.append(True)
+            ml_brasil.ML_query("mesa", aggressiveness=10,
+                               transport=transport)
+            self.assertEqual(closed, [])
+
+    def test_prewarmed_once(self):
+        """Test that the searches sharing a Transport prewarm it once."""
+        with ml_brasil.simulator.Simulator(results=10) as simulator:
+            with simulator.transport() as transport:
+                ml_brasil.ML_query_many(
+                    ["mesa", "cadeira", "sofa", "cama", "armario", "estante"],
+                    aggressiveness=10, transport=transport)
+            self.assertEqual(simulator.requests["head"],
+                             1 + len(ml_brasil.transport.PRODUCT_HOSTS))
+
+
 if __name__ == "__main__":
     unittest.main()